@@ -0,0 +1,79 @@
+# benchmarks/bench_anpr_xml.py
+"""
+Микро-бенчмарк извлечения полей из XML событий Hikvision.
+Сравнивает прежние реализации (ElementTree + find('.//...')) с services.anpr_xml.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_anpr_xml [-n 20000]
+"""
+import argparse
+import timeit
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from services.anpr_xml import extract_anpr_fields
+
+SAMPLES_DIR = Path(__file__).parent / "samples"
+
+
+def legacy_v4(xml_bytes: bytes) -> dict:
+    """Логика process_anpr_event до перехода на extract_anpr_fields."""
+    root = ET.fromstring(xml_bytes.decode('utf-8'))
+    namespaces = {'isapi': 'http://www.isapi.org/ver20/XMLSchema'}
+    plate_number = None
+    for path in ['.//isapi:ANPR/isapi:licensePlate', './/isapi:LPR/isapi:licensePlate',
+                 './/isapi:ANPR/isapi:plateNumber', './/isapi:LPR/isapi:plateNumber']:
+        element = root.find(path, namespaces)
+        if element is not None and element.text:
+            plate_number = element.text.strip()
+            break
+    result = {'license_plate': plate_number}
+    for key, tag in (('event_type', 'eventType'), ('ip_address', 'ipAddress'),
+                     ('date_time', 'dateTime'), ('channel_id', 'channelID')):
+        element = root.find(f'.//isapi:{tag}', namespaces)
+        result[key] = element.text.strip() if element is not None and element.text else None
+    return result
+
+
+def legacy_v5(xml_bytes: bytes) -> dict:
+    """Логика process_anpr_event_from_parts до перехода на extract_anpr_fields."""
+    xml_content = xml_bytes.decode('utf-8').replace('xmlns="http://www.hikvision.com/ver20/XMLSchema"', '') \
+        .replace('xmlns="http://www.std-cgi.com/ver20/XMLSchema"', '')
+    root = ET.fromstring(xml_content)
+    result = {}
+    for key, tag in (('event_type', 'eventType'), ('channel_name', 'channelName'), ('device_id', 'deviceId'),
+                     ('license_plate', 'licensePlate'), ('color', 'color'), ('country', 'country')):
+        element = root.find(f'.//{tag}')
+        result[key] = element.text if element is not None else None
+    return result
+
+
+CASES = [
+    ("anpr_v4.xml", legacy_v4),
+    ("anpr_v5.xml", legacy_v5),
+    ("vmd_v5.xml", legacy_v5),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--number", type=int, default=20000, help="итераций на замер")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="число замеров (берется лучший)")
+    args = parser.parse_args()
+
+    print(f"{'sample':<14}{'legacy, us':>12}{'fast, us':>12}{'speedup':>10}")
+    for file_name, legacy in CASES:
+        payload = (SAMPLES_DIR / file_name).read_bytes()
+        fast = extract_anpr_fields(payload)
+        # Проверяем, что быстрый путь возвращает те же значения, что и старый код
+        for key, value in legacy(payload).items():
+            if value is not None:
+                assert fast[key] == value.strip(), (file_name, key, fast[key], value)
+
+        legacy_us = min(timeit.repeat(lambda: legacy(payload), number=args.number, repeat=args.repeat)) / args.number * 1e6
+        fast_us = min(timeit.repeat(lambda: extract_anpr_fields(payload), number=args.number, repeat=args.repeat)) / args.number * 1e6
+        print(f"{file_name:<14}{legacy_us:>12.1f}{fast_us:>12.1f}{legacy_us / fast_us:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+# benchmarks/bench_ingest.py
+"""
+Нагрузочный бенчмарк приема событий: воспроизводит multipart-запросы камер Hikvision
+против /test (прошивка v4) и /firmware_v5 с заданной параллельностью.
+
+Сервис запускается отдельным процессом через serve.py во временном каталоге,
+SmartParking заменяется локальной заглушкой с настраиваемой задержкой ответа.
+Для каждого эндпоинта выводятся пропускная способность, p50/p95/p99 задержки
+ответа камере, пиковый RSS процессов сервиса и сколько событий дошло до заглушки.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_ingest [-c 32] [-n 2000] [--workers 2] [--backend-latency 0.2]
+    python -m benchmarks.bench_ingest --batch multipart   # пакетная доставка, сравнить "bk req"
+
+Записанный трафик: --payload-dir DIR, где DIR/test/*.multipart и DIR/firmware_v5/*.multipart -
+сырые тела запросов (первая строка - разделитель --boundary). Без него запросы собираются
+из benchmarks/samples и синтетических JPEG размером --image-kb.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SAMPLES_DIR = Path(__file__).parent / "samples"
+
+ENDPOINTS = ("test", "firmware_v5")
+SAMPLE_XML = {"test": "anpr_v4.xml", "firmware_v5": "anpr_v5.xml"}
+
+_BATCH_PATH = "/parking/data_process_batch/"
+_PLATE_RE = re.compile(rb'(<licensePlate>)[^<]*(</licensePlate>)')
+
+
+# --- Заглушка SmartParking ---
+
+class StubSmartParking:
+    """
+    Минимальный HTTP/1.1 сервер на asyncio с keep-alive: отвечает 200 на любой POST
+    после задержки latency (+ равномерный джиттер), считает принятые события и запросы.
+    Пакетный запрос (SMART_PARKING_BATCH_ENABLED) засчитывается как число событий в нем.
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, status: int = 200):
+        self.latency = latency
+        self.jitter = jitter
+        self.status = status
+        self.received = 0
+        self.requests = 0
+        self.port: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = head.decode("latin-1").lower()
+                match = re.search(r"content-length:\s*(\d+)", headers)
+                body = await reader.readexactly(int(match.group(1))) if match else b""
+                if self.latency or self.jitter:
+                    await asyncio.sleep(self.latency + self.jitter * (uuid.uuid4().int % 1000) / 1000)
+                self.requests += 1
+                # У каждого события в пакете (multipart и ndjson) есть поле "recognize"
+                self.received += body.count(b'"recognize"') if _BATCH_PATH in headers else 1
+                body = b'{"ok":true}'
+                writer.write(b"HTTP/1.1 %d OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+                             % (self.status, len(body), body))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass  # keep-alive соединение отменено при остановке цикла
+        finally:
+            writer.close()
+
+
+# --- Запросы ---
+
+class Payload:
+    """Тело multipart-запроса, разрезанное вокруг номера, чтобы каждый запрос нес уникальный номер."""
+    def __init__(self, endpoint: str, body: bytes, content_type: str):
+        self.endpoint = endpoint
+        self.content_type = content_type
+        match = _PLATE_RE.search(body)
+        if match:
+            self._prefix, self._suffix = body[:match.end(1)], body[match.start(2):]
+        else:
+            self._prefix, self._suffix = body, None
+
+    def body(self, seq: int) -> bytes:
+        # Иначе дедупликация подавит все запросы, кроме первого
+        if self._suffix is None:
+            return self._prefix
+        return self._prefix + b"B%07d" % seq + self._suffix
+
+
+def build_multipart(parts: List[Tuple[str, str, bytes]]) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for name, content_type, data in parts:
+        chunks.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + data + b"\r\n"
+        )
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return b"".join(chunks), f"multipart/form-data; boundary={boundary}"
+
+
+def synthetic_jpeg(size: int) -> bytes:
+    return b"\xff\xd8\xff\xe0" + os.urandom(max(size - 6, 0)) + b"\xff\xd9"
+
+
+def sample_payloads(image_kb: int) -> Dict[str, List[Payload]]:
+    payloads = {}
+    for endpoint in ENDPOINTS:
+        xml = (SAMPLES_DIR / SAMPLE_XML[endpoint]).read_bytes()
+        body, content_type = build_multipart([
+            ("anpr.xml", "text/xml", xml),
+            ("licensePlatePicture.jpg", "image/jpeg", synthetic_jpeg(image_kb * 1024 // 10)),
+            ("detectionPicture.jpg", "image/jpeg", synthetic_jpeg(image_kb * 1024)),
+        ])
+        payloads[endpoint] = [Payload(endpoint, body, content_type)]
+    return payloads
+
+
+def recorded_payloads(payload_dir: Path) -> Dict[str, List[Payload]]:
+    payloads = {}
+    for endpoint in ENDPOINTS:
+        items = []
+        for path in sorted((payload_dir / endpoint).glob("*.multipart")):
+            body = path.read_bytes()
+            boundary = body.split(b"\r\n", 1)[0][2:].decode()
+            items.append(Payload(endpoint, body, f"multipart/form-data; boundary={boundary}"))
+        if items:
+            payloads[endpoint] = items
+    return payloads
+
+
+# --- Процесс сервиса ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_tree_rss(pid: int) -> int:
+    """Суммарный RSS процесса и его потомков (воркеров uvicorn) в байтах, по /proc."""
+    children: Dict[int, List[int]] = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            for line in Path(f"/proc/{current}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+        except OSError:
+            pass
+        stack.extend(children.get(current, ()))
+    return total
+
+
+async def wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"service exited with code {process.returncode}")
+            try:
+                if (await client.get(f"{base_url}/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("service did not become ready")
+
+
+# --- Нагрузка ---
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def run_load(base_url: str, payloads: List[Payload], total: int, concurrency: int,
+                   seq_start: int, pid: int) -> dict:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    peak_rss = 0
+    counter = iter(range(total))
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, process_tree_rss(pid))
+            await asyncio.sleep(0.25)
+
+    async def worker(client: httpx.AsyncClient):
+        for i in counter:
+            payload = payloads[i % len(payloads)]
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"{base_url}/{payload.endpoint}",
+                    content=payload.body(seq_start + i),
+                    headers={"Content-Type": payload.content_type},
+                )
+                key = str(response.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "statuses": statuses,
+        "elapsed_s": elapsed,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "peak_rss_mb": max(peak_rss, process_tree_rss(pid)) / 2**20,
+    }
+
+
+async def wait_drain(stub: StubSmartParking, expected: int, timeout: float) -> float:
+    """Ждет, пока outbox-воркеры доставят expected событий в заглушку. Возвращает время ожидания."""
+    started = time.perf_counter()
+    while stub.received < expected and time.perf_counter() - started < timeout:
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+async def bench(args) -> List[dict]:
+    payloads = recorded_payloads(Path(args.payload_dir)) if args.payload_dir else sample_payloads(args.image_kb)
+    endpoints = [e for e in args.endpoints.split(",") if e in payloads]
+    if not endpoints:
+        raise SystemExit("no payloads for the selected endpoints")
+
+    stub = StubSmartParking(args.backend_latency, args.backend_jitter)
+    await stub.start()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-ingest-"))
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    # Все "камеры" бенчмарка идут с 127.0.0.1: лимит частоты на камеру выключен
+    env = dict(os.environ, SMART_PARKING_URL=stub.url, PYTHONPATH=str(REPO_ROOT), ADMISSION_CAMERA_RATE="0",
+               ADMISSION_MAX_IN_FLIGHT=str(args.max_in_flight))
+    if args.batch != "off":
+        env.update(SMART_PARKING_BATCH_ENABLED="true", SMART_PARKING_BATCH_FORMAT=args.batch,
+                   SMART_PARKING_BATCH_PATH=_BATCH_PATH, SMART_PARKING_BATCH_WINDOW=str(args.batch_window),
+                   SMART_PARKING_BATCH_MAX_EVENTS=str(args.batch_max_events))
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    process = subprocess.Popen(
+        [sys.executable, str(REPO_ROOT / "serve.py"), "--app", args.app, "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(args.workers)],
+        cwd=workdir, env=env,
+        stdout=subprocess.DEVNULL if not args.verbose else None,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    results = []
+    try:
+        await wait_ready(base_url, process)
+        seq = 0
+        for endpoint in endpoints:
+            if args.warmup:
+                warmup = await run_load(base_url, payloads[endpoint], args.warmup, args.concurrency, seq, process.pid)
+                seq += args.warmup
+                await wait_drain(stub, stub.received + warmup["statuses"].get("200", 0), args.drain_timeout)
+            received_before, requests_before = stub.received, stub.requests
+            result = await run_load(base_url, payloads[endpoint], args.requests, args.concurrency, seq, process.pid)
+            seq += args.requests
+            result["drain_s"] = await wait_drain(stub, received_before + result["statuses"].get("200", 0),
+                                                 args.drain_timeout)
+            result["delivered"] = stub.received - received_before
+            result["backend_requests"] = stub.requests - requests_before
+            result["endpoint"] = f"/{endpoint}"
+            results.append(result)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        await stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="одновременных камер-клиентов")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="запросов на эндпоинт")
+    parser.add_argument("--warmup", type=int, default=100, help="запросов на прогрев (не учитываются)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="через запятую: test,firmware_v5")
+    parser.add_argument("--app", default="manage:app", help="ASGI-приложение для serve.py")
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--backend-latency", type=float, default=0.05, help="задержка заглушки SmartParking, с")
+    parser.add_argument("--backend-jitter", type=float, default=0.0, help="дополнительная случайная задержка, с")
+    parser.add_argument("--image-kb", type=int, default=200, help="размер синтетического detectionPicture.jpg")
+    parser.add_argument("--batch", choices=("off", "multipart", "ndjson"), default="off",
+                        help="пакетная доставка в SmartParking (SMART_PARKING_BATCH_FORMAT)")
+    parser.add_argument("--batch-window", type=float, default=0.2, help="окно накопления пакета, с")
+    parser.add_argument("--batch-max-events", type=int, default=50, help="максимум событий в пакете")
+    parser.add_argument("--max-in-flight", type=int, default=64,
+                        help="ADMISSION_MAX_IN_FLIGHT сервиса; сверх лимита запросы получают 503 (0 - без лимита)")
+    parser.add_argument("--payload-dir", help="каталог с записанными запросами (DIR/test, DIR/firmware_v5)")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="сколько ждать доставки в заглушку, с")
+    parser.add_argument("--json", action="store_true", help="вывести результаты в JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="не скрывать вывод сервиса")
+    args = parser.parse_args()
+
+    results = asyncio.run(bench(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'endpoint':<14}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'RSS MB':>9}{'deliv':>8}{'bk req':>8}{'drain s':>9}  statuses")
+    for r in results:
+        print(f"{r['endpoint']:<14}{r['throughput_rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['peak_rss_mb']:>9.1f}{r['delivered']:>8}{r['backend_requests']:>8}{r['drain_s']:>9.2f}  {r['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# benchmarks/bench_startup.py
+"""
+Бюджет времени старта сервиса: import manage, lifespan (старт ресурсов) и первый запрос.
+
+Каждый прогон - новый процесс Python в пустом временном каталоге, поэтому модули
+импортируются "холодными", как при запуске воркера uvicorn. Отсутствие побочных
+эффектов импорта (файлы, потоки) проверяет tests/test_startup.py.
+Камеры, шлагбаумы и alertStream отключены, SmartParking не нужен (событие остается в outbox).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_startup [-n 5] [--import-budget-ms 1500] [--first-request-budget-ms 300]
+
+Код выхода 1, если медиана превысила бюджет.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_ingest import REPO_ROOT, SAMPLES_DIR, build_multipart, synthetic_jpeg
+
+# Выполняется в дочернем процессе; печатает одну строку JSON
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import manage
+import_s = time.perf_counter() - started
+
+from fastapi.testclient import TestClient
+body = open(sys.argv[1], 'rb').read()
+started = time.perf_counter()
+with TestClient(manage.app) as client:
+    startup_s = time.perf_counter() - started
+    started = time.perf_counter()
+    response = client.post('/firmware_v5', content=body, headers={'content-type': sys.argv[2]})
+    first_request_s = time.perf_counter() - started
+print(json.dumps({'import_s': import_s, 'startup_s': startup_s, 'first_request_s': first_request_s,
+                  'status': response.status_code}))
+"""
+
+
+def run_once(body_path: Path, content_type: str, verbose: bool) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="bench-startup-"))
+    env = dict(
+        os.environ, PYTHONPATH=str(REPO_ROOT), LOG_LEVEL="WARNING",
+        DOTENV_PATH=str(workdir / ".env"), CAMERA_REGISTRY_PATH=str(workdir / "cameras.json"),
+        CAMERA_EXIT2_IP="", ALERT_STREAM_CAMERAS="", BARRIER_CAMERAS="", ACCESS_RULES_ENABLED="false",
+        SMART_PARKING_URL="http://127.0.0.1:9",
+    )
+    for name in ("CAMERA_171", "CAMERA_172", "CAMERA_ENTRY_IP", "CAMERA_ENTRY2_IP", "CAMERA_EXIT_IP",
+                 "PROMETHEUS_MULTIPROC_DIR"):
+        env.pop(name, None)
+    started = time.perf_counter()
+    try:
+        output = subprocess.run(
+            [sys.executable, "-c", _CHILD, str(body_path), content_type],
+            cwd=workdir, env=env, check=True, capture_output=True, text=True,
+        )
+    except subprocess.CalledProcessError as e:
+        raise SystemExit(f"service failed to start:\n{e.stderr}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if verbose:
+        print(output.stderr, file=sys.stderr)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - started
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--runs", type=int, default=5, help="число прогонов (берется медиана)")
+    parser.add_argument("--import-budget-ms", type=float, default=1500)
+    parser.add_argument("--startup-budget-ms", type=float, default=1000)
+    parser.add_argument("--first-request-budget-ms", type=float, default=300)
+    parser.add_argument("--json", action="store_true", help="вывести результаты в JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="не скрывать вывод сервиса")
+    args = parser.parse_args()
+
+    body, content_type = build_multipart([
+        ("anpr.xml", "text/xml", (SAMPLES_DIR / "anpr_v5.xml").read_bytes()),
+        ("detectionPicture.jpg", "image/jpeg", synthetic_jpeg(200 * 1024)),
+    ])
+    with tempfile.NamedTemporaryFile(suffix=".multipart", delete=False) as f:
+        f.write(body)
+    try:
+        runs = [run_once(Path(f.name), content_type, args.verbose) for _ in range(args.runs)]
+    finally:
+        os.unlink(f.name)
+
+    budgets = {"import_s": args.import_budget_ms, "startup_s": args.startup_budget_ms,
+               "first_request_s": args.first_request_budget_ms, "process_s": None}
+    summary = {key: round(statistics.median(r[key] for r in runs) * 1000, 1) for key in budgets}
+    failures = [f"{key} {summary[key]} ms > {budget} ms" for key, budget in budgets.items()
+                if budget is not None and summary[key] > budget]
+    for r in runs:
+        if r["status"] != 200:
+            failures.append(f"first request returned {r['status']}")
+    failures = list(dict.fromkeys(failures))
+
+    if args.json:
+        print(json.dumps({"median_ms": summary, "runs": runs, "failures": failures}, indent=2))
+    else:
+        for key, budget in budgets.items():
+            print(f"{key[:-2]:<16}{summary[key]:>9.1f} ms" + (f"   budget {budget:.0f} ms" if budget else ""))
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
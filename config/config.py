@@ -1,20 +1,211 @@
 import os
-from dotenv import load_dotenv
+from pathlib import Path
+from typing import Optional
 
-# Load environment variables from .env
-load_dotenv()
+from dotenv import dotenv_values
 
+# Значения из .env в корне репозитория (DOTENV_PATH - другой файл). Файл только читается:
+# os.environ при импорте не меняется, переменные окружения процесса важнее .env.
+_DOTENV = dotenv_values(os.environ.get("DOTENV_PATH", Path(__file__).resolve().parent.parent / ".env"))
 
 
-SMART_PARKING_URL = os.getenv(
+def getenv(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Как os.getenv, но с учетом .env."""
+    value = os.environ.get(name)
+    if value is None:
+        value = _DOTENV.get(name)
+    return default if value is None else value
+
+
+
+SMART_PARKING_URL = getenv(
     "SMART_PARKING_URL",
     "http://192.168.80.112:8833",
 )
 
 
-CAMERA_171 = os.getenv(
+CAMERA_171 = getenv(
     "CAMERA_171",
 )
-CAMERA_172 = os.getenv(
+CAMERA_172 = getenv(
     "CAMERA_172",
-)
\ No newline at end of file
+)
+CAMERA_ENTRY_IP = getenv("CAMERA_ENTRY_IP")
+CAMERA_ENTRY2_IP = getenv("CAMERA_ENTRY2_IP")
+CAMERA_EXIT_IP = getenv("CAMERA_EXIT_IP")
+CAMERA_EXIT2_IP = getenv("CAMERA_EXIT2_IP", "192.168.80.173")
+# Шлагбаум выезда без файла реестра: только если адрес Exit задан явно, а не взят по умолчанию
+CAMERA_EXIT2_BARRIER = getenv("CAMERA_EXIT2_IP") is not None
+
+# --- Реестр камер (services/camera_registry.py) ---
+# JSON: камеры с именем, направлением, IP/каналом/deviceID/MAC, профилем прошивки и учетными данными.
+# Без файла реестр собирается из CAMERA_171 / CAMERA_172 / CAMERA_ENTRY_IP / CAMERA_EXIT_IP.
+CAMERA_REGISTRY_PATH = getenv("CAMERA_REGISTRY_PATH", "./config/cameras.json")
+# Как часто проверять изменение файла реестра, секунд (0 - не перечитывать)
+CAMERA_REGISTRY_RELOAD_INTERVAL = float(getenv("CAMERA_REGISTRY_RELOAD_INTERVAL", "5"))
+# Учетные данные ISAPI по умолчанию (alertStream, шлагбаумы), если в реестре не заданы свои
+CAMERA_DEFAULT_USERNAME = getenv("CAMERA_USERNAME", "admin")
+CAMERA_DEFAULT_PASSWORD = getenv("CAMERA_PASSWORD", "user12345")
+
+# --- Клиент SmartParking ---
+SMART_PARKING_TIMEOUT = float(getenv("SMART_PARKING_TIMEOUT", "10"))
+SMART_PARKING_CONNECT_TIMEOUT = float(getenv("SMART_PARKING_CONNECT_TIMEOUT", "3"))
+SMART_PARKING_MAX_CONNECTIONS = int(getenv("SMART_PARKING_MAX_CONNECTIONS", "20"))
+SMART_PARKING_MAX_KEEPALIVE = int(getenv("SMART_PARKING_MAX_KEEPALIVE", "10"))
+# Одновременные запросы к бэкенду: лимит подстраивается (AIMD) между MIN и MAX
+SMART_PARKING_MAX_CONCURRENCY = int(getenv("SMART_PARKING_MAX_CONCURRENCY", "10"))
+SMART_PARKING_MIN_CONCURRENCY = int(getenv("SMART_PARKING_MIN_CONCURRENCY", "1"))
+SMART_PARKING_INITIAL_CONCURRENCY = int(getenv("SMART_PARKING_INITIAL_CONCURRENCY", "4"))
+# Ответ медленнее этого (секунд) считается признаком перегрузки бэкенда и уменьшает лимит
+SMART_PARKING_LATENCY_TARGET = float(getenv("SMART_PARKING_LATENCY_TARGET", "2"))
+# Circuit breaker: после стольких ошибок подряд запросы не отправляются RECOVERY секунд,
+# события ждут в outbox; затем HALF_OPEN_CALLS пробных запросов
+SMART_PARKING_BREAKER_FAILURES = int(getenv("SMART_PARKING_BREAKER_FAILURES", "5"))
+SMART_PARKING_BREAKER_RECOVERY = float(getenv("SMART_PARKING_BREAKER_RECOVERY", "15"))
+SMART_PARKING_BREAKER_HALF_OPEN_CALLS = int(getenv("SMART_PARKING_BREAKER_HALF_OPEN_CALLS", "1"))
+# Пакетная доставка: события outbox уходят одним запросом на SMART_PARKING_BATCH_PATH.
+# Выключено - каждое событие отдельным POST на /parking/data_process/
+SMART_PARKING_BATCH_ENABLED = getenv("SMART_PARKING_BATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+SMART_PARKING_BATCH_PATH = getenv("SMART_PARKING_BATCH_PATH", "/parking/data_process_batch/")
+# multipart - JSON-список событий + файлы photo_N; ndjson - строка JSON на событие, фото в base64
+SMART_PARKING_BATCH_FORMAT = getenv("SMART_PARKING_BATCH_FORMAT", "multipart")
+SMART_PARKING_BATCH_MAX_EVENTS = int(getenv("SMART_PARKING_BATCH_MAX_EVENTS", "50"))
+# Сколько ждать новых событий перед отправкой неполного пакета, секунд
+SMART_PARKING_BATCH_WINDOW = float(getenv("SMART_PARKING_BATCH_WINDOW", "0.2"))
+
+
+# --- Outbox (очередь доставки в SmartParking) ---
+OUTBOX_PATH = getenv("OUTBOX_PATH", "./outbox/outbox.db")
+OUTBOX_BATCH_SIZE = int(getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_BASE = float(getenv("OUTBOX_BACKOFF_BASE", "1"))
+OUTBOX_BACKOFF_MAX = float(getenv("OUTBOX_BACKOFF_MAX", "300"))
+OUTBOX_POLL_INTERVAL = float(getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_LEASE_SECONDS = float(getenv("OUTBOX_LEASE_SECONDS", "60"))
+# Сколько секунд событие доставляет только принявший его процесс (у него изображение в памяти),
+# после этого его может забрать любой воркер (например, если исходный процесс умер)
+OUTBOX_OWNER_GRACE_SECONDS = float(getenv("OUTBOX_OWNER_GRACE_SECONDS", "30"))
+
+
+# --- Запись изображений на диск ---
+IMAGE_WRITER_THREADS = int(getenv("IMAGE_WRITER_THREADS", "4"))
+# none | file | full (см. services/image_store.py)
+IMAGE_FSYNC_POLICY = getenv("IMAGE_FSYNC_POLICY", "none")
+# Архив изображений: {IMAGE_ARCHIVE_PATH}/{дата}/{час}/{камера}/{event_id}.jpg + index.db
+IMAGE_ARCHIVE_PATH = getenv("IMAGE_ARCHIVE_PATH", "./event_images")
+# Retention: 0 отключает соответствующее ограничение
+IMAGE_RETENTION_MAX_AGE_DAYS = float(getenv("IMAGE_RETENTION_MAX_AGE_DAYS", "30"))
+IMAGE_RETENTION_MAX_BYTES = int(getenv("IMAGE_RETENTION_MAX_BYTES", str(20 * 1024 ** 3)))
+IMAGE_RETENTION_INTERVAL = float(getenv("IMAGE_RETENTION_INTERVAL", "600"))
+# Архивирование изображений на диск. Отправка в SmartParking идет из памяти,
+# архив пишется асинхронно и нужен только для повторной доставки после рестарта.
+IMAGE_ARCHIVE_ENABLED = getenv("IMAGE_ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Сколько байт изображений держать в памяти для еще не доставленных событий
+IMAGE_MEMORY_CACHE_BYTES = int(getenv("IMAGE_MEMORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+
+# --- Production-запуск (serve.py) ---
+SERVER_HOST = getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(getenv("SERVER_PORT", "8786"))
+SERVER_WORKERS = int(getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+SERVER_GRACEFUL_TIMEOUT = int(getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+SERVER_MAX_REQUESTS = int(getenv("SERVER_MAX_REQUESTS", "0"))
+
+
+# --- Подавление повторных чтений номера ---
+DEDUP_ENABLED = getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# memory - окно в памяти процесса; sqlite - общее для всех воркеров (DEDUP_PATH).
+# serve.py с несколькими воркерами по умолчанию выбирает sqlite, а memory не запускает
+DEDUP_BACKEND = getenv("DEDUP_BACKEND", "memory")
+DEDUP_WINDOW_SECONDS = float(getenv("DEDUP_WINDOW_SECONDS", "10"))
+DEDUP_MAX_ENTRIES = int(getenv("DEDUP_MAX_ENTRIES", "10000"))
+DEDUP_PATH = getenv("DEDUP_PATH", "./outbox/dedup.db")
+
+
+# --- Pull-режим: alertStream камер (services/alert_stream.py) ---
+# Адреса камер через запятую: IP, user:password@IP или полный URL alertStream.
+# Пусто - камеры с "alert_stream": true из реестра камер; если и их нет, pull-режим выключен
+ALERT_STREAM_CAMERAS = [h.strip() for h in getenv("ALERT_STREAM_CAMERAS", "").split(",") if h.strip()]
+ALERT_STREAM_MAX_PART_BYTES = int(getenv("ALERT_STREAM_MAX_PART_BYTES", str(4 * 1024 * 1024)))
+# Камера шлет heartbeat каждые несколько секунд; тишина дольше этого - обрыв и переподключение
+ALERT_STREAM_IDLE_TIMEOUT = float(getenv("ALERT_STREAM_IDLE_TIMEOUT", "60"))
+ALERT_STREAM_BACKOFF_BASE = float(getenv("ALERT_STREAM_BACKOFF_BASE", "1"))
+ALERT_STREAM_BACKOFF_MAX = float(getenv("ALERT_STREAM_BACKOFF_MAX", "60"))
+# Подключения к камерам при старте размазываются по этому интервалу, секунд
+ALERT_STREAM_STARTUP_SPREAD = float(getenv("ALERT_STREAM_STARTUP_SPREAD", "5"))
+# Потоки держит только один воркер uvicorn - тот, кто захватил этот lock-файл
+ALERT_STREAM_LOCK_PATH = getenv("ALERT_STREAM_LOCK_PATH", "./outbox/alert_stream.lock")
+
+
+# --- Управление шлагбаумами (services/barrier.py) ---
+def _parse_pairs(value: str) -> dict:
+    """'Entry=192.168.80.171,Exit=192.168.80.173' -> {'Entry': '192.168.80.171', ...}"""
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {name.strip(): host.strip() for name, host in pairs if name.strip() and host.strip()}
+
+
+# Явный список "имя=IP" для шлагбаумов. Пусто - камеры с "barrier": true из реестра камер.
+BARRIER_CAMERAS = _parse_pairs(getenv("BARRIER_CAMERAS", ""))
+# softInput - /ISAPI/System/IO/softInputs/trigger; ioOutput - /ISAPI/System/IO/outputs/{id}/trigger
+BARRIER_TRIGGER_MODE = getenv("BARRIER_TRIGGER_MODE", "softInput")
+BARRIER_IO_ID = int(getenv("BARRIER_IO_ID", "1"))
+BARRIER_TIMEOUT = float(getenv("BARRIER_TIMEOUT", "5"))
+# Как часто обновлять соединения с камерами, чтобы они не закрылись по простою, секунд
+BARRIER_KEEPALIVE_INTERVAL = float(getenv("BARRIER_KEEPALIVE_INTERVAL", "20"))
+# Общий секрет для POST /barrier/{camera}/open (заголовок X-Barrier-Token). Пусто - ручное открытие выключено
+BARRIER_API_TOKEN = getenv("BARRIER_API_TOKEN", "")
+
+
+# --- Автооткрытие шлагбаума по списку разрешенных номеров (services/access_rules.py) ---
+ACCESS_RULES_ENABLED = getenv("ACCESS_RULES_ENABLED", "false").lower() in ("1", "true", "yes")
+# Путь на SmartParking, отдающий JSON-список номеров (строки или объекты с license_plate)
+ACCESS_LIST_PATH = getenv("ACCESS_LIST_PATH", "/parking/allow_list/")
+ACCESS_LIST_SYNC_INTERVAL = float(getenv("ACCESS_LIST_SYNC_INTERVAL", "60"))
+# Последний полученный список: шлагбаумы работают после рестарта и без SmartParking
+ACCESS_LIST_CACHE_PATH = getenv("ACCESS_LIST_CACHE_PATH", "./outbox/access_list.json")
+
+
+# --- Настройка камер (services/provisioning.py, scripts/provision.py) ---
+# Адрес сервиса, на который камеры шлют события (httpHosts). Пусто - обязателен --server-ip
+PROVISION_SERVER_IP = getenv("PROVISION_SERVER_IP", "")
+PROVISION_SERVER_PORT = int(getenv("PROVISION_SERVER_PORT", str(SERVER_PORT)))
+# Номер слота httpHosts на камере (у Hikvision обычно 1-3)
+PROVISION_HTTP_HOST_ID = getenv("PROVISION_HTTP_HOST_ID", "1")
+# detectionUpLoadPicturesType в блоке ANPR httpHosts; пусто - не трогать
+PROVISION_ANPR_PICTURES = getenv("PROVISION_ANPR_PICTURES", "all")
+# on | off - включить/выключить детекцию движения; пусто - не трогать
+PROVISION_MOTION_DETECTION = getenv("PROVISION_MOTION_DETECTION", "")
+# Сколько камер настраивается одновременно
+PROVISION_CONCURRENCY = int(getenv("PROVISION_CONCURRENCY", "10"))
+PROVISION_TIMEOUT = float(getenv("PROVISION_TIMEOUT", "15"))
+
+
+# --- Логирование (services/logging_setup.py) ---
+LOG_LEVEL = getenv("LOG_LEVEL", "INFO")
+# json - одна JSON-строка на запись; text - прежний формат "время - уровень - сообщение"
+LOG_FORMAT = getenv("LOG_FORMAT", "json")
+# Записи сверх этого числа в очереди отбрасываются, а не тормозят обработку событий
+LOG_QUEUE_SIZE = int(getenv("LOG_QUEUE_SIZE", "10000"))
+# Доля событий, для которых логируется полный XML и разобранные данные (0 - никогда, 1 - всегда)
+LOG_PAYLOAD_SAMPLE_RATE = float(getenv("LOG_PAYLOAD_SAMPLE_RATE", "0"))
+
+
+# --- Прием событий: ограничение нагрузки (services/admission.py) ---
+# Одновременно обрабатываемых событий на воркер; сверх этого - сразу 503 (0 - без ограничения)
+ADMISSION_MAX_IN_FLIGHT = int(getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+# Событий в секунду с одного адреса камеры (token bucket) и допустимый всплеск (0 - без ограничения)
+ADMISSION_CAMERA_RATE = float(getenv("ADMISSION_CAMERA_RATE", "5"))
+ADMISSION_CAMERA_BURST = int(getenv("ADMISSION_CAMERA_BURST", "20"))
+# Максимальный размер тела запроса камеры, байт; больше - 413
+ADMISSION_MAX_BODY_BYTES = int(getenv("ADMISSION_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+# Retry-After в ответе 503/429, секунд
+ADMISSION_RETRY_AFTER = int(getenv("ADMISSION_RETRY_AFTER", "1"))
+
+
+# --- Классификация событий (services/event_pipeline.py) ---
+# Типы событий (eventType), которые обрабатываются сразу, в приоритетной полосе; событие без eventType - тоже
+EVENT_PRIORITY_TYPES = frozenset(t.strip() for t in getenv("EVENT_PRIORITY_TYPES", "ANPR").split(",") if t.strip())
+# Остальные (VMD и т.п.): drop - отбросить; defer - разобрать в фоне, когда нет событий с номерами.
+# Их изображения не читаются в память и не пишутся на диск в обоих режимах
+EVENT_LOW_PRIORITY_MODE = getenv("EVENT_LOW_PRIORITY_MODE", "drop")
+EVENT_LOW_PRIORITY_QUEUE_SIZE = int(getenv("EVENT_LOW_PRIORITY_QUEUE_SIZE", "1000"))
@@ -9,22 +9,26 @@ PASSWORD = "user12345"
 
 # Используем базовый URL БЕЗ ID, чтобы получить весь список хостов
 url = f"http://{CAMERA_IP}/ISAPI/Event/notification/httpHosts"
-auth = HTTPDigestAuth(USERNAME, PASSWORD)
-
-try:
-    print(f"Отправка GET-запроса на: {url}")
-    response = requests.get(url, auth=auth)
-    response.raise_for_status()
-    
-    print("\nУСПЕХ! Текущая конфигурация httpHosts получена.")
-    print("="*50)
-    print(response.text)
-    print("="*50)
-
-except requests.exceptions.RequestException as e:
-    print(f"Ошибка: {e}")
-    if hasattr(e, 'response') and e.response is not None:
-        print(f"Статус код: {e.response.status_code}")
-        print(f"Тело ответа: {e.response.text}") 
-
- 
\ No newline at end of file
+
+
+def get_config():
+    auth = HTTPDigestAuth(USERNAME, PASSWORD)
+    try:
+        print(f"Отправка GET-запроса на: {url}")
+        response = requests.get(url, auth=auth)
+        response.raise_for_status()
+
+        print("\nУСПЕХ! Текущая конфигурация httpHosts получена.")
+        print("="*50)
+        print(response.text)
+        print("="*50)
+
+    except requests.exceptions.RequestException as e:
+        print(f"Ошибка: {e}")
+        if hasattr(e, 'response') and e.response is not None:
+            print(f"Статус код: {e.response.status_code}")
+            print(f"Тело ответа: {e.response.text}")
+
+
+if __name__ == "__main__":
+    get_config()
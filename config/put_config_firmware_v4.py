@@ -52,6 +52,7 @@ def put_config():
             print(f"Status Code: {e.response.status_code}")
             print(f"Response Body: {e.response.text}")
         return None
-print(put_config()) 
-    
-     
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    print(put_config())
@@ -1 +1 @@
-uvicorn manage:app --host 0.0.0.0 --port 8786 --reload
\ No newline at end of file
+python serve.py
\ No newline at end of file
@@ -1,178 +1,281 @@
-import fastapi
-from fastapi import FastAPI, Request, File, UploadFile, HTTPException
-from typing import Optional
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
+from functools import partial
+import hmac
 import logging
+import time
 
-from services.parse_logic import process_anpr_event 
-from services.parse_logic_firmware_v5 import process_anpr_event_from_parts 
+from services.multipart_stream import parse_event_stream, MultipartStreamError, RequestTooLargeError, StreamedEvent
 from services.send_smart_parking import SmartParkingService
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from services.outbox import Outbox, DeliveryWorker
+from services.image_store import ImageStore
+from services.image_archive import ImageArchive
+from services.dedup import PlateDeduplicator
+from services.metrics import StageTimer, render_metrics
+from services.event_pipeline import EventPipeline, DUPLICATE, IGNORED, DEFERRED
+from services.alert_stream import AlertStreamSupervisor
+from services.barrier import BarrierController, UnknownBarrierError
+from services.access_rules import AccessRules
+from services.camera_registry import get_camera_registry
+from services.admission import AdmissionController
+from services.logging_setup import configure_logging
+from config.config import BARRIER_API_TOKEN
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Маршруты объявляются на роутере, приложение собирает create_app()
+router = APIRouter()
+# Эндпоинты, на которые камеры шлют события: к ним применяется ограничение нагрузки
+EVENT_ENDPOINTS = ('/test', '/firmware_v5')
+# Заголовок с общим секретом BARRIER_API_TOKEN для ручного открытия шлагбаума
+BARRIER_TOKEN_HEADER = 'X-Barrier-Token'
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Все ресурсы (файлы, потоки, соединения) создаются здесь, а не при импорте модулей
+    configure_logging()
+    # Ограничение одновременных событий, частоты событий с камеры и размера тела запроса
+    app.state.admission = AdmissionController()
+    # Реестр камер: имя/направление/учетные данные по deviceID, MAC, IP; файл перечитывается при изменении
+    app.state.camera_registry = get_camera_registry()
+    app.state.camera_registry.start()
+    # Один клиент SmartParking с общим пулом соединений на всё приложение
+    app.state.smart_parking = SmartParkingService()
+    # Запись изображений в пуле потоков, чтобы диск не блокировал event loop
+    app.state.image_store = ImageStore()
+    # Архив с разбиением по дате/часу/камере, индексом event_id и фоновой очисткой
+    app.state.image_archive = ImageArchive(app.state.image_store)
+    app.state.image_archive.start()
+    # Персистентная очередь: событие подтверждается камере после записи на диск,
+    # доставка в SmartParking идет фоновым воркером
+    app.state.outbox = Outbox()
+    # Повторные чтения одного номера с одной камеры не отправляются в SmartParking
+    app.state.dedup = PlateDeduplicator()
+    app.state.delivery = DeliveryWorker(app.state.outbox, app.state.smart_parking, app.state.image_archive)
+    app.state.delivery.start()
+    # Шлагбаумы: прогретые keep-alive соединения к камерам Entry/Exit
+    app.state.barrier = BarrierController()
+    app.state.barrier.start()
+    # Локальный список разрешенных номеров: шлагбаум открывается без похода в SmartParking
+    app.state.access_rules = AccessRules(app.state.barrier)
+    app.state.access_rules.start()
+    # Общий конвейер событий всех эндпоинтов (decode -> extract -> enrich -> dispatch -> persist)
+    app.state.pipeline = EventPipeline(app.state.image_archive, app.state.dedup, app.state.access_rules,
+                                       app.state.delivery, app.state.camera_registry)
+    app.state.pipeline.start()
+    # Pull-режим: события из alertStream камер, которые не умеют HTTP push
+    app.state.alert_stream = AlertStreamSupervisor(partial(handle_alert_stream_event, app.state))
+    app.state.alert_stream.start()
+    try:
+        yield
+    finally:
+        await app.state.alert_stream.stop()
+        await app.state.pipeline.stop()
+        await app.state.access_rules.stop()
+        await app.state.barrier.close()
+        await app.state.delivery.stop()
+        await app.state.image_store.close()
+        await app.state.image_archive.stop()
+        await app.state.smart_parking.close()
+        app.state.outbox.close()
+        app.state.dedup.close()
+        await app.state.camera_registry.stop()
 
-@app.post("/test")
-async def receive_event_endpoint(  
-    request: Request, 
-    anpr_xml: Optional[UploadFile] = File(None, alias="anpr.xml"),  
-    license_plate_picture: Optional[UploadFile] = File(None, alias="licensePlatePicture.jpg"),
-    detection_picture: Optional[UploadFile] = File(None, alias="detectionPicture.jpg")
-    ):
-    send_smart_parking = SmartParkingService()
-    logger.info("="*20)
-    logger.info(f"EVENT RECEIVED at /test from {request.client.host}")
 
+async def handle_alert_stream_event(state, streamed, host: str):
+    """Событие из alertStream (pull-режим) проходит тот же конвейер, что и push-эндпоинты."""
+    timer = StageTimer('alertStream')
+    camera, outcome = None, 'error'
     try:
-        processed_data = await process_anpr_event(
-            anpr_xml_file=anpr_xml,
-            license_plate_picture_file=license_plate_picture,
-            detection_picture_file=detection_picture
-        )
-        
-        # Используем .get() с значениями по умолчанию для безопасности
-        camera = processed_data.get('camera', 'Unknown')
-        license_plate = processed_data.get('license_plate')
-        event_id = processed_data.get('event_id')
-        main_image_path = processed_data.get('main_image_path')
-        main_image_original_name = processed_data.get('main_image_original_name')
-        color = processed_data.get('color', 'default') 
-        license_plate_country = processed_data.get('license_plate_country', 'default') 
-        
-        
-        
-        send_server_result = send_smart_parking.send_parking( 
-            camera_name=camera, 
-            main_image_path=main_image_path, 
-            main_image_original_name=main_image_original_name, 
-            license_plate=license_plate, 
-            license_plate_country=license_plate_country, 
-            color=color, 
-            event_id=event_id
-        )
-        if send_server_result:
-            logger.info("Success send request to smart parking 200 OK")
-            logger.info(f"Processed data: {processed_data}")
-        
-        if processed_data.get("parsing_errors"):
+        event = await state.pipeline.handle(streamed, 'v5', timer, 'alertStream')
+        camera, outcome = event.camera, event.outcome
+    finally:
+        timer.finish(camera, outcome)
+
+
+async def mark_received_at(request: Request, call_next):
+    # Момент приема запроса: от него считается end_to_end
+    request.state.received_at = time.perf_counter()
+    return await call_next(request)
+
+
+async def admit_camera_request(request: Request, call_next):
+    # При перегрузке камера сразу получает 503/429 с Retry-After, тело запроса не читается
+    if request.url.path not in EVENT_ENDPOINTS:
+        return await call_next(request)
+    admission = request.app.state.admission
+    content_length = request.headers.get('content-length', '')
+    reason = admission.try_admit(request.url.path, request.client.host if request.client else None,
+                                 int(content_length) if content_length.isdigit() else None)
+    if reason:
+        status_code, content, headers = admission.reject_response(reason)
+        return JSONResponse(status_code=status_code, content=content, headers=headers)
+    try:
+        return await call_next(request)
+    finally:
+        admission.release()
+
+
+@router.get("/alert_stream/health")
+def alert_stream_health(request: Request):
+    return request.app.state.alert_stream.health()
+
+
+@router.post("/barrier/{camera}/open")
+async def open_barrier(camera: str, request: Request):
+    # Порт тот же, что принимает события камер: без общего секрета шлагбаум не открывается
+    if not BARRIER_API_TOKEN:
+        return JSONResponse(status_code=403, content={"status": "error", "message": "Manual barrier control is disabled"})
+    if not hmac.compare_digest(request.headers.get(BARRIER_TOKEN_HEADER, '').encode(), BARRIER_API_TOKEN.encode()):
+        logger.warning("Rejected barrier open for %s from %s: bad token", camera,
+                       request.client.host if request.client else None)
+        return JSONResponse(status_code=401, content={"status": "error", "message": "Invalid barrier token"})
+    try:
+        result = await request.app.state.barrier.open(camera)
+    except UnknownBarrierError:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Unknown barrier camera '{camera}'"})
+    return JSONResponse(status_code=200 if result["ok"] else 502, content=result)
+
+
+@router.get("/barrier")
+def barrier_status(request: Request):
+    state = request.app.state
+    return {"cameras": state.barrier.status(), "access_rules": state.access_rules.stats()}
+
+
+@router.get("/admission")
+def admission_status(request: Request):
+    state = request.app.state
+    return {**state.admission.status(), "lanes": state.pipeline.status()}
+
+
+@router.get("/delivery/health")
+async def delivery_health(request: Request):
+    state = request.app.state
+    return {**state.smart_parking.status(), "outbox": await state.outbox.stats(),
+            "image_writes_pending": state.image_store.pending}
+
+
+@router.get("/metrics")
+def metrics(request: Request):
+    content, content_type = render_metrics(request.headers.get('accept'))
+    return Response(content=content, media_type=content_type)
+
+
+
+async def _read_event(request: Request, timer: StageTimer) -> StreamedEvent:
+    # Тело читается кусками: в памяти остаются XML и одно выбранное изображение,
+    # ненужные части отбрасываются (services/multipart_stream.py)
+    # Изображения событий без номера (VMD и т.п.) не собираются в память
+    with timer.stage('multipart_parse'):
+        streamed = await parse_event_stream(request.headers.get('content-type', ''), request.stream(),
+                                            request.app.state.admission.max_body_size,
+                                            keep_images=request.app.state.pipeline.is_priority)
+    logger.debug("Parts found: %s, image: %s", streamed.part_names, streamed.image_name)
+    return streamed
+
+
+@router.post("/test")
+async def receive_event_v4(request: Request):
+    """
+    События камер с прошивкой v4 (части anpr.xml, licensePlatePicture.jpg, detectionPicture.jpg).
+    В ответе - разобранные данные события.
+    """
+    timer = StageTimer('/test', request.state.received_at)
+    timer.annotate(client=request.client.host)
+    camera, outcome = None, 'error'
+
+    try:
+        event = await request.app.state.pipeline.handle(await _read_event(request, timer), 'v4', timer, '/test')
+        camera, outcome = event.camera, event.outcome
+        if outcome in (IGNORED, DEFERRED):
+            return JSONResponse(content={"status": outcome, "message": f"{event.event_type} event is not processed"})
+        if outcome == DUPLICATE:
+            return JSONResponse(content={"status": outcome, "message": "Event is a repeat of an already accepted one",
+                                         "data": event.as_dict()})
+        if event.errors:
             return JSONResponse(
-                status_code=200,  
+                status_code=200,
                 content={
-                    "status": "partial_success" if processed_data.get("plate_number") else "failure", # или другой статус
+                    "status": "partial_success" if event.license_plate else "failure",
                     "message": "Event received, but some data could not be parsed.",
-                    "data": processed_data,
-                    "errors": processed_data["parsing_errors"]
+                    "data": event.as_dict(),
+                    "errors": event.errors
                 }
             )
-        
         return JSONResponse(
             content={
                 "status": "success",
                 "message": "Event received and processed successfully",
-                "data": processed_data
+                "data": event.as_dict()
             }
         )
 
-    except HTTPException as http_ex: 
-        raise http_ex
+    except RequestTooLargeError as e:
+        outcome = 'too_large'
+        request.app.state.admission.record_rejection('/test', 'too_large')
+        return JSONResponse(status_code=413, content={"status": "error", "message": str(e)})
+    except MultipartStreamError as e:
+        outcome = 'bad_request'
+        logger.error(f"Malformed request at /test: {e}")
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
     except Exception as e:
         logger.exception(f"Critical error in /test endpoint: {e}")
-         
         return JSONResponse(status_code=500, content={"status": "error", "message": "Internal server error during event processing."})
     finally:
-        logger.info("Finished /test endpoint processing.")
-        logger.info("="*20)
+        timer.finish(camera, outcome)
 
 
-@app.post("/firmware_v5")
-async def receive_event_endpoint(request: Request):
+@router.post("/firmware_v5")
+async def receive_event_v5(request: Request):
     """
-    Эндпоинт для приема multipart/form-data событий от камер Hikvision,
-    используя встроенный парсер FastAPI.
+    Эндпоинт для приема multipart/form-data событий от камер Hikvision с прошивкой v5.
+    Тело запроса разбирается потоково (services/multipart_stream.py).
     """
-    logger.info("="*20)
-    logger.info(f"EVENT RECEIVED at /firmware_v5 from {request.client.host}")
-    
-    smart_parking_service = SmartParkingService()
+    timer = StageTimer('/firmware_v5', request.state.received_at)
+    timer.annotate(client=request.client.host)
+    camera, outcome = None, 'error'
 
     try:
-        # --- НОВЫЙ, ПРОСТОЙ И НАДЕЖНЫЙ СПОСОБ ПАРСИНГА ---
-        # FastAPI сам разберет multipart-запрос, если мы запросим form()
-        form_data = await request.form()
-        
-        # Теперь form_data - это объект, похожий на словарь.
-        # Давайте посмотрим, какие ключи (имена частей) в нем есть.
-        logger.info(f"--- Parsed Form Data Keys ---")
-        logger.info(f"Keys found: {list(form_data.keys())}")
-        logger.info("---------------------------")
-
-        # Ищем наши части. FastAPI вернет их как объекты UploadFile.
-        # Ключи - это значения 'name' из Content-Disposition.
-        # Например, 'MoveDetection.xml' или 'licensePlatePicture.jpg'.
-        
-        xml_file = None
-        plate_picture_file = None
-        detection_picture_file = None
-
-        # Итерируемся по всем частям, чтобы найти нужные
-        for key in form_data.keys():
-            if key.lower().endswith('.xml'):
-                xml_file = form_data[key]
-                logger.info(f"Found XML part with key: '{key}'")
-            elif key == 'licensePlatePicture.jpg':
-                plate_picture_file = form_data[key]
-                logger.info(f"Found licensePlatePicture part.")
-            elif key == 'detectionPicture.jpg':
-                detection_picture_file = form_data[key]
-                logger.info(f"Found detectionPicture part.")
-        
-        # --- КОНЕЦ НОВОГО ПАРСИНГА ---
-        
-        # Читаем содержимое файлов (они типа UploadFile)
-        xml_bytes = await xml_file.read() if xml_file else None
-        plate_picture_bytes = await plate_picture_file.read() if plate_picture_file else None
-        detection_picture_bytes = await detection_picture_file.read() if detection_picture_file else None
-
-        processed_data = await process_anpr_event_from_parts(
-            anpr_xml_bytes=xml_bytes,
-            license_plate_picture_bytes=plate_picture_bytes,
-            detection_picture_bytes=detection_picture_bytes
-        )
-        
-        logger.info(f"processed_data: {processed_data}")
-        
-        if processed_data and processed_data.get('license_plate'):
-            smart_parking_service.send_parking(
-                camera_name=processed_data.get('camera'),
-                main_image_path=processed_data.get('main_image_path'),
-                main_image_original_name=processed_data.get('main_image_original_name'),
-                license_plate=processed_data.get('license_plate'),
-                license_plate_country=processed_data.get('license_plate_country'),
-                color=processed_data.get('color'),
-                event_id=processed_data.get('event_id')
-            )
-        else:
-            logger.info("Событие пропущено, так как не содержит номера или произошла ошибка парсинга.")
+        event = await request.app.state.pipeline.handle(await _read_event(request, timer), 'v5', timer, '/firmware_v5')
+        camera, outcome = event.camera, event.outcome
+        if outcome in (DUPLICATE, IGNORED, DEFERRED):
+            return JSONResponse(status_code=200, content={"status": outcome})
 
-        return JSONResponse(status_code=200, content={"status": "success"})
+        return JSONResponse(status_code=200, content={"status": "success", "event_id": event.event_id})
 
+    except RequestTooLargeError as e:
+        outcome = 'too_large'
+        request.app.state.admission.record_rejection('/firmware_v5', 'too_large')
+        return JSONResponse(status_code=413, content={"status": "error", "message": str(e)})
+    except MultipartStreamError as e:
+        outcome = 'bad_request'
+        logger.error(f"Malformed request at /firmware_v5: {e}")
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
     except Exception as e:
         logger.exception(f"Critical error in /firmware_v5 endpoint: {e}")
         return JSONResponse(status_code=500, content={"status": "error", "message": "Internal server error."})
     finally:
-        logger.info("Finished /firmware_v5 endpoint processing.")
-        logger.info("="*20)
+        timer.finish(camera, outcome)
+
 
- 
-        
-@app.get("/")
+@router.get("/")
 def read_root():
     return {"Hello": "World"}
 
-# Ваш код для настройки камеры (put_config) можно оставить здесь или вынести в отдельный скрипт
-# ... 
-# def put_config(): ...
-# if __name__ == "__main__" and some_condition_to_run_put_config:
-#    print(put_config())
\ No newline at end of file
+
+def create_app() -> FastAPI:
+    """
+    Собирает приложение без побочных эффектов: логирование, реестр камер, пулы,
+    outbox и соединения с камерами поднимаются в lifespan при старте сервера.
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.middleware("http")(admit_camera_request)
+    app.middleware("http")(mark_received_at)
+    app.include_router(router)
+    return app
+
+
+# uvicorn manage:app / serve.py; импорт модуля не трогает диск и сеть
+app = create_app()
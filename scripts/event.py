@@ -1,23 +1,22 @@
-import requests
-import xml.etree.ElementTree as ET
-import time
-import re
-from requests.auth import HTTPDigestAuth
+"""
+Слежение за событиями камер через alertStream (pull-режим) без сервиса приема.
 
-# --- Настройки подключения ---
-CAMERA_IP = "192.168.80.171"
-USERNAME = "admin" # Обычно 'admin'
-PASSWORD = "user12345"
-# ---------------------------
+    python scripts/event.py 192.168.80.171 admin:pass@192.168.80.172 ...
 
-# URL для получения потока событий
-event_stream_url = f"http://{CAMERA_IP}/ISAPI/Event/notification/alertStream"
+Без аргументов используются ALERT_STREAM_CAMERAS из .env. Все камеры обслуживаются
+одним процессом (services/alert_stream.AlertStreamSupervisor).
+"""
+import asyncio
+import logging
+import sys
+import xml.etree.ElementTree as ET
+from pathlib import Path
 
-print(f"Подключение к камере: {CAMERA_IP}...")
-print("Ожидание событий (детекция транспорта)... Нажмите Ctrl+C для выхода.")
+# Запуск как python scripts/event.py: корень репозитория нужен для импорта services
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.config import ALERT_STREAM_CAMERAS
+from services.alert_stream import AlertStreamSupervisor
 
-session = requests.Session()
-session.auth = HTTPDigestAuth(USERNAME, PASSWORD)
 namespace = {'isapi': 'http://www.hikvision.com/ver20/XMLSchema'}  
 
 def find_tag(element, tag_name):
@@ -90,79 +89,25 @@ def process_event_xml(xml_data):
         print(f"Данные (начало): {xml_data[:200]}...") # Отладка
 
 
-def listen_for_events():
-    """Основной цикл прослушивания событий."""
-    while True:
-        try:
-            response = session.get(event_stream_url, stream=True, timeout=60) # Таймаут long polling
-            response.raise_for_status() # Проверка на HTTP ошибки (4xx, 5xx)
-
-            boundary = None
-            content_type_header = response.headers.get('Content-Type', '')
-
-            match = re.search(r'boundary="?([^"]+)"?', content_type_header)
-            if match:
-                boundary = match.group(1)
-
-            full_content = b''
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    full_content += chunk
-                    if not boundary:
-                         # Простой случай - один XML на ответ
-                         try:
-                            decoded_chunk = full_content.decode('utf-8', errors='ignore')
-                            if decoded_chunk.strip().endswith('</EventNotificationAlert>'):
-                                 # print(f"Обработка единичного XML...") # Отладка
-                                 process_event_xml(decoded_chunk)
-                                 full_content = b'' # Сбрасываем буфер
-                         except Exception as e:
-                             print(f"Ошибка при обработке единичного ответа: {e}")
-                             full_content = b'' # Сброс при ошибке
-
-            # Обработка multipart ответа после получения всего контента
-            if boundary:
-                #print("Обработка multipart ответа...") # Отладка
-                try:
-                    body = full_content.decode('utf-8', errors='ignore')
-                    parts = body.split(f'--{boundary}')
-                    #print(f"Найдено частей: {len(parts)}") # Отладка
-                    for part in parts:
-                        if part.strip() and part.strip() != '--': # Пропускаем пустые части и закрывающий boundary
-                            # Ищем начало XML внутри части
-                             process_event_xml(part)
-                except Exception as e:
-                    print(f"Ошибка при разборе multipart: {e}")
-                    print(f"Контент (начало): {full_content[:500]}") # Отладка
-
-
-        except requests.exceptions.ConnectionError as e:
-            print(f"Ошибка соединения: {e}. Повторная попытка через 10 секунд...")
-            time.sleep(10)
-        except requests.exceptions.Timeout:
-            # Это нормальное поведение для long polling, если событий не было
-            # print("Таймаут ожидания события, переподключение...")
-            continue
-        except requests.exceptions.HTTPError as e:
-            print(f"HTTP ошибка: {e.response.status_code} {e.response.reason}")
-            if e.response.status_code == 401:
-                print("Ошибка аутентификации (Unauthorized). Проверьте логин и пароль.")
-            elif e.response.status_code == 404:
-                 print("Ошибка 404 (Not Found). Неверный URL или ISAPI события не поддерживаются/отключены.")
-            else:
-                print(f"Ответ сервера: {e.response.text}")
-            print("Ожидание 15 секунд перед повторной попыткой...")
-            time.sleep(15)
-        except requests.exceptions.RequestException as e:
-            print(f"Общая ошибка запроса: {e}. Повторная попытка через 10 секунд...")
-            time.sleep(10)
-        except KeyboardInterrupt:
-            print("\nВыход из программы.")
-            break
-        except Exception as e:
-            print(f"Непредвиденная ошибка в основном цикле: {e}")
-            time.sleep(5)
+async def print_event(streamed, host):
+    print(f"[{host}]")
+    process_event_xml(streamed.xml_bytes.decode('utf-8', errors='ignore'))
+
+
+def listen_for_events(hosts):
+    """Основной цикл прослушивания событий: переподключения и backoff - внутри супервизора."""
+    print(f"Подключение к камерам: {', '.join(hosts)}...")
+    print("Ожидание событий (детекция транспорта)... Нажмите Ctrl+C для выхода.")
+    supervisor = AlertStreamSupervisor(print_event, hosts, lock_path=None)
+    try:
+        asyncio.run(supervisor.run_forever())
+    except KeyboardInterrupt:
+        print("\nВыход из программы.")
 
 
 if __name__ == "__main__":
-    listen_for_events()
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    hosts = sys.argv[1:] or ALERT_STREAM_CAMERAS
+    if not hosts:
+        sys.exit(__doc__)
+    listen_for_events(hosts)
@@ -0,0 +1,179 @@
+"""
+Локальная имитация ISAPI камер Hikvision для проверки scripts/provision.py без железа.
+
+    python scripts/fake_isapi.py --cameras 50 --registry-out /tmp/cameras.json
+    python scripts/provision.py --registry /tmp/cameras.json --server-ip 10.0.0.5 --motion on
+
+Каждая камера - отдельный HTTP-сервер на 127.0.0.1:{base-port + N} с документами
+httpHosts/{id} и motionDetection в памяти: GET отдает документ, PUT заменяет его.
+--registry-out пишет реестр камер с этими адресами. --ignore-field имитирует камеру,
+которая отвечает 200, но не сохраняет поле (проверочный GET должен это поймать).
+По Ctrl+C печатается число GET/PUT по всем камерам.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAMESPACE = "http://www.hikvision.com/ver20/XMLSchema"
+
+HTTP_HOST = f"""<?xml version="1.0" encoding="UTF-8"?>
+<HttpHostNotification version="2.0" xmlns="{NAMESPACE}">
+<id>{{host_id}}</id>
+<url>/</url>
+<protocolType>HTTP</protocolType>
+<parameterFormatType>XML</parameterFormatType>
+<addressingFormatType>ipaddress</addressingFormatType>
+<ipAddress>0.0.0.0</ipAddress>
+<portNo>80</portNo>
+<userName></userName>
+<httpAuthenticationMethod>none</httpAuthenticationMethod>
+<httpBroken>true</httpBroken>
+</HttpHostNotification>
+"""
+
+MOTION_DETECTION = f"""<?xml version="1.0" encoding="UTF-8"?>
+<MotionDetection version="2.0" xmlns="{NAMESPACE}">
+<enabled>false</enabled>
+<enableHighlight>false</enableHighlight>
+<samplingInterval>2</samplingInterval>
+</MotionDetection>
+"""
+
+RESPONSE_OK = f"""<?xml version="1.0" encoding="UTF-8"?>
+<ResponseStatus version="2.0" xmlns="{NAMESPACE}">
+<requestURL>{{url}}</requestURL>
+<statusCode>1</statusCode>
+<statusString>OK</statusString>
+<subStatusCode>ok</subStatusCode>
+</ResponseStatus>
+"""
+
+_HTTP_HOST_RE = re.compile(r'^/ISAPI/Event/notification/httpHosts/(\d+)$')
+_MOTION_RE = re.compile(r'^/ISAPI/System/Video/inputs/channels/(\d+)/motionDetection$')
+
+requests_counter = Counter()
+_counter_lock = threading.Lock()
+
+
+class FakeCamera:
+    def __init__(self, name: str, ignore_fields=()):
+        self.name = name
+        self.ignore_fields = ignore_fields
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: str):
+        with self.lock:
+            if path in self.documents:
+                return self.documents[path]
+            match = _HTTP_HOST_RE.match(path)
+            if match and 1 <= int(match.group(1)) <= 3:
+                return HTTP_HOST.format(host_id=match.group(1))
+            if _MOTION_RE.match(path):
+                return MOTION_DETECTION
+            return None
+
+    def put(self, path: str, body: str) -> bool:
+        previous = self.get(path)
+        if previous is None:
+            return False
+        for field in self.ignore_fields:
+            old = re.search(rf'<{field}>[^<]*</{field}>', previous)
+            if old:
+                body = re.sub(rf'<{field}>[^<]*</{field}>', old.group(0), body)
+        with self.lock:
+            self.documents[path] = body
+        return True
+
+
+def make_handler(camera: FakeCamera, latency: float, digest: bool):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body: str = "", headers=None):
+            data = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _authorized(self) -> bool:
+            # Подпись не проверяется: важно только, что клиент проходит digest-challenge
+            if not digest or self.headers.get("Authorization", "").startswith("Digest "):
+                return True
+            self._reply(401, headers={"WWW-Authenticate":
+                                      'Digest realm="IP Camera", qop="auth", nonce="fake", opaque=""'})
+            return False
+
+        def do_GET(self):
+            time.sleep(latency)
+            if not self._authorized():
+                return
+            with _counter_lock:
+                requests_counter["GET"] += 1
+            document = camera.get(self.path)
+            if document is None:
+                self._reply(404)
+            else:
+                self._reply(200, document)
+
+        def do_PUT(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+            time.sleep(latency)
+            if not self._authorized():
+                return
+            with _counter_lock:
+                requests_counter["PUT"] += 1
+            if camera.put(self.path, body):
+                print(f"{camera.name}: PUT {self.path}")
+                self._reply(200, RESPONSE_OK.format(url=self.path))
+            else:
+                self._reply(404)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cameras", type=int, default=5)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=50, help="задержка ответа камеры, мс")
+    parser.add_argument("--digest", action="store_true", help="требовать digest-авторизацию")
+    parser.add_argument("--ignore-field", action="append", default=[],
+                        help="поле, которое камера молча не сохраняет при PUT")
+    parser.add_argument("--registry-out", help="записать реестр камер с адресами фейковых камер")
+    args = parser.parse_args()
+
+    servers, cameras = [], []
+    for n in range(args.cameras):
+        name = f"Fake-{n + 1}"
+        port = args.base_port + n
+        server = ThreadingHTTPServer((args.host, port),
+                                     make_handler(FakeCamera(name, args.ignore_field), args.latency / 1000, args.digest))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        cameras.append({"name": name, "ip": f"{args.host}:{port}", "firmware": "v5" if n % 2 else "v4"})
+
+    if args.registry_out:
+        with open(args.registry_out, "w", encoding="utf-8") as f:
+            json.dump({"cameras": cameras}, f, ensure_ascii=False, indent=2)
+    print(f"{len(servers)} fake cameras on {args.host}:{args.base_port}-{args.base_port + len(servers) - 1}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(f"requests: GET={requests_counter['GET']} PUT={requests_counter['PUT']}")
+
+
+if __name__ == "__main__":
+    main()
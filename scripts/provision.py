@@ -0,0 +1,106 @@
+"""
+Массовая настройка камер из реестра (config/cameras.json): адрес приема событий
+(httpHosts), выгрузка изображений ANPR и детекция движения.
+
+    python scripts/provision.py --server-ip 192.168.80.112
+    python scripts/provision.py --server-ip 192.168.80.112 --camera Entry --camera Exit --dry-run
+    python scripts/provision.py --server-ip 192.168.80.112 --motion on --json
+
+Для каждой камеры настройки читаются (GET), сравниваются с желаемыми и записываются
+(PUT) только при отличиях, после записи проверяются повторным GET. Повторный запуск
+ничего не меняет. Код выхода 1, если хотя бы одна настройка не применилась.
+Проверка без камер: python scripts/fake_isapi.py --cameras 50 --registry-out /tmp/cameras.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from pathlib import Path
+
+# Запуск как python scripts/provision.py: корень репозитория нужен для импорта services
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from config.config import (
+    PROVISION_SERVER_IP,
+    PROVISION_SERVER_PORT,
+    PROVISION_HTTP_HOST_ID,
+    PROVISION_ANPR_PICTURES,
+    PROVISION_MOTION_DETECTION,
+    PROVISION_CONCURRENCY,
+    PROVISION_TIMEOUT,
+    CAMERA_REGISTRY_PATH,
+)
+from services.camera_registry import CameraRegistry
+from services.provisioning import (
+    RESOURCES, FAILED, VERIFY_FAILED, CameraProvisioner, ProvisioningOptions, summarize,
+)
+
+logger = logging.getLogger("PROVISION")
+
+
+def print_report(results, elapsed):
+    for result in results:
+        print(f"{result.camera:<16} {result.setting:<16} {result.status:<14} {result.duration * 1000:>8.1f} ms"
+              + (f"  {result.error}" if result.error else ""))
+        for path, (current, desired) in result.changes.items():
+            print(f"{'':<33}{path}: {current!r} -> {desired!r}")
+    summary = summarize(results)
+    print()
+    print(f"{len({r.camera for r in results})} cameras, {len(results)} settings in {elapsed:.2f} s: "
+          + ", ".join(f"{status}={count}" for status, count in summary.items() if count))
+
+
+async def main(args) -> int:
+    registry = CameraRegistry(args.registry, reload_interval=0)
+    cameras = registry.cameras
+    if args.camera:
+        unknown = set(args.camera) - {c.name for c in cameras}
+        if unknown:
+            sys.exit(f"Unknown cameras: {', '.join(sorted(unknown))}")
+        cameras = [c for c in cameras if c.name in args.camera]
+    if not cameras:
+        sys.exit(f"No cameras in {args.registry}")
+
+    options = ProvisioningOptions(
+        args.server_ip, args.server_port, args.host_id,
+        anpr_pictures=args.anpr_pictures or None,
+        motion=None if args.motion == 'keep' else args.motion,
+        resources=tuple(args.only or RESOURCES),
+    )
+    provisioner = CameraProvisioner(options, args.concurrency, args.timeout, dry_run=args.dry_run)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        results = await provisioner.run(cameras)
+    finally:
+        await provisioner.close()
+    elapsed = loop.time() - start
+
+    if args.json:
+        print(json.dumps({"elapsed_s": round(elapsed, 3), "summary": summarize(results),
+                          "results": [r.as_dict() for r in results]}, ensure_ascii=False, indent=2))
+    else:
+        print_report(results, elapsed)
+    return 1 if any(r.status in (FAILED, VERIFY_FAILED) for r in results) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server-ip", default=PROVISION_SERVER_IP, required=not PROVISION_SERVER_IP,
+                        help="IP сервиса приема событий (PROVISION_SERVER_IP)")
+    parser.add_argument("--server-port", type=int, default=PROVISION_SERVER_PORT)
+    parser.add_argument("--host-id", default=PROVISION_HTTP_HOST_ID, help="слот httpHosts на камере")
+    parser.add_argument("--anpr-pictures", default=PROVISION_ANPR_PICTURES,
+                        help="detectionUpLoadPicturesType (all, licensePlatePicture, ...); пусто - не трогать")
+    parser.add_argument("--motion", choices=("on", "off", "keep"), default=PROVISION_MOTION_DETECTION or "keep")
+    parser.add_argument("--only", action="append", choices=RESOURCES, help="настраивать только эти ресурсы")
+    parser.add_argument("--camera", action="append", help="имя камеры из реестра (можно несколько раз)")
+    parser.add_argument("--registry", default=CAMERA_REGISTRY_PATH)
+    parser.add_argument("--concurrency", type=int, default=PROVISION_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=PROVISION_TIMEOUT)
+    parser.add_argument("--dry-run", action="store_true", help="только показать отличия, без PUT")
+    parser.add_argument("--json", action="store_true", help="отчет в JSON")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    sys.exit(asyncio.run(main(args)))
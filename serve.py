@@ -0,0 +1,78 @@
+# serve.py
+"""
+Production-запуск сервиса приема событий: несколько процессов uvicorn без --reload.
+
+    python serve.py                    # параметры из .env / переменных окружения
+    python serve.py --workers 4 --port 8786
+
+Каждый воркер поднимает свои ресурсы (пул HTTP-клиента, пул записи изображений,
+outbox-воркер) в lifespan-хуке manage.app. Общее состояние между процессами
+хранится только в SQLite-файлах (outbox, индекс архива), а не в памяти процесса.
+По SIGTERM/SIGINT uvicorn перестает принимать соединения и дает запросам
+завершиться в течение --graceful-timeout секунд.
+Метрики Prometheus при нескольких воркерах собираются через общий каталог
+PROMETHEUS_MULTIPROC_DIR, чтобы /metrics любого воркера отдавал сумму по всем,
+а окно dedup - через SQLite (DEDUP_BACKEND=sqlite), иначе повторы номера,
+попавшие в разные воркеры, уходили бы в SmartParking.
+"""
+import argparse
+import os
+import shutil
+
+import uvicorn
+
+from config.config import (
+    getenv,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKERS,
+    SERVER_GRACEFUL_TIMEOUT,
+    SERVER_MAX_REQUESTS,
+)
+
+
+def _prepare_metrics_dir():
+    # Каталог очищается до старта воркеров: файлы прошлого запуска исказили бы счетчики
+    metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "./metrics_multiproc")
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def _select_dedup_backend():
+    # Окно в памяти у каждого воркера свое: по умолчанию общее SQLite, явный memory - ошибка
+    backend = getenv("DEDUP_BACKEND")
+    if backend is None:
+        os.environ["DEDUP_BACKEND"] = "sqlite"
+    elif backend == "memory":
+        raise SystemExit("DEDUP_BACKEND=memory does not work with several workers: "
+                         "each would keep its own window. Use DEDUP_BACKEND=sqlite or --workers 1")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="manage:app", help="ASGI-приложение (module:attr)")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--graceful-timeout", type=int, default=SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--max-requests", type=int, default=SERVER_MAX_REQUESTS,
+                        help="перезапускать воркер после N запросов (0 - никогда)")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        _prepare_metrics_dir()
+        _select_dedup_backend()
+
+    uvicorn.run(
+        args.app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_max_requests=args.max_requests or None,
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# services/access_rules.py
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+import httpx
+
+from config.config import (
+    SMART_PARKING_URL,
+    BARRIER_TIMEOUT,
+    ACCESS_RULES_ENABLED,
+    ACCESS_LIST_PATH,
+    ACCESS_LIST_SYNC_INTERVAL,
+    ACCESS_LIST_CACHE_PATH,
+)
+from services.barrier import BarrierController
+from services.dedup import normalize_plate
+from services.metrics import ACCESS_DECISIONS
+
+logger = logging.getLogger(__name__)
+
+
+class AccessEntry:
+    """Разрешение на проезд: срок действия и (необязательно) список камер, где оно действует."""
+    __slots__ = ('plate', 'valid_until', 'cameras')
+
+    def __init__(self, plate: str, valid_until: Optional[float] = None, cameras: Optional[Set[str]] = None):
+        self.plate = plate
+        self.valid_until = valid_until
+        self.cameras = cameras
+
+    def allows(self, camera: str, now: float) -> bool:
+        if self.valid_until is not None and self.valid_until < now:
+            return False
+        return not self.cameras or camera in self.cameras
+
+
+def _parse_time(value) -> Optional[float]:
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+def build_index(items: Iterable) -> Dict[str, AccessEntry]:
+    """
+    Строит индекс нормализованный номер -> AccessEntry из ответа SmartParking.
+    Элемент - строка с номером или объект с license_plate/plate, valid_until, cameras.
+    """
+    index: Dict[str, AccessEntry] = {}
+    for item in items:
+        if isinstance(item, str):
+            item = {'license_plate': item}
+        plate = item.get('license_plate') or item.get('plate')
+        if not plate:
+            continue
+        cameras = item.get('cameras')
+        index[normalize_plate(plate)] = AccessEntry(
+            plate, _parse_time(item.get('valid_until')), set(cameras) if cameras else None)
+    return index
+
+
+class AccessRules:
+    """
+    Локальное правило автооткрытия: номер из списка разрешенных SmartParking открывает
+    шлагбаум камеры сразу, без похода в бэкенд. Список синхронизируется раз в
+    sync_interval секунд и кэшируется в файле, чтобы после рестарта шлагбаумы работали
+    и при недоступном SmartParking. Индекс заменяется целиком, поиск - один dict lookup.
+    Шлагбаум открывается фоновой задачей: медленная камера не задерживает ответ камере
+    и запись события в outbox.
+    """
+    # Дольше этого событие в outbox не ждет результата открытия: PUT может пройти
+    # двумя запросами (digest-challenge), каждый ограничен BARRIER_TIMEOUT
+    delivery_hold = 2 * BARRIER_TIMEOUT + 1
+
+    def __init__(self, barrier: BarrierController, enabled: bool = ACCESS_RULES_ENABLED,
+                 url: str = SMART_PARKING_URL + ACCESS_LIST_PATH,
+                 sync_interval: float = ACCESS_LIST_SYNC_INTERVAL,
+                 cache_path: str = ACCESS_LIST_CACHE_PATH):
+        self.barrier = barrier
+        self.enabled = enabled
+        self.url = url
+        self.sync_interval = sync_interval
+        self.cache_path = Path(cache_path)
+        self.synced_at: Optional[float] = None
+        self._index: Dict[str, AccessEntry] = {}
+        self._sync_task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._opening: Set[asyncio.Task] = set()
+        self.opened = 0
+        self.open_failed = 0
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._load_cache()
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(10.0))
+        self._sync_task = asyncio.create_task(self._sync_loop(), name="access-list-sync")
+
+    async def stop(self):
+        if self._sync_task:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+        # Уже начатые открытия доводим до конца: каждое ограничено BARRIER_TIMEOUT
+        if self._opening:
+            await asyncio.gather(*self._opening, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+
+    def check(self, camera: Optional[str], plate: Optional[str]) -> str:
+        """Решение по номеру: allowed | not_listed | expired | no_barrier | disabled."""
+        if not self.enabled or not plate:
+            return 'disabled'
+        entry = self._index.get(normalize_plate(plate))
+        if entry is None:
+            return 'not_listed'
+        if not entry.allows(camera, time.time()):
+            return 'expired'
+        if camera not in self.barrier.cameras:
+            return 'no_barrier'
+        return 'allowed'
+
+    def should_open(self, camera: Optional[str], plate: Optional[str]) -> bool:
+        """Решение по номеру с учетом в метриках: True - шлагбаум нужно открыть (open())."""
+        decision = self.check(camera, plate)
+        if decision == 'disabled':
+            return False
+        ACCESS_DECISIONS.labels(camera or 'Unknown', decision).inc()
+        return decision == 'allowed'
+
+    def open(self, camera: str, plate: str, on_done: Optional[Callable[[bool], Awaitable[None]]] = None):
+        """
+        Запускает открытие шлагбаума в фоне. on_done(ok) вызывается с результатом:
+        ok=True, только если камера подтвердила открытие.
+        """
+        logger.info(f"Plate {plate} is allowed at {camera}, opening barrier")
+        task = asyncio.create_task(self._open(camera, plate, on_done), name=f"barrier-open-{camera}")
+        self._opening.add(task)
+        task.add_done_callback(self._opening.discard)
+
+    async def _open(self, camera: str, plate: str, on_done: Optional[Callable[[bool], Awaitable[None]]]):
+        try:
+            ok = (await self.barrier.open(camera))["ok"]
+        except Exception as e:
+            logger.exception(f"Barrier {camera} open failed: {e}")
+            ok = False
+        if ok:
+            self.opened += 1
+        else:
+            self.open_failed += 1
+            # Причина уже в логе BarrierController.open
+            logger.warning(f"Barrier {camera} did not open for allowed plate {plate}")
+        if on_done is not None:
+            try:
+                await on_done(ok)
+            except Exception as e:
+                logger.exception(f"Barrier open result handler for {camera} failed: {e}")
+
+    # --- Синхронизация списка ---
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Access list sync from {self.url} failed: {e!r}")
+            await asyncio.sleep(self.sync_interval)
+
+    async def sync(self):
+        response = await self._client.get(self.url)
+        response.raise_for_status()
+        items = response.json()
+        if isinstance(items, dict):
+            items = items.get('results') or items.get('items') or []
+        self._index = build_index(items)
+        self.synced_at = time.time()
+        logger.info(f"Access list synced: {len(self._index)} plates")
+        await asyncio.to_thread(self._save_cache, items)
+
+    def _save_cache(self, items):
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Каждый worker uvicorn синхронизирует список сам: у временного файла свое имя на процесс
+        tmp = self.cache_path.with_name(f".{self.cache_path.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(items, ensure_ascii=False))
+            os.replace(tmp, self.cache_path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def _load_cache(self):
+        try:
+            self._index = build_index(json.loads(self.cache_path.read_text()))
+            logger.info(f"Access list loaded from cache: {len(self._index)} plates")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load access list cache {self.cache_path}: {e}")
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "plates": len(self._index), "synced_at": self.synced_at,
+                "opened": self.opened, "open_failed": self.open_failed, "opening": len(self._opening)}
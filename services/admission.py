@@ -0,0 +1,113 @@
+# services/admission.py
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from config.config import (
+    ADMISSION_MAX_IN_FLIGHT,
+    ADMISSION_CAMERA_RATE,
+    ADMISSION_CAMERA_BURST,
+    ADMISSION_MAX_BODY_BYTES,
+    ADMISSION_RETRY_AFTER,
+)
+from services.metrics import ADMISSION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Причина отказа -> HTTP-статус. Камера Hikvision повторяет отправку при любом ответе не 2xx
+REJECT_STATUS = {'overloaded': 503, 'rate_limited': 429, 'too_large': 413}
+# Корзины камер, не присылавших событий дольше этого, удаляются, секунд
+_BUCKET_IDLE_TTL = 600
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class AdmissionController:
+    """
+    Решает до чтения тела, принимать ли запрос камеры:
+    - не больше max_in_flight одновременно обрабатываемых событий на воркер (иначе 503);
+    - token bucket на адрес камеры: rate событий в секунду, всплеск до burst (иначе 429);
+    - Content-Length не больше max_body_size (иначе 413; тело без длины ограничивает
+      services/multipart_stream.parse_event_stream).
+    Отказ отдается сразу с Retry-After: камера повторит позже, а принятые запросы
+    не замедляются из-за перегрузки. Весь учет - в event loop, без блокировок.
+    """
+    def __init__(self, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT, rate: float = ADMISSION_CAMERA_RATE,
+                 burst: int = ADMISSION_CAMERA_BURST, max_body_size: int = ADMISSION_MAX_BODY_BYTES,
+                 retry_after: int = ADMISSION_RETRY_AFTER):
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_body_size = max_body_size
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.rejected: Dict[str, int] = dict.fromkeys(REJECT_STATUS, 0)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._last_prune = time.monotonic()
+
+    def try_admit(self, endpoint: str, client: Optional[str], content_length: Optional[int]) -> Optional[str]:
+        """
+        None - запрос принят, и после обработки нужно вызвать release();
+        иначе причина отказа (ключ REJECT_STATUS).
+        """
+        reason = None
+        if self.max_body_size and content_length is not None and content_length > self.max_body_size:
+            reason = 'too_large'
+        elif self.max_in_flight and self.in_flight >= self.max_in_flight:
+            reason = 'overloaded'
+        elif self.rate > 0 and not self._take_token(client or 'unknown'):
+            reason = 'rate_limited'
+        if reason:
+            self.record_rejection(endpoint, reason)
+            logger.debug("Rejected %s from %s: %s (in flight %d)", endpoint, client, reason, self.in_flight)
+            return reason
+        self.in_flight += 1
+        return None
+
+    def release(self):
+        self.in_flight -= 1
+
+    def record_rejection(self, endpoint: str, reason: str):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.labels(endpoint, reason).inc()
+
+    def reject_response(self, reason: str) -> Tuple[int, dict, dict]:
+        """(статус, тело JSON, заголовки) ответа на отказ."""
+        headers = {} if reason == 'too_large' else {"Retry-After": str(self.retry_after)}
+        return REJECT_STATUS[reason], {"status": "error", "message": reason}, headers
+
+    def _take_token(self, client: str) -> bool:
+        now = time.monotonic()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            self._prune(now)
+            bucket = self._buckets[client] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+            bucket.updated_at = now
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def _prune(self, now: float):
+        # Случайные клиенты (сканеры портов и т.п.) не должны копить корзины бесконечно
+        if now - self._last_prune < _BUCKET_IDLE_TTL:
+            return
+        self._last_prune = now
+        for client in [c for c, b in self._buckets.items() if now - b.updated_at > _BUCKET_IDLE_TTL]:
+            del self._buckets[client]
+
+    def status(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "cameras_tracked": len(self._buckets),
+            "rejected": dict(self.rejected),
+        }
@@ -0,0 +1,539 @@
+# services/alert_stream.py
+import asyncio
+import fcntl
+import logging
+import random
+import re
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import SplitResult, quote, unquote, urlsplit, urlunsplit
+
+import httpx
+from python_multipart.multipart import parse_options_header
+
+from config.config import (
+    ALERT_STREAM_CAMERAS,
+    CAMERA_DEFAULT_USERNAME,
+    CAMERA_DEFAULT_PASSWORD,
+    ALERT_STREAM_MAX_PART_BYTES,
+    ALERT_STREAM_IDLE_TIMEOUT,
+    ALERT_STREAM_BACKOFF_BASE,
+    ALERT_STREAM_BACKOFF_MAX,
+    ALERT_STREAM_STARTUP_SPREAD,
+    ALERT_STREAM_LOCK_PATH,
+)
+from services.anpr_xml import peek_event_type
+from services.camera_registry import CameraRegistry, get_camera_registry
+from services.metrics import STREAM_CONNECTED
+from services.multipart_stream import IMAGE_PRIORITY, StreamedEvent
+
+logger = logging.getLogger(__name__)
+
+ALERT_STREAM_PATH = "/ISAPI/Event/notification/alertStream"
+
+_CONTENT_LENGTH_RE = re.compile(rb'content-length:\s*(\d+)', re.IGNORECASE)
+_PIC_NUM_RE = re.compile(rb'<(?:\w+:)?picNum>\s*(\d+)\s*<')
+_XML_END = b'</EventNotificationAlert>'
+# Буфер не сжимается при каждом чтении: съеденный префикс удаляется пачкой
+_COMPACT_THRESHOLD = 64 * 1024
+_MAX_HEADERS_SIZE = 16 * 1024
+
+
+class StreamPart:
+    """Одна завершенная часть multipart/mixed: заголовки (ключи в нижнем регистре) и тело."""
+    __slots__ = ('headers', 'body')
+
+    def __init__(self, headers: Dict[str, str], body: bytes):
+        self.headers = headers
+        self.body = body
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get('content-type', '').lower()
+
+    @property
+    def name(self) -> str:
+        _, options = parse_options_header(self.headers.get('content-disposition', ''))
+        raw = options.get(b'name') or options.get(b'filename') or b''
+        return raw.decode('latin-1')
+
+    @property
+    def is_xml(self) -> bool:
+        return 'xml' in self.content_type or self.name.lower().endswith('.xml') \
+            or (not self.content_type and self.body.lstrip()[:1] == b'<')
+
+
+class MultipartMixedParser:
+    """
+    Инкрементальный разбор бесконечного multipart/mixed потока alertStream.
+    feed() принимает очередной кусок и сразу возвращает все завершенные части.
+    Данные копятся в одном bytearray с позицией чтения; прочитанный префикс удаляется
+    пачкой, поэтому каждый байт копируется O(1) раз. Размер незавершенной части ограничен
+    max_part_size: слишком большая часть пропускается до следующего разделителя.
+    Без boundary (камера шлет XML подряд) части режутся по </EventNotificationAlert>.
+    """
+    def __init__(self, boundary: Optional[bytes], max_part_size: int = ALERT_STREAM_MAX_PART_BYTES):
+        self.boundary = boundary
+        self.max_part_size = max_part_size
+        self.dropped_parts = 0
+        self._delimiter = b'--' + boundary if boundary else None
+        self._buf = bytearray()
+        self._pos = 0
+        self._state = 'preamble'  # preamble | headers | body | skip
+        self._headers: Dict[str, str] = {}
+        self._length: Optional[int] = None
+        self._scan_from = 0
+
+    @classmethod
+    def from_content_type(cls, content_type: str, **kwargs) -> "MultipartMixedParser":
+        ctype, options = parse_options_header(content_type or '')
+        boundary = options.get(b'boundary') if ctype.startswith(b'multipart/') else None
+        return cls(boundary.strip(b'"') if boundary else None, **kwargs)
+
+    def feed(self, chunk: bytes) -> List[StreamPart]:
+        self._buf += chunk
+        parts: List[StreamPart] = []
+        if self._delimiter is None:
+            self._split_xml(parts)
+        else:
+            while self._step(parts):
+                pass
+        self._compact()
+        return parts
+
+    # --- Разбор ---
+
+    def _step(self, parts: List[StreamPart]) -> bool:
+        if self._state in ('preamble', 'skip'):
+            index = self._buf.find(self._delimiter, max(self._pos, self._scan_from))
+            if index == -1:
+                # Разделитель может быть разрезан между кусками: оставляем его возможный хвост
+                self._scan_from = max(self._pos, len(self._buf) - len(self._delimiter))
+                if self._state == 'skip' or self._scan_from - self._pos > self.max_part_size:
+                    self._pos = self._scan_from
+                return False
+            line_end = self._buf.find(b'\n', index)
+            if line_end == -1:
+                self._pos = index
+                return False
+            self._pos = line_end + 1
+            self._state = 'headers'
+            self._scan_from = 0
+            return True
+
+        if self._state == 'headers':
+            end = self._buf.find(b'\r\n\r\n', self._pos)
+            sep = 4
+            if end == -1:
+                end, sep = self._buf.find(b'\n\n', self._pos), 2
+            if end == -1:
+                if len(self._buf) - self._pos > _MAX_HEADERS_SIZE:
+                    self._drop("headers too large")
+                return False
+            self._headers = self._parse_headers(bytes(self._buf[self._pos:end]))
+            match = _CONTENT_LENGTH_RE.search(self._buf, self._pos, end)
+            self._length = int(match.group(1)) if match else None
+            self._pos = end + sep
+            if self._length is not None and self._length > self.max_part_size:
+                self._drop(f"part of {self._length} bytes exceeds limit")
+                return True
+            self._state = 'body'
+            self._scan_from = self._pos
+            return True
+
+        # body
+        if self._length is not None:
+            if len(self._buf) - self._pos < self._length:
+                return False
+            body = bytes(self._buf[self._pos:self._pos + self._length])
+            self._pos += self._length
+        else:
+            marker = b'\r\n' + self._delimiter
+            index = self._buf.find(marker, self._scan_from)
+            if index == -1:
+                self._scan_from = max(self._pos, len(self._buf) - len(marker))
+                if len(self._buf) - self._pos > self.max_part_size:
+                    self._drop("part exceeds limit")
+                return False
+            body = bytes(self._buf[self._pos:index])
+            self._pos = index + 2
+        parts.append(StreamPart(self._headers, body))
+        self._state = 'preamble'
+        self._scan_from = self._pos
+        return True
+
+    def _split_xml(self, parts: List[StreamPart]):
+        while True:
+            index = self._buf.find(_XML_END, max(self._pos, self._scan_from))
+            if index == -1:
+                self._scan_from = max(self._pos, len(self._buf) - len(_XML_END))
+                if len(self._buf) - self._pos > self.max_part_size:
+                    self.dropped_parts += 1
+                    logger.warning("alertStream XML exceeds limit, dropped")
+                    self._pos = self._scan_from
+                return
+            end = index + len(_XML_END)
+            body = bytes(self._buf[self._pos:end]).strip()
+            self._pos = self._scan_from = end
+            if body:
+                parts.append(StreamPart({'content-type': 'application/xml'}, body))
+
+    def _drop(self, reason: str):
+        self.dropped_parts += 1
+        logger.warning(f"alertStream part dropped: {reason}")
+        self._state = 'skip'
+        self._scan_from = self._pos
+
+    @staticmethod
+    def _parse_headers(raw: bytes) -> Dict[str, str]:
+        headers = {}
+        for line in raw.decode('latin-1').splitlines():
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        return headers
+
+    def _compact(self):
+        if self._pos > _COMPACT_THRESHOLD and self._pos * 2 > len(self._buf):
+            del self._buf[:self._pos]
+            self._scan_from = max(self._scan_from - self._pos, 0)
+            self._pos = 0
+
+
+class AlertEventAssembler:
+    """
+    Собирает события из частей alertStream: XML и следующие за ним изображения.
+    Событие отдается, как только пришли все picNum изображений, либо сразу,
+    если изображений не ожидается; незавершенное событие закрывается следующим XML.
+    """
+    def __init__(self):
+        self._event: Optional[StreamedEvent] = None
+        self._expected = 0
+        self._received = 0
+
+    def add(self, part: StreamPart) -> List[StreamedEvent]:
+        ready = []
+        if part.is_xml:
+            if self._event is not None:
+                ready.append(self._finish())
+            self._event = StreamedEvent()
+            self._event.xml_bytes = part.body
+            self._event.event_type = peek_event_type(part.body)
+            self._event.part_names.append(part.name or 'alert.xml')
+            match = _PIC_NUM_RE.search(part.body)
+            self._expected = int(match.group(1)) if match else 0
+            self._received = 0
+        elif self._event is not None:
+            name = part.name
+            self._event.part_names.append(name)
+            self._received += 1
+            if name in IMAGE_PRIORITY and (
+                    self._event.image_name is None
+                    or IMAGE_PRIORITY.index(name) < IMAGE_PRIORITY.index(self._event.image_name)):
+                self._event.image_name = name
+                self._event.image_bytes = part.body
+        if self._event is not None and self._received >= self._expected:
+            ready.append(self._finish())
+        return ready
+
+    def flush(self) -> List[StreamedEvent]:
+        return [self._finish()] if self._event is not None else []
+
+    def _finish(self) -> StreamedEvent:
+        event, self._event = self._event, None
+        return event
+
+
+EventHandler = Callable[[StreamedEvent, str], Awaitable[None]]
+
+
+class CameraHealth:
+    """Состояние подключения к alertStream одной камеры (для /alert_stream/health и логов)."""
+    __slots__ = ('host', 'state', 'connected_since', 'last_data_at', 'last_heartbeat_at',
+                 'last_event_at', 'events', 'heartbeats', 'reconnects', 'failures', 'last_error')
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = 'starting'  # starting | connecting | connected | backoff | stopped
+        self.connected_since: Optional[float] = None
+        self.last_data_at: Optional[float] = None
+        self.last_heartbeat_at: Optional[float] = None
+        self.last_event_at: Optional[float] = None
+        self.events = 0
+        self.heartbeats = 0
+        self.reconnects = 0
+        self.failures = 0  # подряд неудачных подключений, сбрасывается после получения данных
+        self.last_error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def parse_stream_host(host: str) -> SplitResult:
+    """Разбирает адрес камеры (IP, user:password@IP или URL). ValueError - если в нем нет хоста или порт неверный."""
+    # В тексте ошибки - адрес без учетных данных
+    address = host.rpartition('@')[2]
+    try:
+        parsed = urlsplit(host if '://' in host else f"http://{host}")
+        parsed.port
+    except ValueError as e:
+        raise ValueError(f"invalid alertStream camera address '{address}': {e}") from None
+    if not parsed.hostname:
+        raise ValueError(f"invalid alertStream camera address '{address}': no host")
+    return parsed
+
+
+class CameraStream:
+    """
+    Долгоживущее подключение к alertStream одной камеры (pull-режим для камер,
+    которые не умеют HTTP push). Каждое событие передается в on_event сразу после
+    получения его последней части - тот же конвейер, что и у /firmware_v5.
+    Отсутствие данных дольше idle_timeout (камера шлет heartbeat) считается обрывом;
+    переподключение идет с экспоненциальной задержкой и полным джиттером.
+    """
+    def __init__(self, host: str, client: httpx.AsyncClient, on_event: EventHandler,
+                 username: str = CAMERA_DEFAULT_USERNAME, password: str = CAMERA_DEFAULT_PASSWORD,
+                 idle_timeout: float = ALERT_STREAM_IDLE_TIMEOUT,
+                 backoff_base: float = ALERT_STREAM_BACKOFF_BASE,
+                 backoff_max: float = ALERT_STREAM_BACKOFF_MAX,
+                 max_part_size: int = ALERT_STREAM_MAX_PART_BYTES):
+        parsed = parse_stream_host(host)
+        # Учетные данные камеры можно задать прямо в адресе: user:password@ip
+        self.host = parsed.hostname + (f":{parsed.port}" if parsed.port else '')
+        self.url = urlunsplit((parsed.scheme, self.host, parsed.path or ALERT_STREAM_PATH, parsed.query, ''))
+        self.auth = httpx.DigestAuth(unquote(parsed.username or username), unquote(parsed.password or password))
+        self.client = client
+        self.on_event = on_event
+        self.timeout = httpx.Timeout(10.0, read=idle_timeout)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_part_size = max_part_size
+        self.health = CameraHealth(self.host)
+
+    async def run(self, initial_delay: float = 0.0):
+        health = self.health
+        try:
+            if initial_delay:
+                await asyncio.sleep(initial_delay)
+            while True:
+                health.state = 'connecting'
+                try:
+                    await self._consume()
+                    health.last_error = 'closed by camera'
+                except httpx.HTTPStatusError as e:
+                    health.last_error = f"HTTP {e.response.status_code}"
+                except httpx.ReadTimeout:
+                    health.last_error = 'idle timeout'
+                except (httpx.HTTPError, OSError) as e:
+                    health.last_error = repr(e)
+                health.state = 'backoff'
+                health.connected_since = None
+                health.reconnects += 1
+                health.failures += 1
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (health.failures - 1)))
+                logger.warning(f"alertStream {self.host}: {health.last_error}, reconnect in {delay:.1f}s")
+                STREAM_CONNECTED.labels(self.host).set(0)
+                await asyncio.sleep(delay)
+        finally:
+            health.state = 'stopped'
+            STREAM_CONNECTED.labels(self.host).set(0)
+
+    async def _consume(self):
+        health = self.health
+        async with self.client.stream('GET', self.url, auth=self.auth, timeout=self.timeout) as response:
+            response.raise_for_status()
+            parser = MultipartMixedParser.from_content_type(
+                response.headers.get('content-type', ''), max_part_size=self.max_part_size)
+            assembler = AlertEventAssembler()
+            health.state = 'connected'
+            health.connected_since = time.time()
+            STREAM_CONNECTED.labels(self.host).set(1)
+            logger.info(f"alertStream {self.host} connected")
+            async for chunk in response.aiter_raw():
+                health.last_data_at = time.time()
+                health.failures = 0
+                for part in parser.feed(chunk):
+                    for event in assembler.add(part):
+                        await self._dispatch(event)
+            for event in assembler.flush():
+                await self._dispatch(event)
+
+    async def _dispatch(self, event: StreamedEvent):
+        health = self.health
+        if event.image_bytes is None and _is_heartbeat(event.xml_bytes):
+            health.heartbeats += 1
+            health.last_heartbeat_at = time.time()
+            return
+        health.events += 1
+        health.last_event_at = time.time()
+        try:
+            await self.on_event(event, self.host)
+        except Exception as e:
+            logger.exception(f"alertStream {self.host} event handling failed: {e}")
+
+
+def _is_heartbeat(xml_bytes: Optional[bytes]) -> bool:
+    # Камеры Hikvision шлют в alertStream heartbeat как videoloss/inactive
+    head = (xml_bytes or b'')[:2048]
+    return b'videoloss' in head and b'inactive' in head
+
+
+def registry_alert_stream_hosts(registry: Optional[CameraRegistry] = None) -> List[str]:
+    """Адреса user:password@ip камер, помеченных в реестре "alert_stream": true."""
+    registry = registry or get_camera_registry()
+    return [f"{quote(c.username, safe='')}:{quote(c.password, safe='')}@{c.ip}"
+            for c in registry.alert_stream_cameras()]
+
+
+def _log_stream_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"{task.get_name()} stopped: {task.exception()!r}")
+
+
+class AlertStreamSupervisor:
+    """
+    Держит alertStream-подключения ко всем камерам в одном процессе: один общий
+    httpx-клиент (пул соединений), по одной корутине на камеру, старт размазан
+    по startup_spread секунд. При нескольких воркерах uvicorn потоки держит только
+    процесс, захвативший flock на lock_path; остальные периодически пробуют его
+    захватить и подхватывают камеры, если владелец умер. lock_path=None - без блокировки.
+    Камеры из реестра отслеживаются при его перезагрузке: новые подключаются, удаленные отключаются.
+    """
+    def __init__(self, on_event: EventHandler, hosts: Optional[List[str]] = None,
+                 lock_path: Optional[str] = ALERT_STREAM_LOCK_PATH,
+                 startup_spread: float = ALERT_STREAM_STARTUP_SPREAD,
+                 registry: Optional[CameraRegistry] = None, **stream_options):
+        """
+        hosts - явный список адресов; иначе ALERT_STREAM_CAMERAS, иначе камеры реестра.
+        Бросает ValueError, если в явном списке есть неверный адрес; такие камеры реестра пропускаются.
+        """
+        self.on_event = on_event
+        hosts = ALERT_STREAM_CAMERAS if hosts is None else hosts
+        if hosts:
+            for host in hosts:
+                parse_stream_host(host)
+            self.hosts = list(hosts)
+        else:
+            registry = registry or get_camera_registry()
+            self.hosts = self._valid_hosts(registry_alert_stream_hosts(registry))
+            registry.on_reload(lambda reg: self._set_hosts(self._valid_hosts(registry_alert_stream_hosts(reg))))
+        self.lock_path = Path(lock_path) if lock_path else None
+        self.startup_spread = startup_spread
+        self.stream_options = stream_options
+        self.streams: Dict[str, CameraStream] = {}
+        self._stream_tasks: Dict[str, asyncio.Task] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._started = False
+        self._lock_file = None
+
+    @staticmethod
+    def _valid_hosts(hosts: List[str]) -> List[str]:
+        valid = []
+        for host in hosts:
+            try:
+                parse_stream_host(host)
+            except ValueError as e:
+                logger.error(f"Skipping alertStream camera: {e}")
+                continue
+            valid.append(host)
+        return valid
+
+    def start(self):
+        self._started = True
+        # Без камер задача не нужна; она запустится, если камеры появятся при перезагрузке реестра
+        if self.hosts and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="alert-stream")
+
+    async def stop(self):
+        self._started = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def run_forever(self):
+        """Для отдельного процесса (scripts/event.py): работает до отмены. Без камер сразу возвращается."""
+        self.start()
+        if self._task is None:
+            logger.warning("No alertStream cameras configured, nothing to listen to")
+            return
+        try:
+            await self._task
+        finally:
+            await self.stop()
+
+    def health(self) -> dict:
+        streams = [stream.health.as_dict() for stream in self.streams.values()]
+        return {
+            # Камеры держит только один процесс; у остальных воркеров список пуст
+            "leader": self._client is not None,
+            "cameras": len(self.hosts),
+            "connected": sum(1 for s in streams if s['state'] == 'connected'),
+            "streams": streams,
+        }
+
+    def _try_lock(self) -> bool:
+        if self.lock_path is None:
+            return True
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _set_hosts(self, hosts: List[str]):
+        if hosts == self.hosts:
+            return
+        logger.info(f"alertStream cameras changed: {len(self.hosts)} -> {len(hosts)}")
+        self.hosts = hosts
+        if self._client is not None:
+            self._sync_streams(startup_spread=0.0)
+        elif self._started:
+            self.start()
+
+    def _sync_streams(self, startup_spread: float):
+        """Запускает потоки новых камер и останавливает потоки камер, которых больше нет в списке."""
+        for host in set(self.streams) - set(self.hosts):
+            self.streams.pop(host)
+            self._stream_tasks.pop(host).cancel()
+        for host in self.hosts:
+            if host in self.streams:
+                continue
+            stream = CameraStream(host, self._client, self.on_event, **self.stream_options)
+            self.streams[host] = stream
+            task = asyncio.create_task(stream.run(random.uniform(0, startup_spread)), name=f"alert-stream-{stream.host}")
+            task.add_done_callback(_log_stream_failure)
+            self._stream_tasks[host] = task
+
+    async def _run(self):
+        while not self._try_lock():
+            await asyncio.sleep(ALERT_STREAM_BACKOFF_MAX)
+        # Соединения долгоживущие, по одному на камеру; список камер может меняться
+        self._client = httpx.AsyncClient(limits=httpx.Limits(max_connections=None, max_keepalive_connections=None))
+        self._sync_streams(self.startup_spread)
+        logger.info(f"Consuming alertStream from {len(self.streams)} camera(s)")
+        try:
+            # Потоки работают до отмены; список обновляет _set_hosts при перезагрузке реестра
+            await asyncio.Event().wait()
+        finally:
+            tasks = list(self._stream_tasks.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.streams.clear()
+            self._stream_tasks.clear()
@@ -0,0 +1,103 @@
+# services/anpr_xml.py
+import html
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Dict, Optional
+
+# Локальное имя тега (без namespace) -> ключ результата.
+# Namespace не важен: isapi.org, hikvision.com и std-cgi.com обрабатываются одинаково.
+FIELD_TAGS = {
+    'eventType': 'event_type',
+    'eventState': 'event_state',
+    'licensePlate': 'license_plate',
+    'plateNumber': 'plate_number',
+    'color': 'color',
+    'country': 'country',
+    'ipAddress': 'ip_address',
+    'ipAddres': 'ip_address',
+    'macAddress': 'mac_address',
+    'dateTime': 'date_time',
+    'channelID': 'channel_id',
+    'dynChannelID': 'channel_id',
+    'channelName': 'channel_name',
+    'deviceId': 'device_id',
+    'deviceID': 'device_id',
+}
+
+FIELDS = tuple(dict.fromkeys(FIELD_TAGS.values()))
+
+# Один проход по сырым байтам: открывающий тег (с любым префиксом namespace), его текст
+# и следующий за текстом тег (group 3 - имя закрывающего тега, если это он).
+# Нужные поля у Hikvision всегда листовые и без CDATA, поэтому дерево не строится -
+# это в ~2-3 раза быстрее ET.fromstring + find('.//...') на реальных payload.
+_FIELD_RE = re.compile(
+    rb'<(?:[\w.-]+:)?(' + b'|'.join(tag.encode() for tag in FIELD_TAGS) + rb')(?:\s[^>]*)?>([^<]*)'
+    rb'<(?:/(?:[\w.-]+:)?([\w.-]+)\s*>)?'
+)
+_TAG_KEYS = {tag.encode(): key for tag, key in FIELD_TAGS.items()}
+# Корневой элемент: первый тег после пролога <?xml ...?> и комментариев
+_ROOT_RE = re.compile(rb'<(?![?!])((?:[\w.-]+:)?[\w.-]+)')
+
+
+def extract_anpr_fields(xml_bytes: bytes) -> Dict[str, Optional[str]]:
+    """
+    Извлекает из XML события Hikvision все используемые поля за один проход.
+    Возвращает словарь с ключами из FIELDS; отсутствующие поля равны None.
+    Берется первое вхождение тега (как root.find('.//tag')); номер берется
+    из licensePlate, а если его нет - из plateNumber.
+    Вместо полного разбора - дешевая проверка структуры: документ должен заканчиваться
+    закрывающим тегом корня, а каждое найденное поле - своим закрывающим тегом.
+    Бросает ET.ParseError, если на вход пришел не XML, он обрезан или поле не закрыто.
+    """
+    root = _ROOT_RE.search(xml_bytes)
+    if root is None:
+        raise ET.ParseError("no XML content")
+    # Закрывающий тег корня ищется с конца, без прохода по всему документу
+    tail = xml_bytes.rstrip()
+    close_at = tail.rfind(b'</')
+    if close_at < root.end() or not tail.endswith(b'>') or tail[close_at + 2:-1].rstrip() != root.group(1):
+        raise ET.ParseError(f"truncated XML: no closing tag for <{root.group(1).decode('utf-8', 'replace')}>")
+
+    fields: Dict[str, Optional[str]] = dict.fromkeys(FIELDS)
+    for match in _FIELD_RE.finditer(xml_bytes):
+        tag, closing = match.group(1), match.group(3)
+        if closing is None:
+            if not match.group(2).strip():
+                continue  # не листовой элемент с тем же именем: дальше идет вложенный тег
+            raise ET.ParseError(f"unclosed <{tag.decode()}>")
+        if closing != tag:
+            raise ET.ParseError(f"mismatched tag: <{tag.decode()}> closed by </{closing.decode('utf-8', 'replace')}>")
+        key = _TAG_KEYS[tag]
+        if fields[key] is not None:
+            continue
+        value = match.group(2).strip()
+        if value:
+            text = value.decode('utf-8', errors='replace')
+            fields[key] = html.unescape(text) if '&' in text else text
+
+    if fields['license_plate'] is None:
+        fields['license_plate'] = fields['plate_number']
+    return fields
+
+
+_EVENT_TYPE_RE = re.compile(rb'<(?:[\w.-]+:)?eventType(?:\s[^>]*)?>\s*([^<\s]+)\s*<')
+
+
+def peek_event_type(xml_bytes: Optional[bytes]) -> Optional[str]:
+    """Только eventType (первое вхождение) - для классификации события до разбора остальных полей."""
+    match = _EVENT_TYPE_RE.search(xml_bytes or b'')
+    return match.group(1).decode('utf-8', errors='replace') if match else None
+
+
+def parse_event_time(date_time: Optional[str]) -> Optional[float]:
+    """
+    dateTime камеры ('2026-10-18T10:00:00+05:00', '...Z' или без зоны - локальное время)
+    -> unix-время; None, если значение не разобрать.
+    """
+    if not date_time:
+        return None
+    try:
+        return datetime.fromisoformat(date_time.strip().replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
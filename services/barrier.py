@@ -0,0 +1,169 @@
+# services/barrier.py
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from config.config import (
+    BARRIER_CAMERAS,
+    BARRIER_TRIGGER_MODE,
+    BARRIER_IO_ID,
+    BARRIER_TIMEOUT,
+    BARRIER_KEEPALIVE_INTERVAL,
+)
+from services.camera_registry import Camera, CameraRegistry, get_camera_registry
+from services.metrics import BARRIER_LATENCY
+
+logger = logging.getLogger(__name__)
+
+TRIGGER_MODES = ('softInput', 'ioOutput')
+# Дешевый запрос для прогрева соединения и digest-nonce
+_WARMUP_PATH = "/ISAPI/System/IO/capabilities"
+
+
+class UnknownBarrierError(KeyError):
+    """Шлагбаум с таким именем камеры не настроен (реестр камер или BARRIER_CAMERAS)."""
+
+
+class _BarrierCamera:
+    """Камера, управляющая шлагбаумом: свой DigestAuth хранит последний challenge (nonce)."""
+    __slots__ = ('name', 'host', 'credentials', 'auth', 'last_latency', 'last_ok_at')
+
+    def __init__(self, name: str, host: str, username: str, password: str):
+        self.name = name
+        self.host = host
+        self.credentials = (username, password)
+        self.auth = httpx.DigestAuth(username, password)
+        self.last_latency: Optional[float] = None
+        self.last_ok_at: Optional[float] = None
+
+
+class BarrierController:
+    """
+    Открытие шлагбаумов через ISAPI камер Entry/Exit.
+    Соединения держатся открытыми (общий пул keep-alive), а httpx.DigestAuth после
+    первого 401 подписывает следующие запросы тем же nonce, поэтому открытие - один
+    PUT без лишнего круга challenge и TCP-handshake. Фоновая задача периодически
+    обновляет соединения, чтобы камера не закрыла их по простою.
+    """
+    def __init__(self, cameras: Optional[Dict[str, str]] = None,
+                 registry: Optional[CameraRegistry] = None,
+                 mode: str = BARRIER_TRIGGER_MODE, io_id: int = BARRIER_IO_ID,
+                 timeout: float = BARRIER_TIMEOUT, keepalive_interval: float = BARRIER_KEEPALIVE_INTERVAL):
+        """
+        cameras - явный словарь имя -> IP (учетные данные по умолчанию); иначе BARRIER_CAMERAS,
+        иначе камеры с "barrier": true из реестра, список обновляется при перезагрузке реестра.
+        """
+        if mode not in TRIGGER_MODES:
+            raise ValueError(f"Unknown barrier trigger mode '{mode}', expected one of {TRIGGER_MODES}")
+        cameras = BARRIER_CAMERAS if cameras is None else cameras
+        self.cameras: Dict[str, _BarrierCamera] = {}
+        if cameras:
+            self._set_cameras([Camera(name, ip=host) for name, host in cameras.items()])
+        else:
+            registry = registry or get_camera_registry()
+            self._set_cameras(registry.barrier_cameras())
+            registry.on_reload(lambda reg: self._set_cameras(reg.barrier_cameras()))
+        self.mode = mode
+        self.io_id = io_id
+        self.keepalive_interval = keepalive_interval
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(keepalive_expiry=keepalive_interval * 3),
+        )
+        self._task: Optional[asyncio.Task] = None
+
+    def _set_cameras(self, cameras: List[Camera]):
+        # Для неизменившихся камер сохраняем DigestAuth с уже полученным nonce
+        current = self.cameras
+        updated = {}
+        for camera in cameras:
+            existing = current.get(camera.name)
+            if existing is not None and (existing.host, existing.credentials) == (camera.ip, (camera.username, camera.password)):
+                updated[camera.name] = existing
+            else:
+                updated[camera.name] = _BarrierCamera(camera.name, camera.ip, camera.username, camera.password)
+        self.cameras = updated
+
+    def start(self):
+        # Камеры могут появиться позже, при перезагрузке реестра
+        self._task = asyncio.create_task(self._keepalive_loop(), name="barrier-keepalive")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.client.aclose()
+
+    async def open(self, camera: str) -> dict:
+        """
+        Открывает шлагбаум камеры camera. Возвращает {"camera", "ok", "status_code", "latency_ms"}.
+        Ошибки сети не пробрасываются: результат ok=False, подробности в логе.
+        """
+        target = self.cameras.get(camera)
+        if target is None:
+            raise UnknownBarrierError(camera)
+
+        start = time.perf_counter()
+        status_code = None
+        try:
+            response = await self._trigger(target)
+            status_code = response.status_code
+            ok = status_code == 200
+            if not ok:
+                logger.error(f"Failed to open barrier {camera}: HTTP {status_code} {response.text[:200]}")
+        except httpx.HTTPError as e:
+            ok = False
+            logger.error(f"Failed to open barrier {camera} at {target.host}: {e!r}")
+        latency = time.perf_counter() - start
+
+        target.last_latency = latency
+        if ok:
+            target.last_ok_at = time.time()
+            logger.info(f"Barrier {camera} opened in {latency * 1000:.1f} ms")
+        BARRIER_LATENCY.labels(camera, 'ok' if ok else 'error').observe(latency)
+        return {"camera": camera, "ok": ok, "status_code": status_code, "latency_ms": round(latency * 1000, 1)}
+
+    def _trigger(self, target: _BarrierCamera):
+        if self.mode == 'softInput':
+            return self.client.put(
+                f"http://{target.host}/ISAPI/System/IO/softInputs/trigger?format=json",
+                json={"SoftIO": [{"id": self.io_id, "triggerType": "stop"}]},
+                auth=target.auth,
+            )
+        return self.client.put(
+            f"http://{target.host}/ISAPI/System/IO/outputs/{self.io_id}/trigger",
+            content=b'<IOPortData version="2.0" xmlns="http://www.isapi.org/ver20/XMLSchema">'
+                    b'<outputState>high</outputState></IOPortData>',
+            headers={"Content-Type": "application/xml"},
+            auth=target.auth,
+        )
+
+    async def warmup(self):
+        """Открывает соединения и получает digest-nonce для всех камер заранее."""
+        await asyncio.gather(*(self._warmup_one(target) for target in self.cameras.values()))
+
+    async def _warmup_one(self, target: _BarrierCamera):
+        try:
+            await self.client.get(f"http://{target.host}{_WARMUP_PATH}", auth=target.auth)
+        except httpx.HTTPError as e:
+            logger.warning(f"Barrier camera {target.name} ({target.host}) warmup failed: {e!r}")
+
+    async def _keepalive_loop(self):
+        while True:
+            # Без настроенных шлагбаумов соединений не открываем
+            if self.cameras:
+                await self.warmup()
+            await asyncio.sleep(self.keepalive_interval)
+
+    def status(self) -> dict:
+        return {
+            name: {"host": target.host, "last_latency_ms": round(target.last_latency * 1000, 1)
+                   if target.last_latency is not None else None, "last_ok_at": target.last_ok_at}
+            for name, target in self.cameras.items()
+        }
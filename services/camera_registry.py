@@ -0,0 +1,200 @@
+# services/camera_registry.py
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from config.config import (
+    CAMERA_REGISTRY_PATH,
+    CAMERA_REGISTRY_RELOAD_INTERVAL,
+    CAMERA_171,
+    CAMERA_172,
+    CAMERA_ENTRY_IP,
+    CAMERA_ENTRY2_IP,
+    CAMERA_EXIT_IP,
+    CAMERA_EXIT2_IP,
+    CAMERA_EXIT2_BARRIER,
+    CAMERA_DEFAULT_USERNAME,
+    CAMERA_DEFAULT_PASSWORD,
+)
+
+logger = logging.getLogger(__name__)
+
+FIRMWARE_PROFILES = ('v4', 'v5')
+UNKNOWN_CAMERA = 'Unknown'
+
+_MAC_SEPARATORS = re.compile(r'[^0-9a-f]')
+
+
+def normalize_mac(mac: Optional[str]) -> Optional[str]:
+    return _MAC_SEPARATORS.sub('', mac.lower()) if mac else None
+
+
+class Camera:
+    """Одна камера из реестра: как она себя называет в событиях и что о ней знает сервис."""
+    __slots__ = ('name', 'direction', 'ip', 'channel', 'device_id', 'mac', 'firmware',
+                 'username', 'password', 'barrier', 'alert_stream')
+
+    def __init__(self, name: str, direction: Optional[str] = None, ip: Optional[str] = None,
+                 channel: Optional[str] = None, device_id: Optional[str] = None, mac: Optional[str] = None,
+                 firmware: str = 'v5', username: str = CAMERA_DEFAULT_USERNAME,
+                 password: str = CAMERA_DEFAULT_PASSWORD, barrier: bool = False, alert_stream: bool = False):
+        if firmware not in FIRMWARE_PROFILES:
+            raise ValueError(f"Camera '{name}': unknown firmware profile '{firmware}', expected one of {FIRMWARE_PROFILES}")
+        self.name = name
+        self.direction = direction
+        self.ip = ip
+        self.channel = str(channel) if channel is not None else None
+        self.device_id = device_id
+        self.mac = normalize_mac(mac)
+        self.firmware = firmware
+        self.username = username
+        self.password = password
+        self.barrier = barrier
+        self.alert_stream = alert_stream
+
+
+class _Snapshot:
+    """Неизменяемый набор индексов; при перезагрузке заменяется целиком одним присваиванием."""
+    def __init__(self, cameras: List[Camera], fallback: Dict[str, str]):
+        self.cameras = cameras
+        self.fallback = fallback
+        self.by_device_id = {c.device_id: c for c in cameras if c.device_id}
+        self.by_mac = {c.mac: c for c in cameras if c.mac}
+        self.by_ip_channel: Dict[Tuple[str, Optional[str]], Camera] = {}
+        for camera in cameras:
+            if camera.ip:
+                self.by_ip_channel[(camera.ip, camera.channel)] = camera
+                # Без канала камера находится по одному IP
+                self.by_ip_channel.setdefault((camera.ip, None), camera)
+
+
+def _legacy_snapshot() -> _Snapshot:
+    """
+    Реестр из прежних переменных окружения, если файла реестра нет. Шлагбаумом, как и
+    раньше (scripts/barrier.py), управляет только Exit, и только если его адрес задан явно.
+    """
+    cameras = []
+    for name, direction, ip, firmware, barrier in (
+            ("Entry", "entry", CAMERA_171 or CAMERA_ENTRY_IP, "v4", False),
+            ("Entry2", "entry", CAMERA_172 or CAMERA_ENTRY2_IP, "v4", False),
+            ("Exit", "exit", CAMERA_EXIT2_IP, "v5", CAMERA_EXIT2_BARRIER),
+            ("Exit1", "exit", CAMERA_EXIT_IP, "v5", False)):
+        if ip:
+            cameras.append(Camera(name, direction, ip, firmware=firmware, barrier=barrier))
+    # Все камеры v5 до появления реестра считались выездными
+    return _Snapshot(cameras, {"v5": "Exit"})
+
+
+def load_snapshot(path: str) -> _Snapshot:
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    defaults = data.get("defaults", {})
+    cameras = [Camera(**{**defaults, **item}) for item in data.get("cameras", [])]
+    names = [c.name for c in cameras]
+    if len(names) != len(set(names)):
+        raise ValueError("Camera names in the registry must be unique")
+    return _Snapshot(cameras, data.get("fallback", {}))
+
+
+class CameraRegistry:
+    """
+    Реестр камер из JSON-файла (CAMERA_REGISTRY_PATH, пример - config/cameras.example.json).
+    Камера события определяется по deviceID, MAC, IP+каналу или IP - каждое через dict.
+    Файл перечитывается при изменении (mtime/размер проверяются раз в reload_interval
+    секунд); ошибка в новом файле логируется, а в работе остается прежняя версия.
+    """
+    def __init__(self, path: str = CAMERA_REGISTRY_PATH, reload_interval: float = CAMERA_REGISTRY_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._signature = None
+        self._snapshot = _legacy_snapshot()
+        self._listeners = []
+        self._task: Optional[asyncio.Task] = None
+        self.reload_if_changed()
+
+    # --- Поиск ---
+
+    def resolve(self, ip: Optional[str] = None, channel: Optional[str] = None,
+                device_id: Optional[str] = None, mac: Optional[str] = None) -> Optional[Camera]:
+        snapshot = self._snapshot
+        camera = None
+        if device_id:
+            camera = snapshot.by_device_id.get(device_id)
+        if camera is None and mac:
+            camera = snapshot.by_mac.get(normalize_mac(mac))
+        if camera is None and ip:
+            camera = snapshot.by_ip_channel.get((ip, channel)) or snapshot.by_ip_channel.get((ip, None))
+        return camera
+
+    def fallback_name(self, firmware: str) -> str:
+        """Имя камеры для события, которое resolve() не нашел в реестре (по эндпоинту прошивки)."""
+        return self._snapshot.fallback.get(firmware, UNKNOWN_CAMERA)
+
+    @property
+    def cameras(self) -> List[Camera]:
+        return self._snapshot.cameras
+
+    def barrier_cameras(self) -> List[Camera]:
+        return [c for c in self._snapshot.cameras if c.barrier and c.ip]
+
+    def alert_stream_cameras(self) -> List[Camera]:
+        return [c for c in self._snapshot.cameras if c.alert_stream and c.ip]
+
+    # --- Перезагрузка ---
+
+    def on_reload(self, callback):
+        """callback(registry) вызывается после каждой успешной перезагрузки файла."""
+        self._listeners.append(callback)
+
+    def reload_if_changed(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            self._snapshot = load_snapshot(self.path)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Camera registry {self.path} is invalid, keeping previous version: {e}")
+            return False
+        logger.info(f"Camera registry loaded from {self.path}: {len(self._snapshot.cameras)} cameras")
+        for callback in self._listeners:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.exception(f"Camera registry reload listener failed: {e}")
+        return True
+
+    def start(self):
+        if self.reload_interval > 0:
+            self._task = asyncio.create_task(self._watch(), name="camera-registry")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            self.reload_if_changed()
+
+
+_registry: Optional[CameraRegistry] = None
+
+
+def get_camera_registry() -> CameraRegistry:
+    """Общий реестр процесса; файл читается при первом обращении."""
+    global _registry
+    if _registry is None:
+        _registry = CameraRegistry()
+    return _registry
@@ -0,0 +1,150 @@
+# services/circuit_breaker.py
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from config.config import (
+    SMART_PARKING_BREAKER_FAILURES,
+    SMART_PARKING_BREAKER_RECOVERY,
+    SMART_PARKING_BREAKER_HALF_OPEN_CALLS,
+    SMART_PARKING_MIN_CONCURRENCY,
+    SMART_PARKING_INITIAL_CONCURRENCY,
+    SMART_PARKING_MAX_CONCURRENCY,
+    SMART_PARKING_LATENCY_TARGET,
+)
+from services.metrics import CIRCUIT_STATE, CONCURRENCY_LIMIT
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """Запрос не отправлен: бэкенд недоступен, цепь разомкнута. retry_after - через сколько секунд пробовать."""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"circuit '{name}' is open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Предохранитель вокруг бэкенда: после failure_threshold ошибок подряд цепь
+    размыкается (open) и запросы отклоняются сразу, без ожидания таймаутов.
+    Через recovery_timeout секунд пропускается до half_open_max_calls пробных
+    запросов (half_open): успех замыкает цепь, ошибка снова размыкает.
+    """
+    def __init__(self, name: str, failure_threshold: int = SMART_PARKING_BREAKER_FAILURES,
+                 recovery_timeout: float = SMART_PARKING_BREAKER_RECOVERY,
+                 half_open_max_calls: int = SMART_PARKING_BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._state = CLOSED
+        self._probes = 0
+        CIRCUIT_STATE.labels(name).set(0)
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def retry_after(self) -> float:
+        if self._state != OPEN:
+            return 0.0
+        return max(self.recovery_timeout - (time.monotonic() - self.opened_at), 0.0)
+
+    def before_call(self):
+        """Бросает CircuitOpenError, если запрос сейчас отправлять нельзя."""
+        state = self.state
+        if state == OPEN:
+            raise CircuitOpenError(self.name, self.retry_after())
+        if state == HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                raise CircuitOpenError(self.name, 0.0)
+            self._probes += 1
+
+    def record_success(self):
+        self.failures = 0
+        if self._state != CLOSED:
+            logger.info(f"Circuit '{self.name}' closed: backend is responding again")
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self._state == HALF_OPEN or (self._state == CLOSED and self.failures >= self.failure_threshold):
+            logger.warning(f"Circuit '{self.name}' opened after {self.failures} failures, "
+                           f"next probe in {self.recovery_timeout:.0f}s")
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def record_cancelled(self):
+        # Отмененный пробный запрос не должен навсегда занять слот half_open
+        if self._state == HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    def _set_state(self, state: str):
+        self._state = state
+        self._probes = 0
+        CIRCUIT_STATE.labels(self.name).set(_STATE_VALUES[state])
+
+    def status(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "retry_after_s": round(self.retry_after(), 1)}
+
+
+class AdaptiveLimiter:
+    """
+    Лимит одновременных запросов по схеме AIMD: каждый быстрый успешный ответ
+    увеличивает лимит на 1/limit (примерно +1 за "круг" запросов), ошибка или ответ
+    медленнее latency_target уменьшает его вдвое - не чаще раза в latency_target секунд,
+    чтобы одна волна таймаутов не обнулила лимит.
+    """
+    def __init__(self, name: str, initial: int = SMART_PARKING_INITIAL_CONCURRENCY,
+                 min_limit: int = SMART_PARKING_MIN_CONCURRENCY,
+                 max_limit: int = SMART_PARKING_MAX_CONCURRENCY,
+                 latency_target: float = SMART_PARKING_LATENCY_TARGET,
+                 decrease_factor: float = 0.5):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._released = asyncio.Event()
+        CONCURRENCY_LIMIT.labels(name).set(self.limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    async def acquire(self):
+        # Между проверкой и увеличением счетчика нет await, поэтому гонок в одном event loop нет
+        while self._in_flight >= self.limit:
+            self._released.clear()
+            await self._released.wait()
+        self._in_flight += 1
+
+    def release(self, ok: Optional[bool], latency: float):
+        """ok=None (запрос отменен) не меняет лимит."""
+        self._in_flight -= 1
+        now = time.monotonic()
+        if ok and latency <= self.latency_target:
+            self._limit = min(self._limit + 1 / self._limit, self.max_limit)
+        elif ok is not None and now - self._last_decrease >= self.latency_target:
+            self._last_decrease = now
+            self._limit = max(self._limit * self.decrease_factor, self.min_limit)
+            logger.info(f"Concurrency limit for '{self.name}' decreased to {self.limit}")
+        CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+        self._released.set()
+
+    def status(self) -> dict:
+        return {"limit": self.limit, "in_flight": self._in_flight}
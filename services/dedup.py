@@ -0,0 +1,146 @@
+# services/dedup.py
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from config.config import (
+    DEDUP_ENABLED,
+    DEDUP_BACKEND,
+    DEDUP_WINDOW_SECONDS,
+    DEDUP_MAX_ENTRIES,
+    DEDUP_PATH,
+)
+from services.metrics import DEDUP
+
+logger = logging.getLogger(__name__)
+
+_NON_ALNUM = re.compile(r'[\W_]+', re.UNICODE)
+
+Key = Tuple[str, str]
+
+
+def normalize_plate(plate: str) -> str:
+    """Приводит номер к виду для сравнения: верхний регистр, без пробелов и разделителей."""
+    return _NON_ALNUM.sub('', plate).upper()
+
+
+class MemoryDedupBackend:
+    """LRU + TTL в памяти процесса: OrderedDict ключ -> время истечения окна."""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Key, float]" = OrderedDict()
+
+    def check_and_set(self, key: Key, now: float, window: float) -> bool:
+        expires_at = self._entries.get(key)
+        if expires_at is not None and expires_at > now:
+            return True
+        self._entries[key] = now + window
+        self._entries.move_to_end(key)
+        # Сначала выбрасываем просроченные с головы, затем лишние по LRU
+        while self._entries:
+            oldest_key, oldest_expires = next(iter(self._entries.items()))
+            if oldest_expires > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[oldest_key]
+        return False
+
+    def forget(self, key: Key):
+        self._entries.pop(key, None)
+
+    def close(self):
+        self._entries.clear()
+
+
+class SqliteDedupBackend:
+    """
+    Общее для всех воркеров окно дедупликации в локальном SQLite-файле.
+    Проверка и запись выполняются одним атомарным UPSERT.
+    """
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen (camera TEXT, plate TEXT, expires_at REAL, PRIMARY KEY (camera, plate))"
+        )
+        self._inserts = 0
+
+    def check_and_set(self, key: Key, now: float, window: float) -> bool:
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO seen (camera, plate, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (camera, plate) DO UPDATE SET expires_at = excluded.expires_at "
+                "WHERE seen.expires_at <= ?",
+                (key[0], key[1], now + window, now),
+            )
+            self._inserts += 1
+            if self._inserts >= self.max_entries:
+                # Периодически чистим просроченные записи, чтобы файл не рос
+                self._conn.execute("DELETE FROM seen WHERE expires_at <= ?", (now,))
+                self._inserts = 0
+            # rowcount == 0: запись существует и окно еще не истекло
+            return cur.rowcount == 0
+
+    def forget(self, key: Key):
+        with self._lock:
+            self._conn.execute("DELETE FROM seen WHERE camera = ? AND plate = ?", key)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PlateDeduplicator:
+    """
+    Подавляет повторные чтения одного номера с одной камеры в пределах окна window секунд
+    (повторы ANPR, httpBroken-досылки, машина стоит у шлагбаума).
+    """
+    def __init__(self, enabled: bool = DEDUP_ENABLED, backend: str = DEDUP_BACKEND,
+                 window: float = DEDUP_WINDOW_SECONDS, max_entries: int = DEDUP_MAX_ENTRIES,
+                 path: str = DEDUP_PATH):
+        self.enabled = enabled
+        self.window = window
+        self.backend_name = backend
+        if backend == 'sqlite':
+            self._backend = SqliteDedupBackend(path, max_entries)
+        elif backend == 'memory':
+            self._backend = MemoryDedupBackend(max_entries)
+        else:
+            raise ValueError(f"Unknown dedup backend '{backend}', expected 'memory' or 'sqlite'")
+
+    async def is_duplicate(self, camera: Optional[str], plate: Optional[str]) -> bool:
+        """True, если такой номер с этой камеры уже был в текущем окне."""
+        if not self.enabled or not plate:
+            return False
+        key = (camera or 'Unknown', normalize_plate(plate))
+        now = time.time()
+        if self.backend_name == 'sqlite':
+            duplicate = await asyncio.to_thread(self._backend.check_and_set, key, now, self.window)
+        else:
+            duplicate = self._backend.check_and_set(key, now, self.window)
+        DEDUP.labels('suppressed' if duplicate else 'passed').inc()
+        if duplicate:
+            logger.debug("Duplicate plate %s from %s suppressed (window %ss)", plate, key[0], self.window)
+        return duplicate
+
+    async def forget(self, camera: Optional[str], plate: Optional[str]):
+        """Снимает номер с окна: следующее чтение с этой камеры не будет считаться повтором."""
+        if not self.enabled or not plate:
+            return
+        key = (camera or 'Unknown', normalize_plate(plate))
+        if self.backend_name == 'sqlite':
+            await asyncio.to_thread(self._backend.forget, key)
+        else:
+            self._backend.forget(key)
+
+    def close(self):
+        self._backend.close()
@@ -0,0 +1,383 @@
+# services/event_pipeline.py
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from functools import partial
+from typing import Dict, List, Optional
+
+from config.config import (
+    IMAGE_ARCHIVE_ENABLED,
+    EVENT_PRIORITY_TYPES,
+    EVENT_LOW_PRIORITY_MODE,
+    EVENT_LOW_PRIORITY_QUEUE_SIZE,
+)
+from services.anpr_xml import extract_anpr_fields, parse_event_time, peek_event_type
+from services.camera_registry import CameraRegistry, UNKNOWN_CAMERA, normalize_mac
+from services.dedup import normalize_plate
+from services.logging_setup import payload_logger, should_log_payload
+from services.metrics import StageTimer
+from services.multipart_stream import StreamedEvent
+
+logger = logging.getLogger(__name__)
+
+# Итог обработки события (метка outcome в метриках)
+FORWARDED = 'forwarded'
+DUPLICATE = 'duplicate'
+SKIPPED = 'skipped'
+# Событие не из EVENT_PRIORITY_TYPES: отброшено или отложено в фоновую полосу
+IGNORED = 'ignored'
+DEFERRED = 'deferred'
+LOW_PRIORITY_MODES = ('drop', 'defer')
+EVENT_ID_LENGTH = 20
+
+
+def make_event_id(fields: Optional[Dict[str, Optional[str]]], plate: Optional[str]) -> str:
+    """
+    Детерминированный event_id (он же trace id события в логах, метриках, архиве и SmartParking):
+    хэш адреса камеры (deviceID, MAC, IP, канал), ее собственного dateTime, типа события и номера.
+    Повтор того же события камерой или приход его и по push, и по alertStream дает тот же id.
+    Без dateTime повтор не распознать, и id случайный.
+    """
+    if not fields or not fields['date_time']:
+        return uuid.uuid4().hex[:EVENT_ID_LENGTH]
+    key = '|'.join((
+        fields['device_id'] or '', normalize_mac(fields['mac_address']) or '',
+        fields['ip_address'] or '', fields['channel_id'] or '',
+        fields['date_time'], fields['event_type'] or '', normalize_plate(plate) if plate else '',
+    ))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:EVENT_ID_LENGTH]
+
+
+class AnprEvent:
+    """
+    Событие камеры на всех стадиях конвейера. Стадии заполняют поля по очереди:
+    decode - xml_bytes/image_*, extract - fields, enrich - камеру, номер и event_id,
+    dispatch - image_path и outcome (persist пишет изображение после решения).
+    """
+    __slots__ = ('source_endpoint', 'firmware', 'xml_bytes', 'image_bytes', 'image_name', 'fields',
+                 'event_type', 'license_plate', 'color', 'country', 'ip_address', 'camera',
+                 'event_id', 'image_path', 'errors', 'outcome')
+
+    def __init__(self, source_endpoint: str, firmware: str, xml_bytes: Optional[bytes] = None,
+                 image_bytes: Optional[bytes] = None, image_name: Optional[str] = None):
+        self.source_endpoint = source_endpoint
+        self.firmware = firmware
+        self.xml_bytes = xml_bytes
+        self.image_bytes = image_bytes
+        self.image_name = image_name
+        self.fields: Optional[Dict[str, Optional[str]]] = None
+        self.event_type: Optional[str] = None
+        self.license_plate: Optional[str] = None
+        self.color = 'default'
+        self.country = 'default'
+        self.ip_address: Optional[str] = None
+        self.camera = UNKNOWN_CAMERA
+        self.event_id: Optional[str] = None
+        self.image_path: Optional[str] = None
+        self.errors: List[str] = []
+        self.outcome: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        """Данные события для JSON-ответа /test и логов (без буфера изображения)."""
+        return {
+            "license_plate": self.license_plate,
+            "event_id": self.event_id,
+            "main_image_path": self.image_path,
+            "main_image_original_name": self.image_name,
+            "ipaddres": self.ip_address,
+            "camera": self.camera,
+            "color": self.color,
+            "license_plate_country": self.country,
+            "parsing_errors": self.errors,
+        }
+
+    def delivery_payload(self) -> dict:
+        """Запись для outbox: поля запроса в SmartParking (services/send_smart_parking.py)."""
+        return dict(
+            camera_name=self.camera,
+            main_image_path=self.image_path,
+            main_image_original_name=self.image_name,
+            license_plate=self.license_plate,
+            license_plate_country=self.country,
+            color=self.color,
+            event_id=self.event_id,
+        )
+
+
+class FirmwareAdapter(ABC):
+    """
+    Отличия прошивок камер в одном месте: какие события несут номер и откуда берутся
+    цвет/страна. Остальные стадии (и event_id) общие.
+    """
+    name = ''
+
+    @abstractmethod
+    def expects_plate(self, event: AnprEvent) -> bool:
+        """Должно ли событие нести номер (иначе его отсутствие - не ошибка)."""
+
+    @abstractmethod
+    def enrich(self, event: AnprEvent):
+        """Заполняет license_plate, color и country из event.fields."""
+
+
+class V4Adapter(FirmwareAdapter):
+    """
+    Прошивка v4 (/test): номер берется из любого события, цвет и страна не передаются.
+    """
+    name = 'v4'
+
+    def expects_plate(self, event: AnprEvent) -> bool:
+        return True
+
+    def enrich(self, event: AnprEvent):
+        event.license_plate = event.fields['license_plate']
+
+
+class V5Adapter(FirmwareAdapter):
+    """Прошивка v5 (/firmware_v5, alertStream): номер, цвет и страна только у событий ANPR."""
+    name = 'v5'
+
+    def expects_plate(self, event: AnprEvent) -> bool:
+        return event.event_type == 'ANPR'
+
+    def enrich(self, event: AnprEvent):
+        fields = event.fields
+        if event.event_type == 'ANPR':
+            event.license_plate = fields['license_plate']
+            if fields['color'] and fields['color'] != 'unknown':
+                event.color = fields['color']
+            event.country = fields['country'] or 'default'
+
+
+FIRMWARE_ADAPTERS: Dict[str, FirmwareAdapter] = {adapter.name: adapter for adapter in (V4Adapter(), V5Adapter())}
+
+
+class EventPipeline:
+    """
+    Один конвейер для /test, /firmware_v5 и alertStream:
+    classify -> decode -> extract -> enrich -> dispatch -> persist.
+    Изображение пишется в архив после dispatch и только для событий, которые не оказались
+    повтором: повторные чтения и повторы камеры не стоят записи на диск.
+    Прошивка по умолчанию задается эндпоинтом; если камера есть в реестре,
+    используется адаптер ее профиля (firmware) из реестра.
+
+    classify смотрит только eventType: события с номерами (EVENT_PRIORITY_TYPES) идут
+    по конвейеру сразу, остальные отбрасываются или откладываются в очередь низкого
+    приоритета (low_priority_mode). Фоновая полоса разбирает отложенные события, только
+    пока нет событий с номерами в обработке, поэтому поток VMD не задерживает шлагбаум.
+    """
+    def __init__(self, image_archive, dedup, access_rules, delivery, camera_registry: CameraRegistry,
+                 priority_types=EVENT_PRIORITY_TYPES, low_priority_mode: str = EVENT_LOW_PRIORITY_MODE,
+                 low_priority_queue_size: int = EVENT_LOW_PRIORITY_QUEUE_SIZE):
+        if low_priority_mode not in LOW_PRIORITY_MODES:
+            raise ValueError(f"Unknown low priority mode '{low_priority_mode}', expected one of {LOW_PRIORITY_MODES}")
+        self.image_archive = image_archive
+        self.dedup = dedup
+        self.access_rules = access_rules
+        self.delivery = delivery
+        self.camera_registry = camera_registry
+        self.priority_types = frozenset(priority_types)
+        self.low_priority_mode = low_priority_mode
+        self._low_queue: asyncio.Queue = asyncio.Queue(maxsize=low_priority_queue_size)
+        self._low_dropped = 0
+        self._high_in_flight = 0
+        self._high_idle = asyncio.Event()
+        self._high_idle.set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.low_priority_mode == 'defer':
+            self._task = asyncio.create_task(self._run_low_priority())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def is_priority(self, event_type: Optional[str]) -> bool:
+        """Нужна ли событию полная обработка сразу (и его изображения)."""
+        return event_type is None or event_type in self.priority_types
+
+    async def handle(self, streamed: StreamedEvent, firmware: str, timer: StageTimer,
+                     source_endpoint: str) -> AnprEvent:
+        """
+        Точка входа эндпоинтов. Итог в event.outcome: forwarded | duplicate | skipped
+        для событий с номерами, ignored | deferred для остальных.
+        """
+        event_type = streamed.event_type or peek_event_type(streamed.xml_bytes)
+        if self.is_priority(event_type):
+            self._high_in_flight += 1
+            self._high_idle.clear()
+            try:
+                return await self.process(streamed, firmware, timer, source_endpoint)
+            finally:
+                self._high_in_flight -= 1
+                if not self._high_in_flight:
+                    self._high_idle.set()
+
+        event = AnprEvent(source_endpoint, firmware, streamed.xml_bytes)
+        event.event_type = event_type
+        event.outcome = IGNORED
+        if self.low_priority_mode == 'defer':
+            # Изображение отложенному событию не нужно: на диск оно не попадет
+            streamed.image_bytes = streamed.image_name = None
+            try:
+                self._low_queue.put_nowait((streamed, firmware, source_endpoint))
+                event.outcome = DEFERRED
+            except asyncio.QueueFull:
+                self._low_dropped += 1
+        timer.annotate(event_type=event_type)
+        return event
+
+    async def _run_low_priority(self):
+        while True:
+            streamed, firmware, source_endpoint = await self._low_queue.get()
+            await self._high_idle.wait()
+            timer = StageTimer('low_priority')
+            event = None
+            try:
+                event = await self.process(streamed, firmware, timer, source_endpoint)
+            except Exception as e:
+                logger.exception(f"Failed to process deferred event from {source_endpoint}: {e}")
+            finally:
+                timer.finish(event.camera if event else None, event.outcome if event else 'error')
+
+    def status(self) -> dict:
+        return {
+            "high_in_flight": self._high_in_flight,
+            "low_priority_mode": self.low_priority_mode,
+            "low_queue": self._low_queue.qsize(),
+            "low_dropped": self._low_dropped,
+        }
+
+    async def process(self, streamed: StreamedEvent, firmware: str, timer: StageTimer,
+                      source_endpoint: str) -> AnprEvent:
+        """Проводит событие через все стадии; итог в event.outcome: forwarded | duplicate | skipped."""
+        event = self.decode(streamed, firmware, source_endpoint)
+        self.extract(event, timer)
+        self.enrich(event)
+        timer.annotate(plate=event.license_plate, event_id=event.event_id)
+        if should_log_payload():
+            payload_logger.info(f"Event from {source_endpoint}: {event.as_dict()}\n"
+                                f"{(event.xml_bytes or b'').decode('utf-8', errors='replace')}")
+        await self.dispatch(event, timer)
+        return event
+
+    def decode(self, streamed: StreamedEvent, firmware: str, source_endpoint: str) -> AnprEvent:
+        event = AnprEvent(source_endpoint, firmware, streamed.xml_bytes, streamed.image_bytes, streamed.image_name)
+        if not event.xml_bytes:
+            logger.warning(f"XML part is missing in event from {source_endpoint}, parts: {streamed.part_names}")
+            event.errors.append("XML data part is missing")
+        if not event.image_bytes:
+            event.image_name = None
+            event.errors.append("No image data found")
+        return event
+
+    def extract(self, event: AnprEvent, timer: StageTimer):
+        if not event.xml_bytes:
+            return
+        try:
+            # Все поля за один проход, namespace isapi.org/hikvision.com/std-cgi.com не важен
+            with timer.stage('xml_extract'):
+                event.fields = extract_anpr_fields(event.xml_bytes)
+        except Exception as e:
+            logger.error(f"Failed to parse event XML from {event.source_endpoint}: {e}; "
+                         f"content: {event.xml_bytes[:500]!r}")
+            event.errors.append(f"XML parse error: {e}")
+            return
+        event.event_type = event.fields['event_type']
+        event.ip_address = event.fields['ip_address']
+
+    def enrich(self, event: AnprEvent):
+        fields = event.fields
+        if fields is None:
+            event.event_id = make_event_id(None, None)
+            return
+        camera = self.camera_registry.resolve(fields['ip_address'], fields['channel_id'],
+                                              fields['device_id'], fields['mac_address'])
+        if camera is not None:
+            event.camera = camera.name
+            event.firmware = camera.firmware
+        else:
+            event.camera = self.camera_registry.fallback_name(event.firmware)
+        adapter = FIRMWARE_ADAPTERS[event.firmware]
+        adapter.enrich(event)
+        event.event_id = make_event_id(fields, event.license_plate)
+        if adapter.expects_plate(event) and not event.license_plate:
+            event.errors.append(f"{event.event_type or 'Event'} without licensePlate in XML")
+        logger.debug("Extracted camera=%s firmware=%s event_type=%s plate=%s",
+                     event.camera, event.firmware, event.event_type, event.license_plate)
+
+    def plan_image(self, event: AnprEvent):
+        # Путь архивной копии нужен в payload outbox до записи файла. Имя файла - event_id,
+        # шард (дата/час) - по dateTime камеры: повтор события после смены часа попадет
+        # в тот же файл, а не оставит первый вне индекса
+        if not event.image_bytes or not IMAGE_ARCHIVE_ENABLED:
+            return
+        ext = '.png' if (event.image_name or '').lower().endswith('.png') else '.jpg'
+        occurred_at = parse_event_time(event.fields['date_time']) if event.fields else None
+        event.image_path = str(self.image_archive.path_for(event.event_id, event.camera, occurred_at, ext=ext))
+
+    def persist(self, event: AnprEvent, timer: StageTimer):
+        # В SmartParking изображение уходит из памяти, на диск пишется только архивная копия (в фоне).
+        # Повторы (dedup, event_id уже в outbox) сюда не доходят и диск не нагружают
+        if event.image_path is None:
+            return
+        try:
+            with timer.stage('image_save'):
+                self.image_archive.save(event.image_bytes, event.event_id, event.image_path)
+        except Exception as e:
+            logger.exception(f"Failed to schedule image archiving: {e}")
+            event.errors.append("Failed to save image")
+
+    async def dispatch(self, event: AnprEvent, timer: StageTimer):
+        """Решает судьбу события; изображение архивируется только для forwarded и skipped."""
+        self.plan_image(event)
+        if not event.license_plate:
+            logger.debug("Event %s from %s has no plate, skipped", event.event_type, event.camera)
+            event.outcome = SKIPPED
+            self.persist(event, timer)
+            return
+        # Повторное чтение того же номера с той же камеры в пределах окна не отправляем
+        dedup_camera = event.ip_address or event.camera
+        if await self.dedup.is_duplicate(dedup_camera, event.license_plate):
+            event.outcome = DUPLICATE
+            event.image_path = None
+            return
+        open_barrier = self.access_rules.should_open(event.camera, event.license_plate)
+        # Повтор события, которое еще ждет доставки в outbox, отсекается по event_id.
+        # Событие с разрешенным номером outbox придерживает до ответа шлагбаума (_barrier_done)
+        try:
+            row_id = await self.delivery.submit(event.delivery_payload(), image_bytes=event.image_bytes,
+                                                source_endpoint=event.source_endpoint,
+                                                received_at=time.time() - (time.perf_counter() - timer.started_at),
+                                                hold=self.access_rules.delivery_hold if open_barrier else 0.0)
+        except Exception:
+            # Событие не записано: повтор камеры не должен быть принят за дубликат
+            await self.dedup.forget(dedup_camera, event.license_plate)
+            raise
+        if row_id is None:
+            event.outcome = DUPLICATE
+            event.image_path = None
+            return
+        event.outcome = FORWARDED
+        self.persist(event, timer)
+        if open_barrier:
+            # Шлагбаум открывается в фоне: ответ камере его не ждет
+            self.access_rules.open(event.camera, event.license_plate,
+                                   on_done=partial(self._barrier_done, row_id, dedup_camera, event.license_plate))
+            timer.annotate(barrier_requested=True)
+
+    async def _barrier_done(self, row_id: int, dedup_camera: Optional[str], plate: str, ok: bool):
+        # barrier_opened уходит в SmartParking, только если камера подтвердила открытие.
+        # Иначе номер снимается с окна dedup, и следующее чтение повторит попытку
+        if not ok:
+            await self.dedup.forget(dedup_camera, plate)
+        await self.delivery.release(row_id, {'barrier_opened': True} if ok else None)
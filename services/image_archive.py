@@ -0,0 +1,185 @@
+# services/image_archive.py
+import asyncio
+import fcntl
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from config.config import (
+    IMAGE_ARCHIVE_PATH,
+    IMAGE_RETENTION_MAX_AGE_DAYS,
+    IMAGE_RETENTION_MAX_BYTES,
+    IMAGE_RETENTION_INTERVAL,
+)
+from services.image_store import ImageStore
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    event_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_created_at ON images (created_at);
+"""
+
+_UNSAFE_CHARS = re.compile(r'[^0-9A-Za-z_.-]+')
+# Сколько файлов удалять за одну транзакцию при очистке
+_EVICT_BATCH = 500
+
+
+def _safe_component(value: Optional[str], default: str) -> str:
+    value = _UNSAFE_CHARS.sub('_', value or '').strip('._')
+    return value or default
+
+
+class ImageArchive:
+    """
+    Архив изображений событий с разбиением на каталоги {дата}/{час}/{камера}/{event_id}.jpg.
+    Индекс event_id -> путь, размер, время хранится в SQLite (index.db в корне архива),
+    поэтому поиск файла по event_id не требует обхода каталогов, а фоновая задача
+    retention удаляет самые старые файлы по возрасту и по суммарному объему.
+    """
+    def __init__(self, image_store: ImageStore,
+                 root: str = IMAGE_ARCHIVE_PATH,
+                 max_age_days: float = IMAGE_RETENTION_MAX_AGE_DAYS,
+                 max_bytes: int = IMAGE_RETENTION_MAX_BYTES,
+                 retention_interval: float = IMAGE_RETENTION_INTERVAL):
+        self.store = image_store
+        self.root = Path(root)
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.retention_interval = retention_interval
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / "index.db"), check_same_thread=False,
+                                     isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._task: Optional[asyncio.Task] = None
+
+    def path_for(self, event_id: str, camera: Optional[str], timestamp: Optional[float] = None,
+                 ext: str = '.jpg') -> Path:
+        moment = time.localtime(timestamp if timestamp is not None else time.time())
+        return (self.root / time.strftime("%Y-%m-%d", moment) / time.strftime("%H", moment)
+                / _safe_component(camera, "unknown") / f"{_safe_component(event_id, 'event')}{ext}")
+
+    def save(self, data: bytes, event_id: str, path: Union[str, Path]) -> str:
+        """Планирует запись изображения по пути из path_for() и сразу возвращает его. Индекс обновляется после записи."""
+        return self.store.save(data, path, on_written=lambda p, size: self._index(event_id, p, size))
+
+    def find(self, event_id: str) -> Optional[str]:
+        """Путь к изображению события по индексу (O(1)) или None."""
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM images WHERE event_id = ?", (event_id,)).fetchone()
+        return row[0] if row else None
+
+    def _index(self, event_id: str, path: str, size: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (event_id, path, size, created_at) VALUES (?, ?, ?, ?)",
+                (event_id, path, size, time.time()),
+            )
+
+    # --- Retention ---
+
+    def start(self):
+        if self.max_age_days > 0 or self.max_bytes > 0:
+            self._task = asyncio.create_task(self._retention_loop(), name="image-retention")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        with self._lock:
+            self._conn.close()
+
+    async def _retention_loop(self):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.enforce_retention)
+                if removed:
+                    logger.info(f"Image retention removed {removed} files")
+            except Exception as e:
+                logger.exception(f"Image retention failed: {e}")
+            await asyncio.sleep(self.retention_interval)
+
+    def enforce_retention(self) -> int:
+        """
+        Удаляет файлы старше max_age_days, затем самые старые, пока объем больше max_bytes.
+        При нескольких воркерах проход выполняет только тот, кто захватил retention.lock.
+        """
+        with open(self.root / "retention.lock", 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            return self._enforce_retention()
+
+    def _enforce_retention(self) -> int:
+        removed = 0
+        if self.max_age_days > 0:
+            cutoff = time.time() - self.max_age_days * 86400
+            while True:
+                with self._lock:
+                    rows = self._conn.execute(
+                        "SELECT event_id, path, size FROM images WHERE created_at < ? ORDER BY created_at LIMIT ?",
+                        (cutoff, _EVICT_BATCH),
+                    ).fetchall()
+                if not rows:
+                    break
+                removed += self._evict(rows)
+
+        if self.max_bytes > 0:
+            with self._lock:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+            while total > self.max_bytes:
+                with self._lock:
+                    rows = self._conn.execute(
+                        "SELECT event_id, path, size FROM images ORDER BY created_at LIMIT ?", (_EVICT_BATCH,)
+                    ).fetchall()
+                if not rows:
+                    break
+                # Удаляем ровно столько самых старых, сколько нужно для попадания в лимит
+                to_remove = []
+                for row in rows:
+                    if total <= self.max_bytes:
+                        break
+                    to_remove.append(row)
+                    total -= row[2]
+                removed += self._evict(to_remove)
+        return removed
+
+    def _evict(self, rows) -> int:
+        dirs = set()
+        for _, path, _ in rows:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Failed to remove archived image {path}: {e}")
+            dirs.add(Path(path).parent)
+        with self._lock:
+            self._conn.executemany("DELETE FROM images WHERE event_id = ?", [(row[0],) for row in rows])
+        # Чистим опустевшие шарды (камера -> час -> дата)
+        for directory in dirs:
+            for shard in (directory, directory.parent, directory.parent.parent):
+                if shard == self.root:
+                    break
+                try:
+                    shard.rmdir()
+                except OSError:
+                    break
+        return len(rows)
@@ -0,0 +1,124 @@
+# services/image_store.py
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+from config.config import IMAGE_WRITER_THREADS, IMAGE_FSYNC_POLICY
+from services.metrics import IMAGE_WRITE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+# Политики fsync:
+#   none - полагаемся на page cache ОС (быстро, при падении питания файл может потеряться)
+#   file - fsync самого файла перед переименованием
+#   full - fsync файла и каталога (переименование тоже переживает падение)
+FSYNC_POLICIES = ('none', 'file', 'full')
+
+
+class ImageStore:
+    """
+    Запись изображений на диск в ограниченном пуле потоков.
+    Обработчик получает итоговый путь сразу после постановки записи в очередь,
+    поэтому медленный диск или NFS не блокируют event loop uvicorn.
+    """
+    def __init__(self, max_workers: int = IMAGE_WRITER_THREADS, fsync_policy: str = IMAGE_FSYNC_POLICY):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync_policy}', expected one of {FSYNC_POLICIES}")
+        self.fsync_policy = fsync_policy
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-writer")
+        self._pending: Dict[str, Future] = {}
+        self._known_dirs = set()
+        self._dirs_lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def save(self, data: bytes, path: PathLike,
+             on_written: Optional[Callable[[str, int], None]] = None) -> str:
+        """
+        Планирует запись data в path и сразу возвращает путь.
+        on_written(path, size) вызывается в потоке пула после успешной записи.
+        """
+        path = str(path)
+        self._track(path, self._executor.submit(self._write_file, data, path, on_written))
+        return path
+
+    async def wait(self, path: Optional[PathLike]):
+        """Дожидается завершения записи path, если она еще выполняется."""
+        future = self._pending.get(str(path)) if path else None
+        if future is not None:
+            try:
+                await asyncio.wrap_future(future)
+            except Exception:
+                pass  # ошибка уже залогирована в потоке записи
+
+    async def close(self):
+        """Дожидается всех запланированных записей и останавливает пул."""
+        pending = list(self._pending.values())
+        if pending:
+            logger.info(f"Waiting for {len(pending)} pending image writes")
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in pending), return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    # --- Выполняется в потоках пула ---
+
+    def _track(self, path: str, future: Future):
+        self._pending[path] = future
+
+        def _done(f: Future, path=path):
+            if self._pending.get(path) is f:
+                del self._pending[path]
+            if f.exception() is not None:
+                logger.error(f"Failed to write image {path}: {f.exception()}")
+        future.add_done_callback(_done)
+
+    def _ensure_dir(self, directory: Path):
+        key = str(directory)
+        if key in self._known_dirs:
+            return
+        with self._dirs_lock:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._known_dirs.add(key)
+
+    def _write_file(self, data: bytes, path: str, on_written=None):
+        start = time.perf_counter()
+        target = Path(path)
+        self._ensure_dir(target.parent)
+        tmp = target.with_name(f".{target.name}.tmp")
+        try:
+            f = open(tmp, 'wb')
+        except FileNotFoundError:
+            # Каталог мог быть удален очисткой архива после того, как попал в кэш
+            self._known_dirs.discard(str(target.parent))
+            self._ensure_dir(target.parent)
+            f = open(tmp, 'wb')
+        with f:
+            f.write(data)
+            self._fsync_file(f)
+        os.replace(tmp, target)
+        self._fsync_dir(target.parent)
+        IMAGE_WRITE_LATENCY.observe(time.perf_counter() - start)
+        if on_written is not None:
+            on_written(path, len(data))
+
+    def _fsync_file(self, f):
+        if self.fsync_policy in ('file', 'full'):
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _fsync_dir(self, directory: Path):
+        if self.fsync_policy == 'full':
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
@@ -0,0 +1,139 @@
+# services/logging_setup.py
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from config.config import (
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_QUEUE_SIZE,
+    LOG_PAYLOAD_SAMPLE_RATE,
+)
+
+# Одна запись на событие со временем стадий (services/metrics.StageTimer.finish)
+event_logger = logging.getLogger('hikvision.events')
+# Полные XML/данные событий: пишутся только для доли событий LOG_PAYLOAD_SAMPLE_RATE
+payload_logger = logging.getLogger('hikvision.payload')
+
+LOG_FORMATS = ('json', 'text')
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["_DroppingQueueHandler"] = None
+_payload_sample_rate = LOG_PAYLOAD_SAMPLE_RATE
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись; поля из extra= попадают в запись как есть."""
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                data[key] = value
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний формат '%(asctime)s - %(levelname)s - %(message)s', extra= дописывается JSON."""
+    def __init__(self):
+        super().__init__('%(asctime)s - %(levelname)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+        if extra:
+            line += ' ' + json.dumps(extra, ensure_ascii=False, default=str)
+        return line
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладет запись в ограниченную очередь и сразу возвращается: форматирование и вывод
+    делает поток QueueListener. Если очередь переполнена, запись отбрасывается
+    (и считается), а не блокирует event loop.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В отличие от базового prepare, запись не форматируется в вызывающем потоке:
+        # только подставляются аргументы и сериализуется исключение
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, queue_size: int = LOG_QUEUE_SIZE,
+                      payload_sample_rate: float = LOG_PAYLOAD_SAMPLE_RATE):
+    """
+    Настраивает логирование процесса: корневой логгер пишет в очередь, поток-слушатель
+    форматирует (json или text) и выводит в stdout. Повторный вызов ничего не делает.
+    Логи uvicorn, если у него есть свои обработчики, тоже направляются в очередь.
+    """
+    global _listener, _queue_handler, _payload_sample_rate
+    if _listener is not None:
+        return
+    if fmt not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format '{fmt}', expected one of {LOG_FORMATS}")
+    _payload_sample_rate = payload_sample_rate
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    log_queue = queue.Queue(maxsize=queue_size)
+    _queue_handler = _DroppingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    root.handlers = [_queue_handler]
+    root.setLevel(level.upper())
+    # Строка httpx на каждый исходящий запрос к SmartParking - только в режиме DEBUG
+    logging.getLogger('httpx').setLevel(max(root.level, logging.WARNING))
+    for name in ('uvicorn', 'uvicorn.access'):
+        uvicorn_logger = logging.getLogger(name)
+        if uvicorn_logger.handlers:
+            uvicorn_logger.handlers = []
+            uvicorn_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток-слушатель."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        if _queue_handler.dropped:
+            print(f"Log queue overflowed, {_queue_handler.dropped} records dropped", file=sys.stderr)
+
+
+def should_log_payload() -> bool:
+    """Писать ли полный XML/данные этого события (выборка LOG_PAYLOAD_SAMPLE_RATE)."""
+    if _payload_sample_rate <= 0 or not payload_logger.isEnabledFor(logging.INFO):
+        return False
+    return _payload_sample_rate >= 1 or random.random() < _payload_sample_rate
@@ -0,0 +1,152 @@
+# services/metrics.py
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    multiprocess,
+    REGISTRY,
+)
+from prometheus_client.exposition import choose_encoder
+
+from services.logging_setup import event_logger
+
+# Границы бакетов от 0.5 мс (разбор XML) до 10 с (таймаут SmartParking)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+STAGE_LATENCY = Histogram(
+    'hikvision_stage_duration_seconds',
+    'Latency of event pipeline stages',
+    ['stage', 'camera', 'endpoint'],
+    buckets=LATENCY_BUCKETS,
+)
+EVENTS = Counter(
+    'hikvision_events_total',
+    'Events received from cameras by outcome',
+    ['endpoint', 'camera', 'outcome'],
+)
+DELIVERIES = Counter(
+    'hikvision_smartparking_deliveries_total',
+    'SmartParking delivery attempts by result',
+    ['camera', 'endpoint', 'result'],
+)
+DEDUP = Counter(
+    'hikvision_dedup_total',
+    'Plate reads checked by the deduplicator',
+    ['result'],
+)
+STREAM_CONNECTED = Gauge(
+    'hikvision_alert_stream_connected',
+    'Whether the alertStream connection to a camera is up',
+    ['camera'],
+    multiprocess_mode='max',
+)
+BARRIER_LATENCY = Histogram(
+    'hikvision_barrier_open_duration_seconds',
+    'Time from barrier open request to camera response',
+    ['camera', 'result'],
+    buckets=LATENCY_BUCKETS,
+)
+ACCESS_DECISIONS = Counter(
+    'hikvision_access_decisions_total',
+    'Local allow-list decisions for plate reads',
+    ['camera', 'decision'],
+)
+DELIVERY_BATCH_SIZE = Histogram(
+    'hikvision_smartparking_batch_size',
+    'Events per batched SmartParking request',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+DELIVERY_BATCH_FLUSH = Histogram(
+    'hikvision_smartparking_batch_flush_seconds',
+    'Time from claiming a batch to the SmartParking batch response',
+    ['result'],
+    buckets=LATENCY_BUCKETS,
+)
+CIRCUIT_STATE = Gauge(
+    'hikvision_circuit_state',
+    'Circuit breaker state: 0 closed, 1 half-open, 2 open',
+    ['backend'],
+    multiprocess_mode='max',
+)
+CONCURRENCY_LIMIT = Gauge(
+    'hikvision_concurrency_limit',
+    'Current adaptive concurrency limit for a backend',
+    ['backend'],
+    multiprocess_mode='livesum',
+)
+ADMISSION_REJECTED = Counter(
+    'hikvision_admission_rejected_total',
+    'Camera requests rejected before processing',
+    ['endpoint', 'reason'],
+)
+EVENT_DELIVERY_LATENCY = Histogram(
+    'hikvision_event_delivery_seconds',
+    'Time from receiving an event to its confirmed delivery to SmartParking, retries included',
+    ['endpoint'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900),
+)
+IMAGE_WRITE_LATENCY = Histogram(
+    'hikvision_image_write_duration_seconds',
+    'Time spent writing one image to disk in the writer pool',
+    buckets=LATENCY_BUCKETS,
+)
+
+
+class StageTimer:
+    """
+    Замеряет стадии обработки одного события. Камера обычно известна только после
+    разбора XML, поэтому длительности копятся и публикуются разом в finish():
+    в метрики и одной структурной записью в лог hikvision.events вместе с полями,
+    добавленными через annotate() (номер, event_id, ...). event_id попадает
+    в end_to_end как exemplar trace_id (виден в формате OpenMetrics).
+    """
+    def __init__(self, endpoint: str, started_at: Optional[float] = None):
+        self.endpoint = endpoint
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        self.fields: Dict[str, object] = {}
+
+    def annotate(self, **fields):
+        self.fields.update((key, value) for key, value in fields.items() if value is not None)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+    def finish(self, camera: Optional[str], outcome: str):
+        camera = camera or 'Unknown'
+        self.durations['end_to_end'] = time.perf_counter() - self.started_at
+        event_id = self.fields.get('event_id')
+        for name, seconds in self.durations.items():
+            exemplar = {'trace_id': str(event_id)} if event_id and name == 'end_to_end' else None
+            STAGE_LATENCY.labels(name, camera, self.endpoint).observe(seconds, exemplar=exemplar)
+        EVENTS.labels(self.endpoint, camera, outcome).inc()
+        event_logger.info("event", extra={
+            "endpoint": self.endpoint, "camera": camera, "outcome": outcome, **self.fields,
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.durations.items()},
+        })
+
+
+def render_metrics(accept_header: Optional[str] = None):
+    """
+    Текст для /metrics. При запуске с несколькими воркерами (PROMETHEUS_MULTIPROC_DIR) агрегирует все процессы.
+    Формат выбирается по заголовку Accept: exemplars (trace_id) отдаются только в OpenMetrics
+    и только в однопроцессном режиме - multiprocess их не сохраняет.
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    encoder, content_type = choose_encoder(accept_header or '')
+    return encoder(registry), content_type
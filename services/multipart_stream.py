@@ -0,0 +1,183 @@
+# services/multipart_stream.py
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from python_multipart.multipart import MultipartParser, MultipartParseError, parse_options_header
+
+from services.anpr_xml import peek_event_type
+
+logger = logging.getLogger(__name__)
+
+# Порядок приоритета изображений: полное фото важнее обрезанного номера
+IMAGE_PRIORITY = ('detectionPicture.jpg', 'licensePlatePicture.jpg')
+# XML события небольшой, но ограничиваем его на случай мусорного запроса
+MAX_XML_SIZE = 1024 * 1024
+
+
+class MultipartStreamError(Exception):
+    """Тело запроса не удалось разобрать как multipart от камеры."""
+
+
+class RequestTooLargeError(MultipartStreamError):
+    """Тело запроса больше допустимого (ADMISSION_MAX_BODY_BYTES)."""
+
+
+class StreamedEvent:
+    """
+    Результат потокового разбора запроса камеры: XML и одно (лучшее по IMAGE_PRIORITY)
+    изображение в памяти. Буфер изображения передается в SmartParking без записи на диск.
+    """
+    def __init__(self):
+        self.xml_bytes: Optional[bytes] = None
+        # eventType, найденный сразу после XML-части (None - не найден или XML не было)
+        self.event_type: Optional[str] = None
+        self.image_bytes: Optional[bytes] = None
+        self.image_name: Optional[str] = None
+        self.part_names: List[str] = []
+
+
+class _HikvisionPartRouter:
+    """
+    Колбэки для MultipartParser: XML и изображения из IMAGE_PRIORITY собираются кусками,
+    менее приоритетное изображение освобождается, как только пришло лучшее,
+    все остальные части пропускаются без сохранения.
+    Если keep_images(eventType) после XML-части вернул False, изображения тоже пропускаются.
+    """
+    def __init__(self, keep_images: Optional[Callable[[Optional[str]], bool]] = None):
+        self.result = StreamedEvent()
+        self._keep_images = keep_images
+        self._skip_images = False
+        self._xml = bytearray()
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._headers: Dict[bytes, bytes] = {}
+        self._name: Optional[str] = None
+        self._target: Optional[str] = None  # 'xml' | 'image' | None
+        self._chunks: List[bytes] = []
+        self._images: Dict[str, List[bytes]] = {}
+
+    def callbacks(self):
+        return {
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': lambda data, start, end: self._header_field.extend(data[start:end]),
+            'on_header_value': lambda data, start, end: self._header_value.extend(data[start:end]),
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._name = None
+        self._target = None
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        raw_name = options.get(b'name') or options.get(b'filename') or b''
+        self._name = raw_name.decode('latin-1')
+        self.result.part_names.append(self._name)
+
+        if self._name.lower().endswith('.xml') and self.result.xml_bytes is None:
+            self._target = 'xml'
+        elif self._name in IMAGE_PRIORITY and not self._skip_images and self._name not in self._images \
+                and not self._has_better_image(self._name):
+            self._target = 'image'
+            self._chunks = []
+        else:
+            self._target = None
+
+    def _has_better_image(self, name: str) -> bool:
+        rank = IMAGE_PRIORITY.index(name)
+        return any(IMAGE_PRIORITY.index(existing) < rank for existing in self._images)
+
+    def _on_part_data(self, data, start, end):
+        if self._target == 'xml':
+            if len(self._xml) + (end - start) > MAX_XML_SIZE:
+                raise MultipartStreamError(f"XML part '{self._name}' exceeds {MAX_XML_SIZE} bytes")
+            self._xml.extend(data[start:end])
+        elif self._target == 'image':
+            self._chunks.append(data[start:end])
+        # Остальные части просто пропускаем
+
+    def _on_part_end(self):
+        if self._target == 'xml':
+            self.result.xml_bytes = bytes(self._xml)
+            # Камеры шлют XML первой частью: тип события известен до чтения изображений
+            self.result.event_type = peek_event_type(self.result.xml_bytes)
+            if self._keep_images is not None and not self._keep_images(self.result.event_type):
+                self._skip_images = True
+                self._images.clear()
+        elif self._target == 'image':
+            self._images[self._name] = self._chunks
+            self._chunks = []
+            # Более приоритетное изображение делает остальные ненужными
+            for other in list(self._images):
+                if IMAGE_PRIORITY.index(other) > IMAGE_PRIORITY.index(self._name):
+                    del self._images[other]
+        self._target = None
+
+    def finish(self) -> StreamedEvent:
+        for name in IMAGE_PRIORITY:
+            if name in self._images:
+                self.result.image_name = name
+                # Единственная склейка кусков; дальше bytes уходит в httpx без копирования
+                self.result.image_bytes = b''.join(self._images[name])
+                break
+        self._images.clear()
+        return self.result
+
+
+async def _limited(body: AsyncIterator[bytes], max_size: int) -> AsyncIterator[bytes]:
+    # Content-Length проверяется раньше (services/admission.py), здесь - chunked и неверная длина
+    received = 0
+    async for chunk in body:
+        received += len(chunk)
+        if received > max_size:
+            raise RequestTooLargeError(f"Request body exceeds {max_size} bytes")
+        yield chunk
+
+
+async def parse_event_stream(content_type: str, body: AsyncIterator[bytes],
+                             max_body_size: Optional[int] = None,
+                             keep_images: Optional[Callable[[Optional[str]], bool]] = None) -> StreamedEvent:
+    """
+    Разбирает тело запроса камеры по мере поступления. В памяти остается только XML
+    и одно выбранное изображение, остальные части не материализуются.
+    Если запрос не multipart (камера прислала голый XML), всё тело считается XML.
+    Тело больше max_body_size - RequestTooLargeError.
+    keep_images(eventType) решает, нужны ли изображения события (см. _HikvisionPartRouter).
+    """
+    if max_body_size:
+        body = _limited(body, max_body_size)
+    ctype, options = parse_options_header(content_type or '')
+    if not ctype.startswith(b'multipart/'):
+        xml = bytearray()
+        async for chunk in body:
+            if len(xml) + len(chunk) > MAX_XML_SIZE:
+                raise MultipartStreamError(f"XML body exceeds {MAX_XML_SIZE} bytes")
+            xml.extend(chunk)
+        result = StreamedEvent()
+        result.xml_bytes = bytes(xml) or None
+        result.event_type = peek_event_type(result.xml_bytes)
+        return result
+
+    boundary = options.get(b'boundary')
+    if not boundary:
+        raise MultipartStreamError("Multipart request without boundary")
+
+    router = _HikvisionPartRouter(keep_images)
+    parser = MultipartParser(boundary, router.callbacks())
+    try:
+        async for chunk in body:
+            if chunk:
+                parser.write(chunk)
+        parser.finalize()
+    except MultipartParseError as e:
+        raise MultipartStreamError(f"Malformed multipart body: {e}") from e
+    return router.finish()
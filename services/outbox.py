@@ -0,0 +1,504 @@
+# services/outbox.py
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from config.config import (
+    OUTBOX_PATH,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_BACKOFF_BASE,
+    OUTBOX_BACKOFF_MAX,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_LEASE_SECONDS,
+    OUTBOX_OWNER_GRACE_SECONDS,
+    IMAGE_MEMORY_CACHE_BYTES,
+    SMART_PARKING_BATCH_ENABLED,
+    SMART_PARKING_BATCH_MAX_EVENTS,
+    SMART_PARKING_BATCH_WINDOW,
+)
+from services.metrics import (
+    STAGE_LATENCY,
+    DELIVERIES,
+    DELIVERY_BATCH_SIZE,
+    DELIVERY_BATCH_FLUSH,
+    EVENT_DELIVERY_LATENCY,
+)
+from services.logging_setup import event_logger
+from services.circuit_breaker import CircuitOpenError, HALF_OPEN, OPEN
+from services.send_smart_parking import BatchNotSupportedError
+
+logger = logging.getLogger(__name__)
+
+# Служебные поля payload: используются только для метрик и логов, в SmartParking не отправляются
+_SOURCE_ENDPOINT = 'source_endpoint'
+_RECEIVED_AT = 'received_at'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    locked_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_error TEXT,
+    owner TEXT,
+    event_id TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (next_attempt_at, locked_until);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    last_error TEXT
+);
+"""
+
+
+class Outbox:
+    """
+    Персистентная очередь событий для SmartParking на SQLite в режиме WAL.
+    Событие считается принятым, как только транзакция enqueue закоммичена на диск.
+    Записи захватываются с арендой (locked_until), поэтому один файл могут
+    разбирать несколько процессов без двойной доставки в нормальном режиме.
+    Каждая запись помечается owner (токен процесса): первые owner_grace секунд её
+    забирает только принявший процесс, у которого изображение лежит в памяти.
+    event_id уникален среди ожидающих записей: повтор камерой события, которое
+    еще не доставлено, в очередь не попадает.
+    """
+    def __init__(self, path: str = OUTBOX_PATH, owner_grace: float = OUTBOX_OWNER_GRACE_SECONDS):
+        self.path = Path(path)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.owner_grace = owner_grace
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False,
+                                     isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: fsync на каждый коммит, чтобы подтвержденное камере событие пережило падение
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if 'owner' not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN owner TEXT")
+        if 'event_id' not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN event_id TEXT")
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS outbox_event_id ON outbox (event_id) "
+                           "WHERE event_id IS NOT NULL")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Синхронные операции (выполняются в пуле потоков) ---
+
+    def _enqueue(self, payload: dict, hold: float = 0.0) -> Optional[int]:
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (payload, event_id, next_attempt_at, created_at, owner) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (json.dumps(payload, ensure_ascii=False), payload.get('event_id'), now + hold, now, self.owner),
+            )
+            # 0 строк - событие с этим event_id уже ждет доставки
+            return cur.lastrowid if cur.rowcount else None
+
+    def _claim(self, limit: int, lease: float) -> List[Tuple[int, dict, int]]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, payload, attempts FROM outbox "
+                    "WHERE next_attempt_at <= ? AND locked_until <= ? "
+                    "AND (owner = ? OR owner IS NULL OR created_at <= ?) ORDER BY id LIMIT ?",
+                    (now, now, self.owner, now - self.owner_grace, limit),
+                ).fetchall()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE outbox SET locked_until = ? WHERE id = ?",
+                        [(now + lease, row[0]) for row in rows],
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(row_id, json.loads(payload), attempts) for row_id, payload, attempts in rows]
+
+    def _release(self, row_id: int, updates: Optional[dict]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT payload FROM outbox WHERE id = ?", (row_id,)).fetchone()
+                if row is not None:
+                    payload = {**json.loads(row[0]), **(updates or {})}
+                    self._conn.execute(
+                        "UPDATE outbox SET payload = ?, next_attempt_at = MIN(next_attempt_at, ?) WHERE id = ?",
+                        (json.dumps(payload, ensure_ascii=False), now, row_id),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _ack(self, ids: List[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def _retry(self, row_id: int, attempts: int, delay: float, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt_at = ?, locked_until = 0, last_error = ? WHERE id = ?",
+                (attempts, time.time() + delay, error, row_id),
+            )
+
+    def _dead_letter(self, row_id: int, attempts: int, error: str):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dead_letters (id, payload, attempts, created_at, failed_at, last_error) "
+                    "SELECT id, payload, ?, created_at, ?, ? FROM outbox WHERE id = ?",
+                    (attempts, time.time(), error, row_id),
+                )
+                self._conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _stats(self) -> dict:
+        with self._lock:
+            pending = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            dead = self._conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        return {"pending": pending, "dead_letters": dead}
+
+    # --- Асинхронный интерфейс ---
+
+    async def enqueue(self, payload: dict, hold: float = 0.0) -> Optional[int]:
+        """hold - сколько секунд запись не отдается воркерам (до release())."""
+        return await asyncio.to_thread(self._enqueue, payload, hold)
+
+    async def release(self, row_id: int, updates: Optional[dict] = None):
+        """Дополняет payload отложенной записи полями updates и делает ее доступной сразу."""
+        await asyncio.to_thread(self._release, row_id, updates)
+
+    async def claim(self, limit: int, lease: float = OUTBOX_LEASE_SECONDS) -> List[Tuple[int, dict, int]]:
+        return await asyncio.to_thread(self._claim, limit, lease)
+
+    async def ack(self, ids: List[int]):
+        if ids:
+            await asyncio.to_thread(self._ack, ids)
+
+    async def retry(self, row_id: int, attempts: int, delay: float, error: str):
+        await asyncio.to_thread(self._retry, row_id, attempts, delay, error)
+
+    async def dead_letter(self, row_id: int, attempts: int, error: str):
+        await asyncio.to_thread(self._dead_letter, row_id, attempts, error)
+
+    async def stats(self) -> dict:
+        return await asyncio.to_thread(self._stats)
+
+
+def _strip_service_fields(payload: dict) -> Tuple[dict, str]:
+    """Копия payload для send_parking без служебных полей и endpoint для меток метрик."""
+    payload = dict(payload)
+    payload.pop(_RECEIVED_AT, None)
+    return payload, payload.pop(_SOURCE_ENDPOINT, None) or 'unknown'
+
+
+def _result_label(result) -> str:
+    if result is True:
+        return 'ok'
+    if isinstance(result, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(result, BaseException):
+        return type(result).__name__
+    return str(result)
+
+
+class DeliveryWorker:
+    """
+    Фоновая задача, которая разбирает Outbox пачками и доставляет события в SmartParking.
+    Ошибки доставки -> повтор с экспоненциальной задержкой, после OUTBOX_MAX_ATTEMPTS -> dead_letters.
+    Изображения событий, принятых этим процессом, держатся в памяти (в пределах
+    memory_cache_bytes) и отправляются без чтения с диска. После рестарта или вытеснения
+    из памяти используется архивная копия: если передан image_archive, воркер дожидается
+    ее фоновой записи и берет путь из индекса архива по event_id.
+    В пакетном режиме (batching) воркер копит события до batch_max_events или
+    batch_window секунд и отправляет их одним запросом send_parking_batch;
+    повторы и dead letters по-прежнему считаются для каждого события отдельно.
+    Пока цепь SmartParking разомкнута (circuit breaker), воркер не забирает события:
+    они копятся в outbox, а отклоненные breaker'ом отправки откладываются без
+    увеличения счетчика попыток, поэтому простой бэкенда не ведет в dead letters.
+    """
+    def __init__(self, outbox: Outbox, smart_parking, image_archive=None,
+                 batch_size: int = OUTBOX_BATCH_SIZE,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 backoff_base: float = OUTBOX_BACKOFF_BASE,
+                 backoff_max: float = OUTBOX_BACKOFF_MAX,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 memory_cache_bytes: int = IMAGE_MEMORY_CACHE_BYTES,
+                 batching: bool = SMART_PARKING_BATCH_ENABLED,
+                 batch_max_events: int = SMART_PARKING_BATCH_MAX_EVENTS,
+                 batch_window: float = SMART_PARKING_BATCH_WINDOW):
+        self.outbox = outbox
+        self.smart_parking = smart_parking
+        self.image_archive = image_archive
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.memory_cache_bytes = memory_cache_bytes
+        self.batching = batching
+        self.batch_max_events = batch_max_events
+        self.batch_window = batch_window
+        self._submitted = 0
+        self._batch_full = asyncio.Event()
+        self._images: "OrderedDict[int, bytes]" = OrderedDict()
+        self._images_size = 0
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, payload: dict, image_bytes: Optional[bytes] = None,
+                     source_endpoint: Optional[str] = None,
+                     received_at: Optional[float] = None, hold: float = 0.0) -> Optional[int]:
+        """
+        Надежно ставит событие в очередь и будит воркер. Возвращает id записи
+        или None, если событие с тем же event_id уже ждет доставки (повтор камеры).
+        image_bytes (не сериализуется в outbox) используется при отправке из памяти.
+        source_endpoint и received_at (unix-время приема) сохраняются для метрик
+        и в SmartParking не отправляются.
+        hold > 0 - событие ждет release() (например, ответа шлагбаума), но не дольше hold секунд.
+        """
+        if source_endpoint:
+            payload = {**payload, _SOURCE_ENDPOINT: source_endpoint}
+        if received_at:
+            payload = {**payload, _RECEIVED_AT: received_at}
+        row_id = await self.outbox.enqueue(payload, hold)
+        if row_id is None:
+            logger.info("Event %s is already pending delivery", payload.get('event_id'),
+                        extra={'event_id': payload.get('event_id')})
+            return None
+        if image_bytes:
+            self._remember_image(row_id, image_bytes)
+        self._submitted += 1
+        if self._submitted >= self.batch_max_events:
+            self._batch_full.set()
+        self._wakeup.set()
+        return row_id
+
+    async def release(self, row_id: int, updates: Optional[dict] = None):
+        """Отпускает событие, поставленное с hold, дополнив его payload полями updates."""
+        await self.outbox.release(row_id, updates)
+        self._wakeup.set()
+
+    def _remember_image(self, row_id: int, image_bytes: bytes):
+        self._images[row_id] = image_bytes
+        self._images_size += len(image_bytes)
+        # Вытесняем самые старые буферы: они будут отправлены из архива на диске
+        while self._images_size > self.memory_cache_bytes and len(self._images) > 1:
+            _, evicted = self._images.popitem(last=False)
+            self._images_size -= len(evicted)
+
+    def _forget_image(self, row_id: int):
+        image_bytes = self._images.pop(row_id, None)
+        if image_bytes is not None:
+            self._images_size -= len(image_bytes)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="outbox-delivery")
+
+    async def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        self._batch_full.set()
+        if self._task:
+            await self._task
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _run(self):
+        logger.info("Outbox delivery worker started")
+        backlog = False
+        breaker = self.smart_parking.breaker
+        while not self._stopping:
+            if breaker.state == OPEN:
+                await self._sleep(breaker.retry_after())
+                continue
+            if self.batching and not backlog:
+                await self._fill_window()
+            limit = self.batch_max_events if self.batching else self.batch_size
+            if breaker.state == HALF_OPEN:
+                # Пробуем бэкенд одним пакетом/событием, остальные ждут в outbox
+                limit = 1 if self.batching else breaker.half_open_max_calls
+            try:
+                batch = await self.outbox.claim(limit)
+            except Exception as e:
+                logger.exception(f"Failed to claim outbox batch: {e}")
+                batch = []
+
+            if not batch:
+                await self._sleep(self.poll_interval)
+                continue
+
+            # Полный пакет - в очереди есть еще события, окно не ждем
+            backlog = len(batch) >= limit
+            try:
+                if self.batching:
+                    await self._deliver_as_one_request(batch)
+                else:
+                    await self._deliver_batch(batch)
+            except Exception as e:
+                # Ошибка SQLite при ack/retry не должна останавливать доставку:
+                # записи пакета вернутся в работу по истечении аренды
+                logger.exception(f"Failed to deliver outbox batch: {e}")
+                backlog = False
+                await self._sleep(self.poll_interval)
+        logger.info("Outbox delivery worker stopped")
+
+    async def _sleep(self, timeout: float):
+        # Прерывается новым событием или остановкой воркера
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _fill_window(self):
+        # Ждем, пока с прошлой отправки накопится batch_max_events событий, но не дольше окна
+        if self._submitted < self.batch_max_events:
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), timeout=self.batch_window)
+            except asyncio.TimeoutError:
+                pass
+        self._submitted = 0
+        self._batch_full.clear()
+
+    async def _send(self, row_id: int, payload: dict):
+        payload, endpoint = _strip_service_fields(payload)
+        image_bytes = self._images.get(row_id)
+        if image_bytes is None:
+            payload = await self._from_archive(payload)
+
+        start = time.perf_counter()
+        camera = payload.get('camera_name') or 'Unknown'
+        try:
+            result = await self.smart_parking.send_parking(**payload, image_bytes=image_bytes)
+        except CircuitOpenError as e:
+            result = e
+        else:
+            STAGE_LATENCY.labels('smartparking_post', camera, endpoint).observe(time.perf_counter() - start)
+        DELIVERIES.labels(camera, endpoint, _result_label(result)).inc()
+        return result
+
+    async def _from_archive(self, payload: dict) -> dict:
+        """Payload с путем к архивной копии изображения из индекса архива (если она есть)."""
+        if self.image_archive is None or not payload.get('main_image_path'):
+            return payload
+        await self.image_archive.store.wait(payload['main_image_path'])
+        path = await asyncio.to_thread(self.image_archive.find, payload.get('event_id'))
+        return {**payload, 'main_image_path': path} if path else payload
+
+    async def _deliver_as_one_request(self, batch: List[Tuple[int, dict, int]]):
+        events, endpoints = [], []
+        for row_id, payload, _ in batch:
+            payload, endpoint = _strip_service_fields(payload)
+            endpoints.append(endpoint)
+            image_bytes = self._images.get(row_id)
+            if image_bytes is None:
+                payload = await self._from_archive(payload)
+            events.append({**payload, 'image_bytes': image_bytes})
+
+        start = time.perf_counter()
+        try:
+            results = await self.smart_parking.send_parking_batch(events)
+        except BatchNotSupportedError as e:
+            # Бэкенд без пакетного эндпоинта: дальше этот процесс шлет события по одному
+            logger.warning(f"Batch delivery disabled, falling back to single requests: {e}")
+            self.batching = False
+            await self._deliver_batch(batch)
+            return
+        except Exception as e:
+            results = [e] * len(batch)
+        elapsed = time.perf_counter() - start
+
+        ok = all(result is True for result in results)
+        DELIVERY_BATCH_SIZE.observe(len(batch))
+        DELIVERY_BATCH_FLUSH.labels('ok' if ok else 'error').observe(elapsed)
+        for (_, payload, _), endpoint, result in zip(batch, endpoints, results):
+            camera = payload.get('camera_name') or 'Unknown'
+            STAGE_LATENCY.labels('smartparking_post', camera, endpoint).observe(elapsed)
+            DELIVERIES.labels(camera, endpoint, _result_label(result)).inc()
+        await self._settle(batch, results)
+
+    async def _deliver_batch(self, batch: List[Tuple[int, dict, int]]):
+        results = await asyncio.gather(
+            *(self._send(row_id, payload) for row_id, payload, _ in batch),
+            return_exceptions=True,
+        )
+        await self._settle(batch, results)
+
+    async def _settle(self, batch: List[Tuple[int, dict, int]], results: list):
+        """Подтверждает доставленные записи, остальные - на повтор или в dead letters."""
+        delivered = []
+        for (row_id, payload, attempts), result in zip(batch, results):
+            if result is True:
+                delivered.append(row_id)
+                self._forget_image(row_id)
+                self._observe_delivered(payload, attempts)
+                continue
+            if isinstance(result, CircuitOpenError):
+                # Бэкенд недоступен - это не попытка доставки, событие просто ждет в outbox
+                await self.outbox.retry(row_id, attempts, max(result.retry_after, self.poll_interval), str(result))
+                continue
+
+            attempts += 1
+            error = repr(result) if isinstance(result, BaseException) else f"send_parking returned {result}"
+            # 4xx (кроме 408/429) повторять бессмысленно - бэкенд отверг данные
+            permanent = isinstance(result, int) and not isinstance(result, bool) \
+                and 400 <= result < 500 and result not in (408, 429)
+            if permanent or attempts >= self.max_attempts:
+                logger.error(f"Event {payload.get('event_id')} moved to dead letters after {attempts} attempts: {error}",
+                             extra={'event_id': payload.get('event_id')})
+                await self.outbox.dead_letter(row_id, attempts, error)
+                self._forget_image(row_id)
+            else:
+                delay = self._backoff(attempts)
+                logger.warning(f"Delivery of event {payload.get('event_id')} failed ({error}), retry #{attempts} in {delay:.1f}s",
+                               extra={'event_id': payload.get('event_id')})
+                await self.outbox.retry(row_id, attempts, delay, error)
+        await self.outbox.ack(delivered)
+
+    @staticmethod
+    def _observe_delivered(payload: dict, attempts: int):
+        # Время от приема события до подтверждения SmartParking, с event_id как trace_id
+        event_id = payload.get('event_id')
+        camera = payload.get('camera_name') or 'Unknown'
+        endpoint = payload.get(_SOURCE_ENDPOINT) or 'unknown'
+        received_at = payload.get(_RECEIVED_AT)
+        delivery_s = time.time() - received_at if received_at else None
+        if delivery_s is not None:
+            EVENT_DELIVERY_LATENCY.labels(endpoint).observe(
+                delivery_s, exemplar={'trace_id': event_id} if event_id else None)
+        event_logger.info("delivered", extra={
+            "event_id": event_id, "camera": camera, "endpoint": endpoint, "attempts": attempts + 1,
+            "delivery_ms": round(delivery_s * 1000, 2) if delivery_s is not None else None,
+        })
@@ -0,0 +1,278 @@
+# services/provisioning.py
+import asyncio
+import logging
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from config.config import (
+    PROVISION_SERVER_PORT,
+    PROVISION_HTTP_HOST_ID,
+    PROVISION_ANPR_PICTURES,
+    PROVISION_MOTION_DETECTION,
+    PROVISION_CONCURRENCY,
+    PROVISION_TIMEOUT,
+)
+from services.camera_registry import Camera
+
+logger = logging.getLogger(__name__)
+
+ISAPI_NAMESPACE = "http://www.isapi.org/ver20/XMLSchema"
+# Куда камера шлет события в зависимости от прошивки (см. manage.py)
+EVENT_PATHS = {'v4': '/test', 'v5': '/firmware_v5'}
+RESOURCES = ('httpHosts', 'motionDetection')
+
+# Итог по одной настройке одной камеры
+UNCHANGED = 'unchanged'
+UPDATED = 'updated'
+WOULD_UPDATE = 'would_update'
+VERIFY_FAILED = 'verify_failed'
+FAILED = 'failed'
+
+
+class ProvisioningOptions:
+    """Желаемое состояние камер; None у anpr_pictures/motion - настройку не трогать."""
+    __slots__ = ('server_ip', 'server_port', 'host_id', 'anpr_pictures', 'motion', 'resources')
+
+    def __init__(self, server_ip: str, server_port: int = PROVISION_SERVER_PORT,
+                 host_id: str = PROVISION_HTTP_HOST_ID,
+                 anpr_pictures: Optional[str] = PROVISION_ANPR_PICTURES or None,
+                 motion: Optional[str] = PROVISION_MOTION_DETECTION or None,
+                 resources: Tuple[str, ...] = RESOURCES):
+        if motion not in (None, 'on', 'off'):
+            raise ValueError(f"Unknown motion detection mode '{motion}', expected on/off")
+        unknown = set(resources) - set(RESOURCES)
+        if unknown:
+            raise ValueError(f"Unknown resources {sorted(unknown)}, expected some of {RESOURCES}")
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.host_id = str(host_id)
+        self.anpr_pictures = anpr_pictures
+        self.motion = motion
+        self.resources = resources
+
+
+class Setting:
+    """
+    Одна ISAPI-настройка камеры: URL документа и желаемые значения листовых элементов.
+    Ключи desired - пути из локальных имен тегов через '/', относительно корня документа.
+    template - документ для PUT, если камера отвечает на GET 404.
+    """
+    __slots__ = ('name', 'path', 'desired', 'template')
+
+    def __init__(self, name: str, path: str, desired: Dict[str, str], template: Optional[str] = None):
+        self.name = name
+        self.path = path
+        self.desired = desired
+        self.template = template
+
+
+class SettingResult:
+    __slots__ = ('camera', 'setting', 'status', 'changes', 'error', 'duration')
+
+    def __init__(self, camera: str, setting: str, status: str, changes: Optional[Dict[str, tuple]] = None,
+                 error: Optional[str] = None, duration: float = 0.0):
+        self.camera = camera
+        self.setting = setting
+        self.status = status
+        self.changes = changes or {}
+        self.error = error
+        self.duration = duration
+
+    def as_dict(self) -> dict:
+        return {
+            "camera": self.camera, "setting": self.setting, "status": self.status,
+            "changes": {path: {"current": current, "desired": desired}
+                        for path, (current, desired) in self.changes.items()},
+            "error": self.error, "duration_ms": round(self.duration * 1000, 1),
+        }
+
+
+def build_settings(camera: Camera, options: ProvisioningOptions) -> List[Setting]:
+    """Список настроек камеры по ее записи в реестре и общим параметрам."""
+    settings = []
+    if 'httpHosts' in options.resources:
+        desired = {
+            'id': options.host_id,
+            'url': EVENT_PATHS[camera.firmware],
+            'protocolType': 'HTTP',
+            'parameterFormatType': 'XML',
+            'addressingFormatType': 'ipaddress',
+            'ipAddress': options.server_ip,
+            'portNo': str(options.server_port),
+            'httpAuthenticationMethod': 'none',
+        }
+        if options.anpr_pictures:
+            desired['ANPR/detectionUpLoadPicturesType'] = options.anpr_pictures
+        settings.append(Setting(
+            'httpHosts', f"/ISAPI/Event/notification/httpHosts/{options.host_id}", desired,
+            template=f'<HttpHostNotification version="2.0" xmlns="{ISAPI_NAMESPACE}"></HttpHostNotification>'))
+    if 'motionDetection' in options.resources and options.motion:
+        settings.append(Setting(
+            'motionDetection', f"/ISAPI/System/Video/inputs/channels/{camera.channel or 1}/motionDetection",
+            {'enabled': 'true' if options.motion == 'on' else 'false'}))
+    return settings
+
+
+# --- Работа с XML без привязки к namespace (isapi.org / hikvision.com) ---
+
+def _local(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _namespace(element: ET.Element) -> str:
+    return element.tag[1:].split('}', 1)[0] if element.tag.startswith('{') else ''
+
+
+def _child(parent: ET.Element, name: str) -> Optional[ET.Element]:
+    for element in parent:
+        if _local(element.tag) == name:
+            return element
+    return None
+
+
+def _find(root: ET.Element, path: str) -> Optional[ET.Element]:
+    element = root
+    for name in path.split('/'):
+        element = _child(element, name)
+        if element is None:
+            return None
+    return element
+
+
+def _ensure(root: ET.Element, path: str) -> ET.Element:
+    element = root
+    for name in path.split('/'):
+        child = _child(element, name)
+        if child is None:
+            namespace = _namespace(element)
+            child = ET.SubElement(element, f"{{{namespace}}}{name}" if namespace else name)
+        element = child
+    return element
+
+
+def diff_document(root: ET.Element, desired: Dict[str, str]) -> Dict[str, tuple]:
+    """path -> (текущее значение, желаемое) для отличающихся элементов."""
+    changes = {}
+    for path, value in desired.items():
+        element = _find(root, path)
+        current = (element.text or '').strip() if element is not None else None
+        if current != value:
+            changes[path] = (current, value)
+    return changes
+
+
+def apply_changes(root: ET.Element, changes: Dict[str, tuple]) -> bytes:
+    """Меняет элементы в документе камеры (остальные поля сохраняются) и сериализует его."""
+    for path, (_, value) in changes.items():
+        _ensure(root, path).text = value
+    # Камеры ждут документ с xmlns по умолчанию, а не с префиксами ns0:, как пишет ElementTree
+    namespace = _namespace(root)
+    for element in root.iter():
+        element.tag = _local(element.tag)
+    if namespace:
+        root.set('xmlns', namespace)
+    return ET.tostring(root, encoding='UTF-8', xml_declaration=True)
+
+
+def _response_error(response: httpx.Response) -> str:
+    # Камера объясняет отказ в ResponseStatus/subStatusCode
+    try:
+        root = ET.fromstring(response.content)
+        detail = _find(root, 'subStatusCode')
+        if detail is None:
+            detail = _find(root, 'statusString')
+        if detail is not None and detail.text:
+            return f"HTTP {response.status_code} {detail.text.strip()}"
+    except ET.ParseError:
+        pass
+    return f"HTTP {response.status_code} {response.text[:200]}"
+
+
+class CameraProvisioner:
+    """
+    Приводит ISAPI-настройки камер к желаемому состоянию: GET, сравнение нужных полей,
+    PUT только при отличиях и проверочный GET после него. Повторный запуск без
+    изменений на камерах ничего не пишет. Камеры обрабатываются параллельно,
+    не больше concurrency одновременно, через один общий httpx-клиент;
+    настройки одной камеры применяются последовательно.
+    """
+    def __init__(self, options: ProvisioningOptions, concurrency: int = PROVISION_CONCURRENCY,
+                 timeout: float = PROVISION_TIMEOUT, dry_run: bool = False):
+        self.options = options
+        self.concurrency = concurrency
+        self.dry_run = dry_run
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def run(self, cameras: List[Camera]) -> List[SettingResult]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(camera: Camera) -> List[SettingResult]:
+            async with semaphore:
+                return await self.provision_camera(camera)
+
+        per_camera = await asyncio.gather(*(bounded(camera) for camera in cameras))
+        return [result for results in per_camera for result in results]
+
+    async def provision_camera(self, camera: Camera) -> List[SettingResult]:
+        if not camera.ip:
+            return [SettingResult(camera.name, '-', FAILED, error="camera has no ip in the registry")]
+        # Один DigestAuth на камеру: после первого 401 запросы подписываются без лишнего круга
+        auth = httpx.DigestAuth(camera.username, camera.password)
+        results = []
+        for setting in build_settings(camera, self.options):
+            start = time.perf_counter()
+            try:
+                result = await self._apply(camera, setting, auth)
+            except (httpx.HTTPError, ET.ParseError) as e:
+                result = SettingResult(camera.name, setting.name, FAILED, error=repr(e))
+            result.duration = time.perf_counter() - start
+            log = logger.error if result.status in (FAILED, VERIFY_FAILED) else logger.info
+            log(f"{camera.name} ({camera.ip}) {setting.name}: {result.status}"
+                + (f" {result.error}" if result.error else ""))
+            results.append(result)
+        return results
+
+    async def _get(self, url: str, auth, setting: Setting) -> ET.Element:
+        response = await self.client.get(url, auth=auth)
+        if response.status_code == 404 and setting.template:
+            return ET.fromstring(setting.template)
+        if response.status_code != 200:
+            raise httpx.HTTPStatusError(_response_error(response), request=response.request, response=response)
+        return ET.fromstring(response.content)
+
+    async def _apply(self, camera: Camera, setting: Setting, auth) -> SettingResult:
+        url = f"http://{camera.ip}{setting.path}"
+        root = await self._get(url, auth, setting)
+        changes = diff_document(root, setting.desired)
+        if not changes:
+            return SettingResult(camera.name, setting.name, UNCHANGED)
+        if self.dry_run:
+            return SettingResult(camera.name, setting.name, WOULD_UPDATE, changes)
+
+        response = await self.client.put(url, content=apply_changes(root, changes), auth=auth,
+                                         headers={"Content-Type": "application/xml"})
+        if response.status_code != 200:
+            return SettingResult(camera.name, setting.name, FAILED, changes, _response_error(response))
+
+        # Камера может ответить 200 и молча не сохранить часть полей
+        remaining = diff_document(await self._get(url, auth, setting), setting.desired)
+        if remaining:
+            return SettingResult(camera.name, setting.name, VERIFY_FAILED, changes,
+                                 "not applied: " + ", ".join(sorted(remaining)))
+        return SettingResult(camera.name, setting.name, UPDATED, changes)
+
+
+def summarize(results: List[SettingResult]) -> Dict[str, int]:
+    summary = dict.fromkeys((UNCHANGED, UPDATED, WOULD_UPDATE, VERIFY_FAILED, FAILED), 0)
+    for result in results:
+        summary[result.status] += 1
+    return summary
@@ -1,73 +1,242 @@
 # services/send_smart_parking.py
-import requests
-from config.config import SMART_PARKING_URL # Убедитесь, что SMART_PARKING_URL определен
+import asyncio
+import base64
+import json
 import logging
-import os
-from typing import Optional
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+import httpx
+
+from config.config import (
+    SMART_PARKING_URL,
+    SMART_PARKING_TIMEOUT,
+    SMART_PARKING_CONNECT_TIMEOUT,
+    SMART_PARKING_MAX_CONNECTIONS,
+    SMART_PARKING_MAX_KEEPALIVE,
+    SMART_PARKING_BATCH_PATH,
+    SMART_PARKING_BATCH_FORMAT,
+)
+
+from services.circuit_breaker import AdaptiveLimiter, CircuitBreaker, CircuitOpenError
+
 logger = logging.getLogger(__name__)
 
+BATCH_FORMATS = ('multipart', 'ndjson')
+# Заголовок с event_id события: по нему бэкенд может отбрасывать повторы и связывать логи
+TRACE_HEADER = 'X-Trace-Id'
+# Такие ответы означают, что пакетного эндпоинта на бэкенде нет
+_BATCH_UNSUPPORTED_STATUSES = (404, 405, 501)
+
+
+class BatchNotSupportedError(RuntimeError):
+    """SmartParking не принимает пакеты на SMART_PARKING_BATCH_PATH."""
+
+
+def _event_fields(camera_name, license_plate, license_plate_country, color, event_id, barrier_opened) -> dict:
+    data = {
+        "license_plate": license_plate,
+        "license_plate_country": license_plate_country,
+        "color": color,
+        "event_id": event_id,
+        "camera": camera_name,
+        "recognize": "HikVision",
+        "barrier_opened": "true" if barrier_opened else None,
+    }
+    # httpx не принимает None в form-данных
+    return {k: v for k, v in data.items() if v is not None}
+
+
 class SmartParkingService:
-    def __init__(self, smart_parking_url=SMART_PARKING_URL):
-        self.smart_parking_url = smart_parking_url
-
-    def send_parking(self, camera_name: Optional[str], 
-                     main_image_path: Optional[str], 
-                     main_image_original_name: Optional[str], 
-                     license_plate: Optional[str], 
-                     license_plate_country: Optional[str], 
-                     color: Optional[str], 
-                     event_id: Optional[str]):
-        url = f"{self.smart_parking_url}/parking/data_process/" # Убедитесь, что URL правильный
+    """
+    Асинхронный клиент SmartParking.
+    Создается один раз при старте приложения (см. lifespan в manage.py) и держит
+    общий пул keep-alive соединений, поэтому медленный ответ бэкенда не блокирует event loop.
+    Запросы идут через circuit breaker (при недоступном бэкенде - CircuitOpenError сразу,
+    без ожидания таймаутов) и адаптивный лимит одновременных запросов (AIMD).
+    """
+    def __init__(self,
+                 smart_parking_url: str = SMART_PARKING_URL,
+                 timeout: float = SMART_PARKING_TIMEOUT,
+                 connect_timeout: float = SMART_PARKING_CONNECT_TIMEOUT,
+                 max_connections: int = SMART_PARKING_MAX_CONNECTIONS,
+                 max_keepalive: int = SMART_PARKING_MAX_KEEPALIVE,
+                 batch_path: str = SMART_PARKING_BATCH_PATH,
+                 batch_format: str = SMART_PARKING_BATCH_FORMAT):
+        if batch_format not in BATCH_FORMATS:
+            raise ValueError(f"Unknown batch format '{batch_format}', expected one of {BATCH_FORMATS}")
+        self.smart_parking_url = smart_parking_url.rstrip('/')
+        self.batch_path = batch_path
+        self.batch_format = batch_format
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive),
+        )
+        self.breaker = CircuitBreaker('smartparking')
+        # Ограничиваем число одновременных запросов к бэкенду
+        self.limiter = AdaptiveLimiter('smartparking')
 
-        files_to_send = None
-        opened_file = None 
-
-        if main_image_path and main_image_original_name and os.path.exists(main_image_path):
-            try:
-                opened_file = open(main_image_path, 'rb')
-                # Сервер ожидает файл в поле с именем "photo"
-                files_to_send = {'photo': (main_image_original_name, opened_file)} 
-                logger.info(f"Preparing single file for upload: field='photo', filename='{main_image_original_name}', path='{main_image_path}'")
-            except IOError as e:
-                logger.error(f"Could not open file {main_image_path} for upload: {e}")
-            except Exception as e: # Более общее исключение
-                logger.error(f"Error preparing file {main_image_path}: {e}")
-        else:
-            if main_image_path: # Логируем, только если путь был, но файл не найден
-                 logger.warning(f"Main image path '{main_image_path}' provided, but file does not exist. Sending request without image.")
-            else:
-                 logger.info("No main image path provided. Sending request without image.")
+    async def close(self):
+        await self.client.aclose()
 
+    async def send_parking(self, camera_name: Optional[str],
+                           main_image_path: Optional[str],
+                           main_image_original_name: Optional[str],
+                           license_plate: Optional[str],
+                           license_plate_country: Optional[str],
+                           color: Optional[str],
+                           event_id: Optional[str],
+                           image_bytes: Optional[Union[bytes, memoryview]] = None,
+                           barrier_opened: Optional[bool] = None):
+        """
+        Отправляет событие в SmartParking. Если передан image_bytes, изображение
+        загружается прямо из памяти, иначе читается с диска по main_image_path.
+        barrier_opened=True сообщает, что камера подтвердила открытие шлагбаума локальным правилом.
+        Бросает CircuitOpenError, если бэкенд считается недоступным.
+        """
+        url = f"{self.smart_parking_url}/parking/data_process/"
 
-        data = {
-            "license_plate": license_plate, 
-            "license_plate_country": license_plate_country, 
-            "color": color, 
-            "event_id": event_id, 
-            "camera": camera_name,
-            "recognize": "HikVision",
-        }
-        # Удаляем ключи с None значениями из data, если сервер не ожидает их
-        # data = {k: v for k, v in data.items() if v is not None}
+        files_to_send = None
+        if image_bytes is None:
+            image_bytes = await self._read_image(main_image_path, main_image_original_name)
+        if image_bytes is not None:
+            # httpx отдает bytes в тело запроса как есть, без копирования
+            content = image_bytes if isinstance(image_bytes, bytes) else bytes(image_bytes)
+            # Сервер ожидает файл в поле с именем "photo"
+            files_to_send = {'photo': (main_image_original_name or 'image.jpg', content, 'image/jpeg')}
+            logger.debug("Preparing image for upload: field='photo', filename='%s', size=%d", main_image_original_name, len(content))
 
+        data = _event_fields(camera_name, license_plate, license_plate_country, color, event_id, barrier_opened)
 
         try:
-            logger.info(f"Sending POST request to {url} with data: {data} and files: {'Yes' if files_to_send else 'No'}")
-            response = requests.post(url=url, data=data, files=files_to_send) 
+            logger.debug("Sending POST request to %s with data: %s and files: %s", url, data, 'Yes' if files_to_send else 'No')
+            headers = {TRACE_HEADER: event_id} if event_id else None
+            response = await self._post(url, data=data, files=files_to_send, headers=headers)
 
-            if response.status_code == 200:
-                logger.info(f"Successfully sent request to smart parking. Response: {response.text[:200]}") # Логируем начало ответа
+            if response.status_code in (200, 201):
+                logger.debug("Successfully sent event %s to smart parking", event_id)
                 return True
             else:
-                logger.warning(f"Failed to send request to smart parking. Status: {response.status_code}, Response: {response.text[:500]}") # Логируем начало ответа
+                logger.warning(f"Failed to send request to smart parking. Status: {response.status_code}, Response: {response.text[:500]}")
                 return response.status_code
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request to smart parking failed: {e}")
+        except httpx.HTTPError as e:
+            logger.error(f"Request to smart parking failed: {e!r}")
             return False
+
+    async def _post(self, url: str, **kwargs) -> httpx.Response:
+        """POST через breaker и лимитер. Бросает CircuitOpenError, не отправляя запрос."""
+        # Сначала лимитер: отмена ожидания в нем не должна оставить занятым слот half_open breaker'а
+        await self.limiter.acquire()
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.limiter.release(None, 0.0)
+            raise
+        start = time.perf_counter()
+        ok = None
+        try:
+            response = await self.client.post(url, **kwargs)
+            # 4xx - бэкенд жив и отверг данные; перегрузку и отказ означают 5xx, 408 и 429
+            ok = response.status_code < 500 and response.status_code not in (408, 429)
+            return response
+        except httpx.HTTPError:
+            ok = False
+            raise
         finally:
-            if opened_file: 
-                try:
-                    opened_file.close()
-                    logger.info(f"Closed file: {main_image_original_name}")
-                except Exception as e_close:
-                    logger.error(f"Error closing file object for {main_image_original_name}: {e_close}")
\ No newline at end of file
+            if ok is True:
+                self.breaker.record_success()
+            elif ok is False:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_cancelled()
+            self.limiter.release(ok, time.perf_counter() - start)
+
+    def status(self) -> dict:
+        return {"circuit": self.breaker.status(), "concurrency": self.limiter.status()}
+
+    async def _read_image(self, main_image_path: Optional[str], main_image_original_name: Optional[str]) -> Optional[bytes]:
+        if not (main_image_path and main_image_original_name):
+            logger.debug("No main image path provided. Sending request without image.")
+            return None
+        try:
+            # Чтение файла выполняется в пуле потоков, чтобы не блокировать event loop
+            content = await asyncio.to_thread(Path(main_image_path).read_bytes)
+            logger.debug("Read image for upload from '%s'", main_image_path)
+            return content
+        except FileNotFoundError:
+            logger.warning(f"Main image path '{main_image_path}' provided, but file does not exist. Sending request without image.")
+        except OSError as e:
+            logger.error(f"Could not open file {main_image_path} for upload: {e}")
+        return None
+
+    async def send_parking_batch(self, events: List[dict]) -> List[Union[bool, int]]:
+        """
+        Отправляет несколько событий одним запросом на batch_path.
+        events - kwargs send_parking (включая image_bytes). Результат по каждому событию
+        в том же порядке: True, HTTP-статус или False (как у send_parking).
+        Форматы тела:
+          multipart - поле "events" с JSON-списком полей событий; у события с фото есть
+                      "photo": "photo_N", сам файл - в части photo_N;
+          ndjson    - по строке JSON на событие, фото в "photo" (base64) и "photo_name".
+        Бэкенд может вернуть {"results": [статус, ...]} по событиям; иначе статус ответа
+        относится ко всему пакету. Бросает BatchNotSupportedError на 404/405/501
+        и CircuitOpenError, если цепь разомкнута.
+        """
+        items = []
+        for event in events:
+            event = dict(event)
+            image_bytes = event.pop('image_bytes', None)
+            if image_bytes is None:
+                image_bytes = await self._read_image(event.get('main_image_path'), event.get('main_image_original_name'))
+            fields = _event_fields(event.get('camera_name'), event.get('license_plate'),
+                                   event.get('license_plate_country'), event.get('color'),
+                                   event.get('event_id'), event.get('barrier_opened'))
+            items.append((fields, event.get('main_image_original_name') or 'image.jpg', image_bytes))
+
+        url = f"{self.smart_parking_url}{self.batch_path}"
+        if self.batch_format == 'multipart':
+            files = []
+            for n, (fields, name, image_bytes) in enumerate(items):
+                if image_bytes is not None:
+                    fields["photo"] = f"photo_{n}"
+                    files.append((f"photo_{n}", (name, bytes(image_bytes), 'image/jpeg')))
+            request = dict(data={"events": json.dumps([f for f, _, _ in items], ensure_ascii=False)},
+                           files=files or None)
+        else:
+            lines = []
+            for fields, name, image_bytes in items:
+                if image_bytes is not None:
+                    fields = dict(fields, photo=base64.b64encode(image_bytes).decode('ascii'), photo_name=name)
+                lines.append(json.dumps(fields, ensure_ascii=False))
+            request = dict(content=("\n".join(lines) + "\n").encode(),
+                           headers={"Content-Type": "application/x-ndjson"})
+
+        try:
+            logger.debug("Sending batch of %d events to %s (%s)", len(items), url, self.batch_format)
+            response = await self._post(url, **request)
+        except httpx.HTTPError as e:
+            logger.error(f"Batch request to smart parking failed: {e!r}")
+            return [False] * len(items)
+
+        if response.status_code in _BATCH_UNSUPPORTED_STATUSES:
+            raise BatchNotSupportedError(f"{url} returned HTTP {response.status_code}")
+        if response.status_code not in (200, 201):
+            logger.warning(f"Failed to send batch to smart parking. Status: {response.status_code}, Response: {response.text[:500]}")
+            return [response.status_code] * len(items)
+        return self._batch_results(response, len(items))
+
+    @staticmethod
+    def _batch_results(response: httpx.Response, count: int) -> List[Union[bool, int]]:
+        try:
+            results = response.json().get('results')
+        except (ValueError, AttributeError):
+            results = None
+        if not isinstance(results, list) or len(results) != count:
+            return [True] * count
+        statuses = []
+        for item in results:
+            status = item.get('status') if isinstance(item, dict) else item
+            statuses.append(True if status in (200, 201, True, 'ok') else status)
+        return statuses
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# Запуск как pytest tests/: корень репозитория нужен для импорта services, scripts, config
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
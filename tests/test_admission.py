@@ -0,0 +1,99 @@
+# tests/test_admission.py
+"""Прием запросов камер до чтения тела: 413 (размер), 503 (перегрузка) и 429 (token bucket камеры)."""
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from manage import admit_camera_request
+from services.admission import AdmissionController
+
+
+def make_client(admission: AdmissionController) -> TestClient:
+    """Приложение только с middleware приема: обработчик события сразу отвечает 200."""
+    app = FastAPI()
+    app.state.admission = admission
+    app.middleware("http")(admit_camera_request)
+
+    @app.post("/firmware_v5")
+    def firmware_v5():
+        return {"status": "success"}
+
+    @app.get("/admission")
+    def status():
+        return admission.status()
+
+    return TestClient(app)
+
+
+def test_token_bucket_allows_burst_then_rate_limits():
+    admission = AdmissionController(max_in_flight=0, rate=20, burst=3, max_body_size=0)
+
+    results = []
+    for _ in range(4):
+        results.append(admission.try_admit("/firmware_v5", "192.168.80.173", None))
+        if results[-1] is None:
+            admission.release()
+
+    assert results == [None, None, None, "rate_limited"]
+    # Другая камера - своя корзина
+    assert admission.try_admit("/firmware_v5", "192.168.80.171", None) is None
+    admission.release()
+    # За 0.1 с при 20 событиях/с накапливаются два токена
+    time.sleep(0.1)
+    assert admission.try_admit("/firmware_v5", "192.168.80.173", None) is None
+    admission.release()
+
+
+def test_overloaded_until_release():
+    admission = AdmissionController(max_in_flight=2, rate=0, max_body_size=0)
+
+    assert admission.try_admit("/test", "a", None) is None
+    assert admission.try_admit("/test", "b", None) is None
+    assert admission.try_admit("/test", "c", None) == "overloaded"
+    admission.release()
+    assert admission.try_admit("/test", "c", None) is None
+    assert admission.status()["rejected"] == {"overloaded": 1, "rate_limited": 0, "too_large": 0}
+
+
+def test_too_large_is_checked_by_content_length():
+    admission = AdmissionController(max_in_flight=1, rate=0, max_body_size=1000)
+
+    assert admission.try_admit("/test", "a", 1001) == "too_large"
+    assert admission.try_admit("/test", "a", None) is None
+    assert admission.in_flight == 1
+
+
+def test_middleware_returns_429_with_retry_after():
+    client = make_client(AdmissionController(max_in_flight=0, rate=0.001, burst=1, max_body_size=0, retry_after=7))
+
+    first = client.post("/firmware_v5", content=b"<xml/>")
+    second = client.post("/firmware_v5", content=b"<xml/>")
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.headers["retry-after"] == "7"
+    assert second.json() == {"status": "error", "message": "rate_limited"}
+    # Эндпоинты, кроме приема событий, не ограничиваются
+    assert client.get("/admission").json()["in_flight"] == 0
+
+
+def test_middleware_returns_503_when_overloaded():
+    admission = AdmissionController(max_in_flight=1, rate=0, max_body_size=0, retry_after=2)
+    client = make_client(admission)
+    admission.in_flight = 1  # один запрос уже обрабатывается
+
+    response = client.post("/firmware_v5", content=b"<xml/>")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "2"
+    assert admission.in_flight == 1
+
+
+def test_middleware_returns_413_without_reading_body():
+    client = make_client(AdmissionController(max_in_flight=0, rate=0, max_body_size=100))
+
+    response = client.post("/firmware_v5", content=b"x" * 101)
+
+    assert response.status_code == 413
+    assert "retry-after" not in response.headers
@@ -0,0 +1,142 @@
+# tests/test_alert_stream.py
+"""Разбор потока alertStream (MultipartMixedParser + AlertEventAssembler) при любом разбиении на куски."""
+import asyncio
+import random
+
+import httpx
+import pytest
+
+from benchmarks.bench_ingest import SAMPLES_DIR
+from services.alert_stream import AlertEventAssembler, CameraStream, MultipartMixedParser
+
+BOUNDARY = b"boundary"
+CONTENT_TYPE = "multipart/mixed; boundary=boundary"
+ANPR_XML = (SAMPLES_DIR / "anpr_v5.xml").read_bytes()
+VMD_XML = (SAMPLES_DIR / "vmd_v5.xml").read_bytes()
+HEARTBEAT_XML = (b'<?xml version="1.0" encoding="UTF-8"?>\n<EventNotificationAlert version="2.0">'
+                 b'<eventType>videoloss</eventType><eventState>inactive</eventState></EventNotificationAlert>')
+DETECTION = b"\xff\xd8detection\r\n--boundar" + bytes(range(256)) * 20 + b"\xff\xd9"
+PLATE = b"\xff\xd8plate\xff\xd9"
+
+
+def part(body: bytes, content_type: str, name: str = None, with_length: bool = True) -> bytes:
+    headers = f"Content-Type: {content_type}\r\n"
+    if name:
+        headers += f'Content-Disposition: form-data; name="{name}"; filename="{name}"\r\n'
+    if with_length:
+        headers += f"Content-Length: {len(body)}\r\n"
+    return b"--" + BOUNDARY + b"\r\n" + headers.encode() + b"\r\n" + body + b"\r\n"
+
+
+# Как шлет камера: heartbeat, ANPR с двумя изображениями (номер без Content-Length), VMD без изображений
+STREAM = b"".join([
+    part(HEARTBEAT_XML, 'application/xml; charset="UTF-8"'),
+    part(ANPR_XML, 'application/xml; charset="UTF-8"', "anpr.xml"),
+    part(PLATE, "image/jpeg", "licensePlatePicture.jpg", with_length=False),
+    part(DETECTION, "image/jpeg", "detectionPicture.jpg"),
+    part(VMD_XML, 'application/xml; charset="UTF-8"'),
+])
+
+
+def consume(chunks, parser: MultipartMixedParser):
+    assembler = AlertEventAssembler()
+    events = []
+    for chunk in chunks:
+        for stream_part in parser.feed(chunk):
+            events.extend(assembler.add(stream_part))
+    return events
+
+
+def random_chunks(data: bytes, seed: int, max_size: int = 97):
+    rng = random.Random(seed)
+    chunks, pos = [], 0
+    while pos < len(data):
+        size = rng.randint(1, max_size)
+        chunks.append(data[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def assert_stream_events(events):
+    assert [event.event_type for event in events] == ["videoloss", "ANPR", "VMD"]
+    heartbeat, anpr, vmd = events
+    assert heartbeat.xml_bytes == HEARTBEAT_XML
+    assert anpr.xml_bytes == ANPR_XML
+    # Изображение с разделителем внутри данных читается по Content-Length целиком
+    assert (anpr.image_name, anpr.image_bytes) == ("detectionPicture.jpg", DETECTION)
+    assert anpr.part_names == ["anpr.xml", "licensePlatePicture.jpg", "detectionPicture.jpg"]
+    assert vmd.xml_bytes == VMD_XML and vmd.image_bytes is None
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_random_chunk_boundaries(seed):
+    parser = MultipartMixedParser(BOUNDARY)
+
+    assert_stream_events(consume(random_chunks(STREAM, seed), parser))
+    assert parser.dropped_parts == 0
+
+
+def test_byte_by_byte():
+    assert_stream_events(consume([STREAM[i:i + 1] for i in range(len(STREAM))], MultipartMixedParser(BOUNDARY)))
+
+
+def test_long_stream_is_compacted():
+    parser = MultipartMixedParser(BOUNDARY)
+    stream = STREAM * 40
+
+    events = consume(random_chunks(stream, 1, max_size=4096), parser)
+
+    assert len(events) == 120
+    # Прочитанный префикс удаляется пачками по 64 КБ: буфер не растет вместе с потоком
+    assert len(stream) > 256 * 1024
+    assert len(parser._buf) < 128 * 1024
+
+
+def test_oversized_part_is_skipped():
+    parser = MultipartMixedParser(BOUNDARY, max_part_size=len(ANPR_XML) + 10)
+
+    events = consume(random_chunks(STREAM, 2), parser)
+
+    assert [event.event_type for event in events] == ["videoloss", "ANPR", "VMD"]
+    assert events[1].image_name == "licensePlatePicture.jpg"
+    assert parser.dropped_parts == 1
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_xml_stream_without_boundary(seed):
+    parser = MultipartMixedParser.from_content_type("application/xml")
+    stream = HEARTBEAT_XML + b"\r\n" + ANPR_XML + b"\r\n" + VMD_XML
+
+    parts = [p for chunk in random_chunks(stream, seed) for p in parser.feed(chunk)]
+
+    assert [p.body for p in parts] == [HEARTBEAT_XML, ANPR_XML.strip(), VMD_XML.strip()]
+
+
+def test_camera_stream_dispatches_events_and_skips_heartbeats():
+    received = []
+
+    async def chunks():
+        for chunk in random_chunks(STREAM, 3, max_size=512):
+            yield chunk
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": CONTENT_TYPE}, content=chunks())
+
+    async def on_event(event, host):
+        received.append((host, event.event_type, event.image_name))
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            stream = CameraStream("192.168.80.173", client, on_event, backoff_base=60)
+            task = asyncio.create_task(stream.run())
+            for _ in range(100):
+                if len(received) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return stream.health
+
+    health = asyncio.run(run())
+    assert received == [("192.168.80.173", "ANPR", "detectionPicture.jpg"), ("192.168.80.173", "VMD", None)]
+    assert (health.events, health.heartbeats) == (2, 1)
@@ -0,0 +1,105 @@
+# tests/test_batch_delivery.py
+"""Пакетная доставка outbox -> SmartParking (multipart, ndjson) и переход на одиночные запросы."""
+import asyncio
+import base64
+import json
+import re
+
+import httpx
+import pytest
+
+from services.outbox import DeliveryWorker, Outbox
+from services.send_smart_parking import SmartParkingService
+
+BATCH_PATH = "/parking/data_process_batch/"
+SINGLE_PATH = "/parking/data_process/"
+IMAGES = {"ev-1": b"\xff\xd8first\xff\xd9", "ev-2": b"\xff\xd8second\xff\xd9"}
+
+
+def payload(event_id: str) -> dict:
+    return {
+        "camera_name": "Exit", "main_image_path": None, "main_image_original_name": f"{event_id}.jpg",
+        "license_plate": f"{event_id[-1]}23ABC02", "license_plate_country": "KZ", "color": "white",
+        "event_id": event_id, "barrier_opened": None,
+    }
+
+
+def deliver(tmp_path, batch_format: str, handler):
+    """Ставит два события в outbox и ждет, пока воркер в пакетном режиме их доставит."""
+    async def run():
+        smart_parking = SmartParkingService("http://smartparking.test", batch_path=BATCH_PATH,
+                                            batch_format=batch_format)
+        await smart_parking.client.aclose()
+        smart_parking.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        outbox = Outbox(str(tmp_path / "outbox.db"))
+        worker = DeliveryWorker(outbox, smart_parking, batching=True, batch_max_events=2,
+                                batch_window=1, poll_interval=0.05)
+        worker.start()
+        try:
+            for event_id, image in IMAGES.items():
+                await worker.submit(payload(event_id), image_bytes=image, source_endpoint="/firmware_v5")
+            for _ in range(100):
+                if (await outbox.stats())["pending"] == 0:
+                    break
+                await asyncio.sleep(0.02)
+            return worker, await outbox.stats()
+        finally:
+            await worker.stop()
+            await smart_parking.close()
+            outbox.close()
+    return asyncio.run(run())
+
+
+def test_multipart_batch(tmp_path):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"results": [200, 200]})
+
+    worker, stats = deliver(tmp_path, "multipart", handler)
+
+    assert stats == {"pending": 0, "dead_letters": 0}
+    assert [request.url.path for request in requests] == [BATCH_PATH]
+    body = requests[0].content
+    events = json.loads(re.search(rb'name="events"\r\n\r\n(.*?)\r\n--', body, re.S).group(1))
+    assert [event["event_id"] for event in events] == list(IMAGES)
+    assert [event["photo"] for event in events] == ["photo_0", "photo_1"]
+    # Служебные поля outbox в SmartParking не уходят
+    assert all("source_endpoint" not in event and "received_at" not in event for event in events)
+    for image in IMAGES.values():
+        assert image in body
+
+
+def test_ndjson_batch(tmp_path):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"ok": True})
+
+    worker, stats = deliver(tmp_path, "ndjson", handler)
+
+    assert stats == {"pending": 0, "dead_letters": 0}
+    assert len(requests) == 1
+    assert requests[0].headers["content-type"] == "application/x-ndjson"
+    events = [json.loads(line) for line in requests[0].content.decode().splitlines()]
+    assert {event["event_id"]: base64.b64decode(event["photo"]) for event in events} == IMAGES
+
+
+@pytest.mark.parametrize("status", [404, 405, 501])
+def test_falls_back_to_single_requests(tmp_path, status):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.path == BATCH_PATH:
+            return httpx.Response(status)
+        return httpx.Response(200)
+
+    worker, stats = deliver(tmp_path, "multipart", handler)
+
+    assert stats == {"pending": 0, "dead_letters": 0}
+    assert worker.batching is False
+    assert [request.url.path for request in requests] == [BATCH_PATH, SINGLE_PATH, SINGLE_PATH]
+    assert sorted(request.headers["x-trace-id"] for request in requests[1:]) == sorted(IMAGES)
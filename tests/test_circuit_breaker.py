@@ -0,0 +1,156 @@
+# tests/test_circuit_breaker.py
+"""CircuitBreaker (closed -> open -> half_open -> closed) и AdaptiveLimiter (AIMD) перед SmartParking."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    AdaptiveLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from services.send_smart_parking import SmartParkingService
+
+
+def fail(breaker: CircuitBreaker, times: int):
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=60)
+
+    fail(breaker, 2)
+    breaker.before_call()
+    breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == CLOSED  # успех сбрасывает счетчик ошибок подряд
+
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.before_call()
+    assert 59 < exc_info.value.retry_after <= 60
+
+
+def test_open_half_open_closed():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.1, half_open_max_calls=1)
+    fail(breaker, 2)
+    assert breaker.state == OPEN
+
+    time.sleep(0.15)
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    # Пока пробный запрос не завершился, остальные отклоняются
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+    breaker.before_call()
+
+
+def test_failed_probe_opens_again():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.1)
+    fail(breaker, 2)
+    time.sleep(0.15)
+
+    fail(breaker, 1)
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancelled_probe_frees_the_slot():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0.05)
+    fail(breaker, 1)
+    time.sleep(0.1)
+    breaker.before_call()
+
+    breaker.record_cancelled()
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_limiter_increases_on_fast_success_and_halves_on_failure():
+    async def run():
+        limiter = AdaptiveLimiter("test", initial=4, min_limit=1, max_limit=8, latency_target=0.5)
+        for _ in range(8):
+            await limiter.acquire()
+            limiter.release(True, 0.01)
+        grown = limiter.limit
+        await limiter.acquire()
+        limiter.release(False, 0.01)
+        halved = limiter.limit
+        # Вторая ошибка в пределах latency_target лимит повторно не режет
+        await limiter.acquire()
+        limiter.release(False, 0.01)
+        return grown, halved, limiter.limit
+
+    grown, halved, after_second_failure = asyncio.run(run())
+    assert grown == 5
+    assert halved == 2
+    assert after_second_failure == 2
+
+
+def test_limiter_caps_concurrency():
+    async def run():
+        limiter = AdaptiveLimiter("test", initial=2, min_limit=1, max_limit=2)
+        in_flight, peak = 0, 0
+
+        async def call():
+            nonlocal in_flight, peak
+            await limiter.acquire()
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            limiter.release(None, 0.0)
+
+        await asyncio.gather(*(call() for _ in range(10)))
+        return peak, limiter.status()
+
+    peak, status = asyncio.run(run())
+    assert peak == 2
+    assert status == {"limit": 2, "in_flight": 0}
+
+
+def test_smart_parking_requests_are_rejected_while_open():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(503)
+
+    async def run():
+        smart_parking = SmartParkingService("http://smartparking.test")
+        await smart_parking.client.aclose()
+        smart_parking.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        smart_parking.breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=60)
+        try:
+            results = []
+            for n in range(4):
+                try:
+                    results.append(await smart_parking.send_parking(
+                        camera_name="Exit", main_image_path=None, main_image_original_name=None,
+                        license_plate="123ABC02", license_plate_country="KZ", color="white", event_id=f"ev-{n}"))
+                except CircuitOpenError as e:
+                    results.append(e)
+            return results, smart_parking.status()
+        finally:
+            await smart_parking.close()
+
+    results, status = asyncio.run(run())
+    assert len(requests) == 2
+    assert all(isinstance(result, CircuitOpenError) for result in results[2:])
+    assert status["circuit"]["state"] == OPEN
+    assert status["concurrency"]["in_flight"] == 0
@@ -0,0 +1,85 @@
+# tests/test_dedup.py
+"""Окно подавления повторных чтений номера (services/dedup.PlateDeduplicator) на обоих backend."""
+import asyncio
+import time
+
+import pytest
+
+from services.dedup import PlateDeduplicator
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_dedup(request, tmp_path):
+    created = []
+
+    def make(window: float = 60, max_entries: int = 1000) -> PlateDeduplicator:
+        dedup = PlateDeduplicator(enabled=True, backend=request.param, window=window,
+                                  max_entries=max_entries, path=str(tmp_path / "dedup.db"))
+        created.append(dedup)
+        return dedup
+
+    yield make
+    for dedup in created:
+        dedup.close()
+
+
+def reads(dedup: PlateDeduplicator, *events):
+    async def run():
+        return [await dedup.is_duplicate(camera, plate) for camera, plate in events]
+    return asyncio.run(run())
+
+
+def test_repeat_within_window_is_suppressed(make_dedup):
+    dedup = make_dedup()
+
+    assert reads(dedup, ("Exit", "123ABC02"), ("Exit", "123 abc-02"), ("Entry", "123ABC02"), ("Exit", "777XYZ01")) \
+        == [False, True, False, False]
+
+
+def test_window_expires(make_dedup):
+    dedup = make_dedup(window=0.1)
+
+    assert reads(dedup, ("Exit", "123ABC02"), ("Exit", "123ABC02")) == [False, True]
+    time.sleep(0.15)
+    assert reads(dedup, ("Exit", "123ABC02"), ("Exit", "123ABC02")) == [False, True]
+
+
+def test_forget_releases_the_plate(make_dedup):
+    dedup = make_dedup()
+
+    assert reads(dedup, ("Exit", "123ABC02")) == [False]
+    asyncio.run(dedup.forget("Exit", "123 abc 02"))
+    assert reads(dedup, ("Exit", "123ABC02"), ("Exit", "123ABC02")) == [False, True]
+
+
+def test_reads_without_plate_pass(make_dedup):
+    dedup = make_dedup()
+
+    assert reads(dedup, ("Exit", None), ("Exit", None), ("Exit", "")) == [False, False, False]
+
+
+def test_disabled():
+    dedup = PlateDeduplicator(enabled=False, backend="memory")
+
+    assert reads(dedup, ("Exit", "123ABC02"), ("Exit", "123ABC02")) == [False, False]
+
+
+def test_memory_backend_evicts_least_recently_used():
+    dedup = PlateDeduplicator(enabled=True, backend="memory", window=60, max_entries=2)
+
+    assert reads(dedup, ("Exit", "A1"), ("Exit", "B2"), ("Exit", "C3"), ("Exit", "A1"), ("Exit", "C3")) \
+        == [False, False, False, False, True]
+
+
+def test_sqlite_window_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    first = PlateDeduplicator(enabled=True, backend="sqlite", window=60, path=path)
+    second = PlateDeduplicator(enabled=True, backend="sqlite", window=60, path=path)
+    try:
+        assert reads(first, ("Exit", "123ABC02")) == [False]
+        assert reads(second, ("Exit", "123ABC02")) == [True]
+        asyncio.run(second.forget("Exit", "123ABC02"))
+        assert reads(first, ("Exit", "123ABC02")) == [False]
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,89 @@
+# tests/test_multipart_stream.py
+"""Потоковый разбор запросов камер (services/multipart_stream.parse_event_stream) при любом разбиении тела."""
+import asyncio
+import random
+
+import pytest
+
+from benchmarks.bench_ingest import SAMPLES_DIR, build_multipart
+from services.multipart_stream import MultipartStreamError, RequestTooLargeError, parse_event_stream
+
+ANPR_XML = (SAMPLES_DIR / "anpr_v5.xml").read_bytes()
+VMD_XML = (SAMPLES_DIR / "vmd_v5.xml").read_bytes()
+DETECTION = b"\xff\xd8detection" + bytes(range(256)) * 40 + b"\xff\xd9"
+PLATE = b"\xff\xd8plate\xff\xd9"
+
+
+def split(body: bytes, sizes) -> list:
+    chunks, pos = [], 0
+    for size in sizes:
+        chunks.append(body[pos:pos + size])
+        pos += size
+    chunks.append(body[pos:])
+    return chunks
+
+
+def parse(content_type: str, chunks, **kwargs):
+    async def body():
+        for chunk in chunks:
+            yield chunk
+    return asyncio.run(parse_event_stream(content_type, body(), **kwargs))
+
+
+def anpr_request(*images):
+    return build_multipart([("anpr.xml", "text/xml", ANPR_XML), *images])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_chunk_boundaries(seed):
+    body, content_type = anpr_request(("licensePlatePicture.jpg", "image/jpeg", PLATE),
+                                      ("detectionPicture.jpg", "image/jpeg", DETECTION))
+    rng = random.Random(seed)
+    chunks = split(body, [rng.randint(1, 64) for _ in range(len(body) // 16)])
+
+    event = parse(content_type, chunks)
+
+    assert event.xml_bytes == ANPR_XML
+    assert event.event_type == "ANPR"
+    # Полное фото важнее обрезанного номера, даже если пришло позже
+    assert (event.image_name, event.image_bytes) == ("detectionPicture.jpg", DETECTION)
+    assert event.part_names == ["anpr.xml", "licensePlatePicture.jpg", "detectionPicture.jpg"]
+
+
+def test_byte_by_byte():
+    body, content_type = anpr_request(("detectionPicture.jpg", "image/jpeg", DETECTION),
+                                      ("licensePlatePicture.jpg", "image/jpeg", PLATE))
+
+    event = parse(content_type, [body[i:i + 1] for i in range(len(body))])
+
+    assert event.xml_bytes == ANPR_XML
+    assert (event.image_name, event.image_bytes) == ("detectionPicture.jpg", DETECTION)
+
+
+def test_images_skipped_when_event_type_is_not_needed():
+    body, content_type = build_multipart([("MoveDetection.xml", "text/xml", VMD_XML),
+                                          ("detectionPicture.jpg", "image/jpeg", DETECTION)])
+
+    event = parse(content_type, split(body, [100, 7, 300]), keep_images=lambda event_type: event_type == "ANPR")
+
+    assert event.event_type == "VMD"
+    assert event.image_bytes is None
+
+
+def test_plain_xml_body():
+    event = parse("application/xml", split(ANPR_XML, [10, 200]))
+
+    assert event.xml_bytes == ANPR_XML
+    assert event.event_type == "ANPR"
+
+
+def test_body_over_limit():
+    body, content_type = anpr_request(("detectionPicture.jpg", "image/jpeg", DETECTION))
+
+    with pytest.raises(RequestTooLargeError):
+        parse(content_type, split(body, [1000] * (len(body) // 1000)), max_body_size=len(body) - 1)
+
+
+def test_multipart_without_boundary():
+    with pytest.raises(MultipartStreamError):
+        parse("multipart/form-data", [b"--x\r\n"])
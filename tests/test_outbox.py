@@ -0,0 +1,114 @@
+# tests/test_outbox.py
+"""Outbox: аренда записей (lease), уникальность event_id и перенос в dead letters после max_attempts."""
+import asyncio
+import sqlite3
+
+import httpx
+
+from services.outbox import DeliveryWorker, Outbox
+from services.send_smart_parking import SmartParkingService
+
+
+def payload(event_id: str) -> dict:
+    return {
+        "camera_name": "Exit", "main_image_path": None, "main_image_original_name": None,
+        "license_plate": "123ABC02", "license_plate_country": "KZ", "color": "white",
+        "event_id": event_id,
+    }
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    async def run():
+        outbox = Outbox(str(tmp_path / "outbox.db"))
+        try:
+            row_id = await outbox.enqueue(payload("ev-1"))
+            claimed = await outbox.claim(10, lease=0.2)
+            # Пока аренда не истекла, запись никому не отдается
+            leased = await outbox.claim(10, lease=0.2)
+            await asyncio.sleep(0.3)
+            # Воркер упал, не подтвердив доставку: запись снова доступна
+            reclaimed = await outbox.claim(10, lease=0.2)
+            return row_id, claimed, leased, reclaimed
+        finally:
+            outbox.close()
+
+    row_id, claimed, leased, reclaimed = asyncio.run(run())
+    assert [row[0] for row in claimed] == [row_id]
+    assert leased == []
+    assert reclaimed == [(row_id, payload("ev-1"), 0)]
+
+
+def test_expired_lease_is_claimed_by_another_process(tmp_path):
+    async def run():
+        first = Outbox(str(tmp_path / "outbox.db"), owner_grace=0)
+        second = Outbox(str(tmp_path / "outbox.db"), owner_grace=0)
+        try:
+            row_id = await first.enqueue(payload("ev-1"))
+            await first.claim(10, lease=0.2)
+            leased = await second.claim(10, lease=30)
+            await asyncio.sleep(0.3)
+            return row_id, leased, await second.claim(10, lease=30)
+        finally:
+            first.close()
+            second.close()
+
+    row_id, leased, reclaimed = asyncio.run(run())
+    assert leased == []
+    assert [row[0] for row in reclaimed] == [row_id]
+
+
+def test_duplicate_event_id_is_not_enqueued(tmp_path):
+    async def run():
+        outbox = Outbox(str(tmp_path / "outbox.db"))
+        try:
+            first = await outbox.enqueue(payload("ev-1"))
+            duplicate = await outbox.enqueue(payload("ev-1"))
+            pending = (await outbox.stats())["pending"]
+            # После доставки тот же event_id снова принимается (событие повторилось позже)
+            await outbox.ack([first])
+            again = await outbox.enqueue(payload("ev-1"))
+            return first, duplicate, pending, again
+        finally:
+            outbox.close()
+
+    first, duplicate, pending, again = asyncio.run(run())
+    assert first is not None
+    assert duplicate is None
+    assert pending == 1
+    assert again is not None and again != first
+
+
+def test_dead_letter_after_max_attempts(tmp_path):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(503)
+
+    async def run():
+        smart_parking = SmartParkingService("http://smartparking.test")
+        await smart_parking.client.aclose()
+        smart_parking.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        outbox = Outbox(str(tmp_path / "outbox.db"))
+        worker = DeliveryWorker(outbox, smart_parking, max_attempts=3, backoff_base=0.01,
+                                backoff_max=0.01, poll_interval=0.02, batching=False)
+        worker.start()
+        try:
+            await worker.submit(payload("ev-1"))
+            for _ in range(200):
+                if (await outbox.stats())["dead_letters"]:
+                    break
+                await asyncio.sleep(0.02)
+            return await outbox.stats()
+        finally:
+            await worker.stop()
+            await smart_parking.close()
+            outbox.close()
+
+    stats = asyncio.run(run())
+    assert stats == {"pending": 0, "dead_letters": 1}
+    assert len(requests) == 3
+    with sqlite3.connect(str(tmp_path / "outbox.db")) as conn:
+        attempts, last_error = conn.execute("SELECT attempts, last_error FROM dead_letters").fetchone()
+    assert attempts == 3
+    assert "503" in last_error
@@ -0,0 +1,80 @@
+# tests/test_provisioning.py
+"""services/provisioning.CameraProvisioner против фейковых камер scripts/fake_isapi.py."""
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from scripts.fake_isapi import FakeCamera, make_handler, requests_counter
+from services.camera_registry import Camera
+from services.provisioning import (
+    CameraProvisioner,
+    ProvisioningOptions,
+    UNCHANGED,
+    UPDATED,
+    VERIFY_FAILED,
+    summarize,
+)
+
+
+@pytest.fixture
+def fake_cameras():
+    """Запускает фейковые камеры; возвращает фабрику (число, ignore_fields) -> [Camera]."""
+    servers = []
+
+    def start(count: int, ignore_fields=()):
+        cameras = []
+        for n in range(count):
+            server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(
+                FakeCamera(f"Fake-{n + 1}", ignore_fields), latency=0, digest=True))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+            cameras.append(Camera(f"Fake-{n + 1}", ip=f"127.0.0.1:{server.server_port}",
+                                  firmware="v5" if n % 2 else "v4"))
+        return cameras
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def provision(cameras, **options):
+    async def run():
+        provisioner = CameraProvisioner(ProvisioningOptions("10.0.0.5", 8786, host_id="1", **options))
+        try:
+            return await provisioner.run(cameras)
+        finally:
+            await provisioner.close()
+    return asyncio.run(run())
+
+
+def test_second_run_is_a_no_op(fake_cameras):
+    cameras = fake_cameras(3)
+
+    first = provision(cameras, motion="on")
+    assert summarize(first)[UPDATED] == 6
+    puts = requests_counter["PUT"]
+
+    second = provision(cameras, motion="on")
+    assert {result.status for result in second} == {UNCHANGED}
+    assert requests_counter["PUT"] == puts
+
+
+def test_event_path_follows_firmware(fake_cameras):
+    cameras = fake_cameras(2)
+
+    results = provision(cameras, resources=("httpHosts",))
+
+    urls = {result.camera: result.changes["url"][1] for result in results}
+    assert urls == {"Fake-1": "/test", "Fake-2": "/firmware_v5"}
+
+
+def test_field_ignored_by_camera_fails_verification(fake_cameras):
+    cameras = fake_cameras(1, ignore_fields=("ipAddress",))
+
+    results = provision(cameras, resources=("httpHosts",))
+
+    assert [result.status for result in results] == [VERIFY_FAILED]
+    assert "ipAddress" in results[0].error
@@ -0,0 +1,29 @@
+# tests/test_startup.py
+"""Импорт manage (как при старте воркера uvicorn) не создает файлов и не запускает потоков."""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Выполняется в чистом процессе: модули импортируются "холодными"
+_CHILD = """
+import json, os, threading
+import manage
+print(json.dumps({'threads': threading.active_count(), 'files': sorted(os.listdir('.'))}))
+"""
+
+
+def test_import_manage_has_no_side_effects(tmp_path):
+    env = dict(
+        os.environ, PYTHONPATH=str(REPO_ROOT), LOG_LEVEL="WARNING",
+        DOTENV_PATH=str(tmp_path / ".env"), CAMERA_REGISTRY_PATH=str(tmp_path / "cameras.json"),
+        CAMERA_EXIT2_IP="", ALERT_STREAM_CAMERAS="", BARRIER_CAMERAS="", ACCESS_RULES_ENABLED="false",
+    )
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    output = subprocess.run([sys.executable, "-c", _CHILD], cwd=tmp_path, env=env,
+                            check=True, capture_output=True, text=True)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    assert result == {"threads": 1, "files": []}